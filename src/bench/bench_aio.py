@@ -0,0 +1,70 @@
+"""
+throughput of afilter over an async source, inline and offloaded, against
+filter_stream over the same records.
+
+    python src/bench/bench_aio.py
+"""
+
+import asyncio
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from pyquerymatch import filter_stream
+from pyquerymatch.aio import afilter
+
+RECORDS = [{"num": x % 100, "tag": f"t{x % 7}"} for x in range(200_000)]
+LINES = [json.dumps(x).encode() + b"\n" for x in RECORDS]
+QUERY = {"num": {"$gte": 50}, "tag": {"$in": ["t1", "t2"]}}
+
+
+async def _source(items: list):
+    for idx, item in enumerate(items):
+        # a source that occasionally waits, like a socket.
+        if idx % 1_000 == 0:
+            await asyncio.sleep(0)
+        yield item
+
+
+async def _count(items: list, **kwargs) -> int:
+    return len([x async for x in afilter(_source(items), QUERY, **kwargs)])
+
+
+def _timed(func) -> tuple[float, int]:
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+
+def main():
+    for name, items in [("dicts", RECORDS), ("lines", LINES)]:
+        print(f"{name} ({len(items)} records)")
+        (seconds, count) = _timed(
+            lambda items=items: len(list(filter_stream(items, QUERY)))
+        )
+        print(f"  {'filter_stream':<24} {seconds * 1e3:>8.1f}ms {count}")
+
+        (seconds, count) = _timed(lambda items=items: asyncio.run(_count(items)))
+        print(f"  {'afilter':<24} {seconds * 1e3:>8.1f}ms {count}")
+
+        for label, cls in [
+            ("threads", ThreadPoolExecutor),
+            ("processes", ProcessPoolExecutor),
+        ]:
+            with cls(4) as executor:
+                (seconds, count) = _timed(
+                    lambda items=items, executor=executor: asyncio.run(
+                        _count(
+                            items,
+                            batch_size=8_192,
+                            executor=executor,
+                            offload_size=1,
+                            concurrency=4,
+                        )
+                    )
+                )
+            print(f"  {'afilter ' + label:<24} {seconds * 1e3:>8.1f}ms {count}")
+
+
+if __name__ == "__main__":
+    main()
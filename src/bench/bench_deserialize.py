@@ -0,0 +1,38 @@
+"""
+per-query cost of deserialize for a few query shapes.
+
+    python src/bench/bench_deserialize.py
+"""
+
+import timeit
+
+from pyquerymatch import deserialize
+
+QUERIES = {
+    "simple": {"status": "A"},
+    "range": {"num": {"$gt": 20, "$lt": 50}},
+    "in": {"num": {"$in": list(range(100))}},
+    "logical": {
+        "$or": [
+            {"$and": [{"status": "A"}, {"qty": {"$lt": 30}}]},
+            {"size.uom": {"$in": ["cm", "in"]}},
+            {"$nor": [{"item": "paper"}, {"qty": {"$exists": False}}]},
+        ]
+    },
+    "nested": {"num": {"$not": {"$not": {"$not": {"$and": [{"$gt": 1}, {"$lt": 9}]}}}}},
+}
+
+
+def main():
+    for name, query in QUERIES.items():
+        number = 10_000
+        elapsed = min(
+            timeit.repeat(
+                lambda query=query: list(deserialize(query)), number=number, repeat=5
+            )
+        )
+        print(f"{name:<10} {elapsed / number * 1e6:>8.2f}us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+$in / $nin membership cost as the value list grows.
+
+    python src/bench/bench_in.py
+"""
+
+import timeit
+
+from pyquerymatch import compile, deserialize, match
+
+SIZES = [10, 100, 1_000, 10_000, 100_000]
+RECORDS = [{"num": x * 7919} for x in range(1_000)]
+
+
+def bench(size: int, operator: str) -> tuple[float, float, float]:
+    values = list(range(size))
+    matchers = list(deserialize({"num": {operator: values}}))
+    compiled = compile(matchers)
+
+    def baseline():
+        # what membership cost before: a scan over the list.
+        for x in RECORDS:
+            x["num"] in values
+
+    def interpreted():
+        for x in RECORDS:
+            match(x, matchers)
+
+    def fused():
+        for x in RECORDS:
+            compiled(x)
+
+    number = 5
+    return (
+        min(timeit.repeat(baseline, number=number, repeat=3)) / number,
+        min(timeit.repeat(interpreted, number=number, repeat=3)) / number,
+        min(timeit.repeat(fused, number=number, repeat=3)) / number,
+    )
+
+
+def main():
+    per_record = 1e9 / len(RECORDS)
+    print(f"{'op':<5} {'size':>8} {'list scan':>12} {'match':>12} {'compile':>12}")
+    for operator in ["$in", "$nin"]:
+        for size in SIZES:
+            (scan, interpreted, fused) = bench(size, operator)
+            print(
+                f"{operator:<5} {size:>8}"
+                f" {scan * per_record:>10.0f}ns"
+                f" {interpreted * per_record:>10.0f}ns"
+                f" {fused * per_record:>10.0f}ns"
+            )
+
+
+if __name__ == "__main__":
+    main()
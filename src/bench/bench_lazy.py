@@ -0,0 +1,74 @@
+"""
+matching NDJSON lines by decoding only the fields a query reads (RawMatcher)
+against json.loads and a compiled predicate, as records get wider.
+
+    python src/bench/bench_lazy.py
+"""
+
+import json
+import random
+import timeit
+
+from pyquerymatch import compile, deserialize
+from pyquerymatch.lazy import RawMatcher
+
+WIDTHS = [10, 100, 300]
+LINES = 1_000
+QUERIES = {
+    "first": {"status": "A", "qty": {"$lt": 50}},
+    "last": {"tail": {"$gte": 5}},
+    "nested": {"size.h": {"$gt": 10}, "size.uom": "cm"},
+}
+
+
+def lines(width: int, rng: random.Random) -> list[bytes]:
+    result = []
+    for _ in range(LINES):
+        record = {"status": rng.choice("ABCD"), "qty": rng.randrange(100)}
+        for idx in range(width):
+            record[f"field_{idx}"] = rng.choice(
+                [rng.random(), f"value {idx}", idx, None, {"x": idx, "y": [1, 2]}]
+            )
+        record["size"] = {"h": rng.randrange(30), "uom": rng.choice(["cm", "in"])}
+        record["tail"] = rng.randrange(10)
+        result.append(json.dumps(record, ensure_ascii=False).encode() + b"\n")
+    return result
+
+
+def main():
+    print(
+        f"{'query':<8} {'width':>6} {'json.loads':>12} {'RawMatcher':>12} {'speedup':>8}"
+    )
+    for width in WIDTHS:
+        data = lines(width, random.Random(42))
+        for name, query in QUERIES.items():
+            compiled = compile(deserialize(query))
+            raw = RawMatcher(deserialize(query))
+            assert [compiled(json.loads(x)) for x in data] == [raw(x) for x in data]
+
+            loads = json.loads
+            full = min(
+                timeit.repeat(
+                    lambda compiled=compiled, data=data, loads=loads: [
+                        compiled(loads(x)) for x in data
+                    ],
+                    number=3,
+                    repeat=3,
+                )
+            )
+            lazy = min(
+                timeit.repeat(
+                    lambda raw=raw, data=data: [raw(x) for x in data],
+                    number=3,
+                    repeat=3,
+                )
+            )
+            per_line = 1e6 / LINES / 3
+            print(
+                f"{name:<8} {width:>6} {full * per_line:>10.2f}us"
+                f" {lazy * per_line:>10.2f}us {full / lazy:>7.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
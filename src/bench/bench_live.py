@@ -0,0 +1,97 @@
+"""
+keeping a saved search up to date under changes: LiveQuery against running
+the query over the whole collection again after every change.
+
+    python src/bench/bench_live.py
+"""
+
+import random
+import time
+
+from pyquerymatch import compile, deserialize
+from pyquerymatch.live import LiveQuery
+
+SIZES = [1_000, 10_000, 100_000]
+CHANGES = 1_000
+QUERY = {"status": "A", "qty": {"$gte": 50}}
+
+
+def record(key: int, rng: random.Random) -> dict:
+    return {
+        "_id": key,
+        "status": rng.choice("ABCD"),
+        "qty": rng.randrange(100),
+        "seen": 0,
+    }
+
+
+def changes(
+    items: dict[int, dict], rng: random.Random
+) -> list[tuple[dict | None, dict | None]]:
+    """
+    updates (most of them to a field the query does not read), inserts and
+    deletes against `items`.
+    """
+    items = dict(items)
+    result = []
+    for _ in range(CHANGES):
+        roll = rng.random()
+        key = rng.choice(list(items)) if roll < 0.9 else None
+        if roll < 0.6:
+            new = {**items[key], "seen": items[key]["seen"] + 1}
+        elif roll < 0.9:
+            new = {**items[key], "qty": rng.randrange(100)}
+        elif roll < 0.95:
+            new = record(max(items) + 1, rng)
+        else:
+            key = rng.choice(list(items))
+            result.append((items.pop(key), None))
+            continue
+        result.append((items.get(key), new))
+        items[new["_id"]] = new
+    return result
+
+
+def main():
+    matchers = list(deserialize(QUERY))
+    predicate = compile(matchers)
+    print(f"{'records':>8} {'rescan':>12} {'LiveQuery':>12} {'skipped':>8}")
+    for size in SIZES:
+        rng = random.Random(42)
+        items = {x: record(x, rng) for x in range(size)}
+        events = changes(items, random.Random(7))
+
+        # rescanning is measured on a sample, it is linear in the size.
+        sample = events[:20]
+        collection = dict(items)
+        start = time.perf_counter()
+        for old, new in sample:
+            if old is not None:
+                del collection[old["_id"]]
+            if new is not None:
+                collection[new["_id"]] = new
+            matching = {x["_id"] for x in collection.values() if predicate(x)}
+        rescan = (time.perf_counter() - start) / len(sample)
+
+        live = LiveQuery(matchers, items.values())
+        start = time.perf_counter()
+        for old, new in events:
+            live.apply(old, new)
+        incremental = (time.perf_counter() - start) / len(events)
+
+        for old, new in events[len(sample) :]:
+            if old is not None:
+                del collection[old["_id"]]
+            if new is not None:
+                collection[new["_id"]] = new
+        matching = {x["_id"] for x in collection.values() if predicate(x)}
+        assert matching == set(live.matching)
+
+        print(
+            f"{size:>8} {rescan * 1e6:>10.1f}us {incremental * 1e6:>10.2f}us"
+            f" {live.skipped:>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
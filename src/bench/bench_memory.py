@@ -0,0 +1,103 @@
+"""
+memory held by registered queries, and allocated per match.
+
+    python src/bench/bench_memory.py
+"""
+
+import gc
+import random
+import tracemalloc
+from typing import Callable
+
+from pyquerymatch import deserialize, match
+from pyquerymatch.queryindex import QueryIndex
+
+QUERIES = [10_000]
+MATCHES = 10_000
+
+SHAPES: dict[str, Callable[[random.Random], dict]] = {
+    "eq": lambda rng: {"tenant": rng.randrange(5_000)},
+    "range": lambda rng: {
+        "tenant": rng.randrange(5_000),
+        "level": {"$gte": rng.randrange(5), "$lt": rng.randrange(5, 10)},
+    },
+    "logical": lambda rng: {
+        "$or": [
+            {"region": rng.choice(["eu", "us", "ap"])},
+            {"tags.kind": {"$in": [rng.randrange(100) for _ in range(4)]}},
+            {"$nor": [{"level": {"$lt": rng.randrange(5)}}]},
+        ]
+    },
+}
+
+RECORD = {"tenant": 7, "level": 3, "region": "eu", "tags": {"kind": 5}}
+
+
+def _traced(func: Callable[[], object]) -> tuple[object, int, int]:
+    """
+    the result of `func`, the bytes it left allocated and its peak.
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = func()
+        (current, peak) = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, current, peak
+
+
+def resident(shape: str, count: int) -> tuple[float, float]:
+    """
+    bytes per query for deserialized operators, and for a QueryIndex.
+    """
+    rng = random.Random(42)
+    queries = [SHAPES[shape](rng) for _ in range(count)]
+    (_, operators, _) = _traced(lambda: [list(deserialize(x)) for x in queries])
+
+    def index():
+        result = QueryIndex()
+        for key, query in enumerate(queries):
+            result.add(key, deserialize(query))
+        return result
+
+    (_, indexed, _) = _traced(index)
+    return operators / count, indexed / count
+
+
+def _noop(item: dict, matchers: list):
+    pass
+
+
+def per_match(shape: str) -> int:
+    """
+    the peak bytes allocated while matching a record `MATCHES` times, beyond
+    what the loop itself allocates.
+    """
+    matchers = list(deserialize(SHAPES[shape](random.Random(42))))
+    match(RECORD, matchers)
+
+    def run(func: Callable[[dict, list], object]):
+        for _ in range(MATCHES):
+            func(RECORD, matchers)
+
+    (_, _, baseline) = _traced(lambda: run(_noop))
+    (_, _, peak) = _traced(lambda: run(match))
+    return peak - baseline
+
+
+def main():
+    print(f"{'shape':<8} {'queries':>8} {'operators':>12} {'QueryIndex':>12}")
+    for shape in SHAPES:
+        for count in QUERIES:
+            (operators, indexed) = resident(shape, count)
+            print(f"{shape:<8} {count:>8} {operators:>10.0f}B {indexed:>10.0f}B")
+
+    print()
+    print(f"{'shape':<8} {'peak allocated over ' + str(MATCHES) + ' matches':>36}")
+    for shape in SHAPES:
+        print(f"{shape:<8} {per_match(shape):>35}B")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+wide $or lists of equality and range clauses on one field, as written and
+after `optimize` merges them into one $in and one `Ranges`: in memory
+(match, compile) and on sqlite with an index on the field.
+
+    python src/bench/bench_or_merge.py
+"""
+
+import random
+import sqlite3
+import timeit
+
+from pyquerymatch import compile, deserialize, match
+from pyquerymatch.optimize import optimize
+from pyquerymatch.query import build
+
+WIDTHS = [10, 100, 500]
+RECORDS = 2_000
+ROWS = 100_000
+
+
+def query(width: int, rng: random.Random) -> dict:
+    clauses = []
+    for _ in range(width):
+        lo = rng.randrange(ROWS)
+        if rng.random() < 0.5:
+            clauses.append({"num": lo})
+        else:
+            clauses.append({"num": {"$gte": lo, "$lt": lo + rng.randrange(1, 50)}})
+    return {"$or": clauses}
+
+
+def setup() -> sqlite3.Connection:
+    connection = sqlite3.connect(":memory:")
+    connection.execute("create table t (num integer)")
+    connection.executemany("insert into t values (?)", [(x,) for x in range(ROWS)])
+    connection.execute("create index t_num on t (num)")
+    return connection
+
+
+def _best(func, number: int = 3) -> float:
+    return min(timeit.repeat(func, number=number, repeat=3)) / number
+
+
+def main():
+    rng = random.Random(42)
+    records = [{"num": rng.randrange(ROWS)} for _ in range(RECORDS)]
+    connection = setup()
+    print(
+        f"{'width':>6} {'optimize':>10} {'match':>18} {'compile':>18}"
+        f" {'sqlite':>18} {'sql chars':>16}"
+    )
+    for width in WIDTHS:
+        matchers = list(deserialize(query(width, rng)))
+        optimized = optimize(matchers)
+        cost = _best(lambda matchers=matchers: optimize(matchers))
+
+        cells = []
+        for fn in [
+            lambda m, records=records: [match(x, m) for x in records],
+            lambda m, records=records: list(map(compile(m), records)),
+        ]:
+            assert fn(matchers) == fn(optimized)
+            before = _best(lambda fn=fn, matchers=matchers: fn(matchers)) / RECORDS
+            after = _best(lambda fn=fn, optimized=optimized: fn(optimized)) / RECORDS
+            cells.append(f"{before * 1e6:>7.2f} {after * 1e6:>6.2f}us")
+
+        sql = []
+        for m in [matchers, optimized]:
+            (where, params) = build(m)
+            statement = f"select count(*) from t where {where}"
+            sql.append((statement, params))
+        assert len({connection.execute(*x).fetchone() for x in sql}) == 1
+        (before, after) = (
+            _best(lambda x=x: connection.execute(*x).fetchone()) for x in sql
+        )
+        cells.append(f"{before * 1e3:>7.2f} {after * 1e3:>6.2f}ms")
+        cells.append(f"{len(sql[0][0]):>8} {len(sql[1][0]):>7}")
+
+        print(f"{width:>6} {cost * 1e3:>8.2f}ms " + " ".join(cells))
+
+
+if __name__ == "__main__":
+    main()
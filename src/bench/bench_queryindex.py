@@ -0,0 +1,59 @@
+"""
+matching one record against many subscriptions, QueryIndex vs calling match
+for every query.
+
+    python src/bench/bench_queryindex.py
+"""
+
+import random
+import timeit
+
+from pyquerymatch import compile, deserialize
+from pyquerymatch.queryindex import QueryIndex
+
+SUBSCRIPTIONS = 50_000
+
+
+def subscription(rng: random.Random) -> dict:
+    kind = rng.random()
+    if kind < 0.6:
+        return {"tenant": rng.randrange(5_000), "level": {"$gte": rng.randrange(5)}}
+    if kind < 0.9:
+        lo = rng.randrange(100_000)
+        return {"ts": {"$gte": lo, "$lt": lo + rng.randrange(1, 1_000)}}
+    return {"tags.kind": {"$in": [rng.randrange(1_000) for _ in range(5)]}}
+
+
+def main():
+    rng = random.Random(42)
+    queries = [list(deserialize(subscription(rng))) for _ in range(SUBSCRIPTIONS)]
+    events = [
+        {
+            "tenant": rng.randrange(5_000),
+            "level": rng.randrange(5),
+            "ts": rng.randrange(100_000),
+            "tags": {"kind": rng.randrange(1_000)},
+        }
+        for _ in range(100)
+    ]
+
+    index = QueryIndex()
+    for key, matchers in enumerate(queries):
+        index.add(key, matchers)
+    compiled = [compile(x) for x in queries]
+
+    def scan():
+        for event in events:
+            [key for key, test in enumerate(compiled) if test(event)]
+
+    def indexed():
+        for event in events:
+            index.match(event)
+
+    for name, fn, number in [("compiled scan", scan, 1), ("QueryIndex", indexed, 10)]:
+        elapsed = min(timeit.repeat(fn, number=number, repeat=3)) / number
+        print(f"{name:<14} {elapsed / len(events) * 1e6:>10.1f}us/event")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+queries over a columnar snapshot (write_snapshot / Snapshot) against
+`match` and a compiled predicate over the same records as dicts.
+
+    python src/bench/bench_snapshot.py
+"""
+
+import os
+import random
+import tempfile
+import time
+
+from pyquerymatch import compile, deserialize, match
+from pyquerymatch.match import fields
+from pyquerymatch.snapshot import Snapshot, write_snapshot
+
+RECORDS = 200_000
+QUERIES = {
+    "eq": {"status": "A"},
+    "range": {"qty": {"$gte": 20, "$lt": 40}, "size.h": {"$gt": 10}},
+    "in": {"tag": {"$in": [f"t{x}" for x in range(0, 500, 7)]}},
+    "logical": {
+        "$and": [
+            {"$or": [{"status": {"$in": ["A", "B"]}}, {"note": None}]},
+            {"qty": {"$lt": 10}},
+        ]
+    },
+}
+
+
+def records(rng: random.Random) -> list[dict]:
+    result = []
+    for _ in range(RECORDS):
+        item = {
+            "status": rng.choice("ABCD"),
+            "qty": rng.randrange(100),
+            "tag": f"t{rng.randrange(500)}",
+            "size": {"h": rng.random() * 30, "uom": rng.choice(["cm", "in"])},
+        }
+        if rng.random() < 0.3:
+            item["note"] = rng.choice([None, "x"])
+        result.append(item)
+    return result
+
+
+def _timed(func) -> tuple[float, int]:
+    best = None
+    for _ in range(3):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def _cold(path: str, query: dict) -> int:
+    with Snapshot(path) as snapshot:
+        return int(snapshot.match(query).sum())
+
+
+def main():
+    data = records(random.Random(42))
+    paths = fields(x for query in QUERIES.values() for x in deserialize(query))
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "snapshot")
+        start = time.perf_counter()
+        write_snapshot(path, data, paths)
+        print(
+            f"write {len(data)} records, {paths}: {time.perf_counter() - start:.2f}s,"
+            f" {os.path.getsize(path) / len(data):.1f} bytes per record"
+        )
+
+        print(
+            f"{'query':<8} {'match':>10} {'compile':>10} {'snapshot':>10}"
+            f" {'open+query':>11} {'vs compile':>11}"
+        )
+        for name, query in QUERIES.items():
+            matchers = list(deserialize(query))
+            predicate = compile(matchers)
+            (dicts, expected) = _timed(
+                lambda matchers=matchers: sum(match(x, matchers) for x in data)
+            )
+            (compiled, count) = _timed(
+                lambda predicate=predicate: sum(map(predicate, data))
+            )
+            assert count == expected
+
+            with Snapshot(path) as snapshot:
+                (cold, count) = _timed(lambda query=query: _cold(path, query))
+                assert count == expected
+                (warm, count) = _timed(
+                    lambda snapshot=snapshot, matchers=matchers: int(
+                        snapshot.match(matchers).sum()
+                    )
+                )
+                assert count == expected
+            print(
+                f"{name:<8} {dicts * 1e3:>8.1f}ms {compiled * 1e3:>8.1f}ms"
+                f" {warm * 1e3:>8.1f}ms {cold * 1e3:>9.1f}ms {compiled / warm:>10.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+sqlite cost of large $in lists per list binding mode of `build`.
+
+    python src/bench/bench_sql_in.py
+"""
+
+import sqlite3
+import timeit
+
+from pyquerymatch import deserialize
+from pyquerymatch.query import LIST_MODES, BuilderContext, build, load_temp_tables
+
+SIZES = [10, 100, 1_000, 10_000, 50_000]
+ROWS = 100_000
+
+
+def setup() -> sqlite3.Connection:
+    connection = sqlite3.connect(":memory:")
+    connection.execute("create table t (num integer)")
+    connection.executemany("insert into t values (?)", [(x * 7,) for x in range(ROWS)])
+    connection.execute("create index t_num on t (num)")
+    return connection
+
+
+def bench(connection: sqlite3.Connection, size: int, mode: str) -> float:
+    matchers = list(deserialize({"num": {"$in": list(range(0, size * 3, 3))}}))
+
+    def run() -> int:
+        ctx = BuilderContext(list_mode=mode, list_threshold=0)
+        (where, params) = build(matchers, builder_ctx=ctx)
+        load_temp_tables(connection, ctx)
+        return len(
+            connection.execute(f"select num from t where {where}", params).fetchall()
+        )
+
+    number = 3
+    return min(timeit.repeat(run, number=number, repeat=3)) / number
+
+
+def main():
+    connection = setup()
+    print(f"{'size':>8} " + " ".join(f"{x:>12}" for x in LIST_MODES))
+    for size in SIZES:
+        cells = []
+        for mode in LIST_MODES:
+            try:
+                seconds = bench(connection, size, mode)
+                cells.append(f"{seconds * 1e3:>10.2f}ms")
+            except sqlite3.OperationalError:
+                # e.g. too many sql variables.
+                cells.append(f"{'error':>12}")
+        print(f"{size:>8} " + " ".join(cells))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,327 @@
+"""
+benchmark suite for deserialize, match / compile and build over synthetic
+workloads, with results as JSON so runs can be compared across commits.
+
+    python src/bench/suite.py -o before.json
+    python src/bench/suite.py -o after.json --compare before.json
+
+each benchmark is calibrated to run for about `--min-time` seconds per
+repetition, and the per-operation times of `--repeat` repetitions are kept.
+comparisons use the median; with `--threshold`, the exit status is 1 when a
+benchmark slowed down by more than that factor.
+"""
+
+import argparse
+import json
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Callable
+
+from pyquerymatch import compile, deserialize, match
+from pyquerymatch.query import build
+
+SEED = 42
+RECORDS = 1_000
+
+# name -> setup, which returns the callable to time and the number of
+# operations one call performs.
+BENCHMARKS: dict[str, Callable[[], tuple[Callable[[], object], int]]] = {}
+
+
+def benchmark(name: str):
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+
+    return register
+
+
+def _nested(depth: int) -> dict:
+    query: dict = {"$gt": 1}
+    for idx in range(depth):
+        query = {"$not": query} if idx % 2 == 0 else {"$and": [query, {"$lt": 9}]}
+    return {"num": query}
+
+
+def _not(depth: int) -> dict:
+    query: dict = {"$gt": 1}
+    for _ in range(depth):
+        query = {"$not": query}
+    return {"num": query}
+
+
+def _or(width: int) -> dict:
+    return {"$or": [{f"field{x}": x} for x in range(width)]}
+
+
+def _flat_records(rng: random.Random) -> list[dict]:
+    return [
+        {
+            "status": rng.choice("ABCD"),
+            "qty": rng.randrange(100),
+            "price": rng.random() * 100,
+            "item": f"item{rng.randrange(50)}",
+        }
+        for _ in range(RECORDS)
+    ]
+
+
+def _nested_records(rng: random.Random) -> list[dict]:
+    return [
+        {
+            "size": {"h": rng.randrange(30), "uom": rng.choice(["cm", "in"])},
+            "meta": {"a": {"b": {"c": {"d": rng.randrange(10)}}}},
+            "tags": {"kind": rng.randrange(1_000)},
+        }
+        for _ in range(RECORDS)
+    ]
+
+
+SMALL_QUERY = {"status": "A"}
+LOGICAL_QUERY = {
+    "$or": [
+        {"$and": [{"status": "A"}, {"qty": {"$lt": 30}}]},
+        {"item": {"$in": ["item1", "item2", "item3"]}},
+        {"$nor": [{"price": {"$gt": 50}}, {"qty": {"$exists": False}}]},
+    ]
+}
+FLAT_QUERIES = {
+    "eq": {"status": "A"},
+    "range": {"qty": {"$gte": 20, "$lt": 60}, "price": {"$lt": 50}},
+    "logical": LOGICAL_QUERY,
+}
+DOT_QUERIES = {
+    "dot": {"size.h": {"$gt": 10}, "size.uom": "cm"},
+    "dot-deep": {"meta.a.b.c.d": {"$in": [1, 3, 5]}},
+}
+
+
+@benchmark("deserialize/small")
+def _():
+    return lambda: list(deserialize(SMALL_QUERY)), 1
+
+
+@benchmark("deserialize/logical")
+def _():
+    return lambda: list(deserialize(LOGICAL_QUERY)), 1
+
+
+@benchmark("deserialize/nested-64")
+def _():
+    query = _nested(64)
+    return lambda: list(deserialize(query)), 1
+
+
+@benchmark("deserialize/not-1000")
+def _():
+    query = _not(1_000)
+    return lambda: list(deserialize(query, 2_000)), 1
+
+
+@benchmark("deserialize/or-10000")
+def _():
+    query = _or(10_000)
+    return lambda: list(deserialize(query)), 1
+
+
+def _match(records: list[dict], query: dict):
+    matchers = list(deserialize(query))
+    return lambda: [match(x, matchers) for x in records], len(records)
+
+
+def _compiled(records: list[dict], query: dict):
+    test = compile(deserialize(query))
+    return lambda: [test(x) for x in records], len(records)
+
+
+for _name, _query in FLAT_QUERIES.items():
+    benchmark(f"match/flat-{_name}")(
+        lambda q=_query: _match(_flat_records(random.Random(SEED)), q)
+    )
+    benchmark(f"compile/flat-{_name}")(
+        lambda q=_query: _compiled(_flat_records(random.Random(SEED)), q)
+    )
+
+for _name, _query in DOT_QUERIES.items():
+    benchmark(f"match/{_name}")(
+        lambda q=_query: _match(_nested_records(random.Random(SEED)), q)
+    )
+    benchmark(f"compile/{_name}")(
+        lambda q=_query: _compiled(_nested_records(random.Random(SEED)), q)
+    )
+
+for _size in [10, 1_000, 100_000]:
+    _in_query = {"tags.kind": {"$in": list(range(0, _size * 2, 2))}}
+    benchmark(f"in/match-{_size}")(
+        lambda q=_in_query: _match(_nested_records(random.Random(SEED)), q)
+    )
+    benchmark(f"in/compile-{_size}")(
+        lambda q=_in_query: _compiled(_nested_records(random.Random(SEED)), q)
+    )
+
+
+@benchmark("build/small")
+def _():
+    matchers = list(deserialize(SMALL_QUERY))
+    return lambda: build(matchers), 1
+
+
+@benchmark("build/wide-200")
+def _():
+    matchers = list(
+        deserialize({f"field{x}.sub": {"$gt": x, "$lt": x + 10} for x in range(200)})
+    )
+    return lambda: build(matchers), 1
+
+
+@benchmark("build/nested-64")
+def _():
+    matchers = list(deserialize(_nested(64)))
+    return lambda: build(matchers), 1
+
+
+@benchmark("build/not-1000")
+def _():
+    matchers = list(deserialize(_not(1_000), 2_000))
+    return lambda: build(matchers, 2_000), 1
+
+
+@benchmark("build/or-10000")
+def _():
+    matchers = list(deserialize(_or(10_000)))
+    return lambda: build(matchers), 1
+
+
+def _build_in(size: int, mode: str):
+    matchers = list(deserialize({"num": {"$in": list(range(size))}}))
+    return lambda: build(matchers, list_mode=mode, list_threshold=0), 1
+
+
+for _size in [1_000, 50_000]:
+    for _mode in ["expand", "json"]:
+        benchmark(f"build/in-{_size}-{_mode}")(
+            lambda size=_size, mode=_mode: _build_in(size, mode)
+        )
+
+
+def _calibrate(func: Callable[[], object], min_time: float) -> int:
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            func()
+        if time.perf_counter() - start >= min_time:
+            return loops
+        loops *= 2
+
+
+def run(name: str, repeat: int, min_time: float) -> dict:
+    (func, ops) = BENCHMARKS[name]()
+    func()
+    loops = _calibrate(func, min_time)
+    values = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(loops):
+            func()
+        values.append((time.perf_counter() - start) / loops / ops)
+    return {
+        "unit": "seconds per operation",
+        "loops": loops,
+        "ops": ops,
+        "values": values,
+        "min": min(values),
+        "median": statistics.median(values),
+        "stdev": statistics.stdev(values) if len(values) > 1 else 0.0,
+    }
+
+
+def _commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _metadata() -> dict:
+    return {
+        "date": datetime.now(timezone.utc).isoformat(),
+        "commit": _commit(),
+        "python": sys.version,
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+    }
+
+
+def _format(seconds: float) -> str:
+    for unit, scale in [("s", 1), ("ms", 1e-3), ("us", 1e-6)]:
+        if seconds >= scale:
+            return f"{seconds / scale:.2f}{unit}"
+    return f"{seconds / 1e-9:.0f}ns"
+
+
+def compare(base: dict, results: dict, threshold: float | None) -> bool:
+    """
+    prints the change of every benchmark in both runs, returns whether any
+    slowed down by more than `threshold`.
+    """
+    regressed = False
+    print(f"{'benchmark':<28} {'base':>10} {'new':>10} {'change':>8}")
+    for name, result in results["benchmarks"].items():
+        before = base["benchmarks"].get(name)
+        if before is None:
+            continue
+        ratio = result["median"] / before["median"]
+        flag = ""
+        if threshold is not None and ratio > threshold:
+            flag = " !"
+            regressed = True
+        print(
+            f"{name:<28} {_format(before['median']):>10}"
+            f" {_format(result['median']):>10} {ratio:>7.2f}x{flag}"
+        )
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("-o", "--output", help="write results as JSON to this path")
+    parser.add_argument("--compare", help="JSON results of a previous run")
+    parser.add_argument("--threshold", type=float, help="e.g. 1.1 for 10%% slower")
+    parser.add_argument("-k", "--filter", default="", help="only names containing")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.1)
+    args = parser.parse_args()
+
+    results = {"metadata": _metadata(), "benchmarks": {}}
+    for name in BENCHMARKS:
+        if args.filter not in name:
+            continue
+        result = results["benchmarks"][name] = run(name, args.repeat, args.min_time)
+        print(
+            f"{name:<28} {_format(result['median']):>10}"
+            f" +- {_format(result['stdev']):>8}",
+            file=sys.stderr,
+        )
+
+    if args.output:
+        with open(args.output, "w") as fp:
+            json.dump(results, fp, indent=2)
+
+    if args.compare:
+        with open(args.compare) as fp:
+            base = json.load(fp)
+        if compare(base, results, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,16 @@
 from .match import deserialize, match, Operator
 from .query import build
+from .compiler import compile
+from .cache import QueryCache, SqlCache
+from .stream import filter_stream
 
 __all__ = [
     "deserialize",
     "match",
     "Operator",
     "build",
+    "compile",
+    "QueryCache",
+    "SqlCache",
+    "filter_stream",
 ]
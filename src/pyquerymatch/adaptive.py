@@ -0,0 +1,171 @@
+"""
+matching that reorders $and/$or children by their observed cost and hit rate.
+
+a sample of the records is evaluated through an instrumented copy of the tree,
+which records for every child of every chain how often it is evaluated, how
+often it is true and how long it takes. every so often the children are
+reordered by those statistics (see `optimize.rank`), and the remaining records
+are matched through a compiled predicate of the current order.
+"""
+
+import time
+from typing import Any, Iterable
+
+from pyquerymatch.compiler import compile
+from pyquerymatch.match import (
+    ItemValueWrapper,
+    LogicalAnd,
+    LogicalNor,
+    LogicalNot,
+    LogicalOr,
+    MatchKeyValue,
+    Operator,
+)
+from pyquerymatch.optimize import Estimate, order_indices, rank
+
+
+class _Chain(Operator):
+    """
+    an $and/$or that evaluates its children in a mutable order, recording
+    statistics per child when asked to.
+    """
+
+    def __init__(self, conjunction: bool, value: list[Operator]):
+        self.conjunction = conjunction
+        self.operator = LogicalAnd.operator if conjunction else LogicalOr.operator
+        # always in the original order, `order` holds the evaluation order.
+        self.value = value
+        self.order = list(range(len(value)))
+
+        self.evals = [0.0] * len(value)
+        self.trues = [0.0] * len(value)
+        self.ns = [0.0] * len(value)
+        self.recording = False
+
+    def match(self, theirs: Any | ItemValueWrapper | None) -> bool:
+        if not self.recording:
+            for idx in self.order:
+                if self.value[idx].match(theirs) != self.conjunction:
+                    return not self.conjunction
+            return self.conjunction
+
+        for idx in self.order:
+            start = time.perf_counter_ns()
+            result = self.value[idx].match(theirs)
+            self.ns[idx] += time.perf_counter_ns() - start
+            self.evals[idx] += 1
+            if result:
+                self.trues[idx] += 1
+            if result != self.conjunction:
+                return not self.conjunction
+        return self.conjunction
+
+    def reorder(self, decay: float):
+        seen = [x for x in range(len(self.value)) if self.evals[x] > 0]
+        if len(seen) == 0:
+            return
+        # children never reached get the average cost of their siblings.
+        mean_cost = sum(self.ns[x] / self.evals[x] for x in seen) / len(seen)
+
+        def key(idx: int) -> float:
+            evals = self.evals[idx]
+            cost = self.ns[idx] / evals if evals > 0 else mean_cost
+            # laplace smoothed, so a handful of samples never decides for good.
+            selectivity = (self.trues[idx] + 1) / (evals + 2)
+            return rank(Estimate(cost, selectivity), self.conjunction)
+
+        self.order = order_indices(self.value, [key(x) for x in range(len(self.value))])
+
+        for idx in range(len(self.value)):
+            self.evals[idx] *= decay
+            self.trues[idx] *= decay
+            self.ns[idx] *= decay
+
+
+def _adapt(operator: Operator, chains: list[_Chain]) -> Operator:
+    if isinstance(operator, MatchKeyValue):
+        return MatchKeyValue(operator.key, _adapt(operator.value, chains))
+    if isinstance(operator, LogicalNor):
+        return _adapt(operator.value, chains)
+    if isinstance(operator, LogicalNot):
+        return LogicalNot(_adapt(operator.value, chains))
+    if isinstance(operator, (LogicalAnd, LogicalOr)):
+        chain = _Chain(
+            isinstance(operator, LogicalAnd),
+            [_adapt(x, chains) for x in operator.value],
+        )
+        chains.append(chain)
+        return chain
+    return operator
+
+
+def _plain(operator: Operator) -> Operator:
+    if isinstance(operator, MatchKeyValue):
+        return MatchKeyValue(operator.key, _plain(operator.value))
+    if isinstance(operator, LogicalNot):
+        return LogicalNot(_plain(operator.value))
+    if isinstance(operator, _Chain):
+        cls = LogicalAnd if operator.conjunction else LogicalOr
+        return cls([_plain(operator.value[x]) for x in operator.order])
+    return operator
+
+
+class AdaptiveMatcher:
+    """
+    a predicate equivalent to `lambda item: match(item, matchers)`, which
+    learns a cheaper evaluation order from the records it sees.
+
+    one in every `sample_every` records is instrumented, and the chains are
+    reordered after every `reorder_every` records. on reorder, statistics are
+    multiplied by `decay` so the order follows drift in the data.
+
+    not thread safe.
+    """
+
+    def __init__(
+        self,
+        matchers: Iterable[Operator],
+        sample_every: int = 16,
+        reorder_every: int = 4096,
+        decay: float = 0.5,
+    ):
+        if sample_every < 1 or reorder_every < 1:
+            raise ValueError("sample_every and reorder_every must be at least 1")
+
+        self.sample_every = sample_every
+        self.reorder_every = reorder_every
+        self.decay = decay
+
+        self._chains: list[_Chain] = []
+        self._root = _Chain(True, [_adapt(x, self._chains) for x in matchers])
+        self._chains.append(self._root)
+        self._compiled = compile(self.matchers)
+        self._count = 0
+
+    @property
+    def matchers(self) -> list[Operator]:
+        """
+        the matchers in their current evaluation order.
+        """
+        return list(_plain(self._root).value)
+
+    def reorder(self):
+        for chain in self._chains:
+            chain.reorder(self.decay)
+        self._compiled = compile(self.matchers)
+
+    def __call__(self, item: dict) -> bool:
+        self._count += 1
+        if self._count % self.reorder_every == 0:
+            self.reorder()
+
+        if self._count % self.sample_every != 0:
+            return self._compiled(item)
+
+        for chain in self._chains:
+            chain.recording = True
+        try:
+            return self._root.match(item)
+        finally:
+            for chain in self._chains:
+                chain.recording = False
@@ -0,0 +1,245 @@
+"""
+filtering and querying from asyncio code, without blocking the event loop.
+
+`afilter` matches records from async sources (database cursors, websocket
+feeds, async file readers). a separate task reads the source into batches
+through a bounded queue, so a slow consumer holds back the producer rather
+than buffering without limit. batches are evaluated inline, yielding to the
+event loop in between, or in a thread or process pool when they are large.
+
+`AsyncExecutor` runs the sql of `build` on async database drivers.
+"""
+
+import asyncio
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Any, AsyncIterable, AsyncIterator, Iterable
+
+from pyquerymatch.cache import SqlCache
+from pyquerymatch.dialect import SQLITE, Dialect
+from pyquerymatch.match import Operator
+from pyquerymatch.parallel import _picklable
+from pyquerymatch.query import (
+    LIST_EXPAND,
+    LIST_TEMP_TABLE,
+    LIST_THRESHOLD,
+    build,
+)
+from pyquerymatch.sqlite import FETCH_SIZE, _identifier
+from pyquerymatch.stream import Query, _filter_iterable, predicate
+
+BATCH_SIZE = 1024
+# batches read ahead of the one being evaluated.
+QUEUE_SIZE = 4
+# seconds a partial batch may wait for more records while the source stalls.
+MAX_DELAY = 0.05
+
+_END = object()
+
+
+def _matching(test, batch: list, raw: bool) -> list:
+    return list(_filter_iterable(batch, test, raw))
+
+
+async def _iterate(source: Iterable) -> AsyncIterator:
+    for item in source:
+        yield item
+
+
+class _Reader:
+    """
+    reads `source` into batches of `batch_size`, at most `queue_size` ahead.
+    """
+
+    def __init__(self, source: AsyncIterable, batch_size: int, queue_size: int):
+        self.source = source
+        self.batch_size = batch_size
+        self.queue: asyncio.Queue = asyncio.Queue(queue_size)
+        # the batch being filled, which `take` hands out early if it stalls.
+        self.partial: list = []
+        self.error: BaseException | None = None
+
+    async def run(self):
+        try:
+            async for item in self.source:
+                self.partial.append(item)
+                if len(self.partial) >= self.batch_size:
+                    (batch, self.partial) = (self.partial, [])
+                    await self.queue.put(batch)
+        except Exception as e:
+            self.error = e
+        (batch, self.partial) = (self.partial, [])
+        if batch:
+            await self.queue.put(batch)
+        await self.queue.put(_END)
+
+    async def take(self, max_delay: float | None) -> list | None:
+        """
+        the next batch, None at the end of the source.
+        """
+        while True:
+            try:
+                batch = await asyncio.wait_for(self.queue.get(), max_delay)
+            except TimeoutError:
+                # the queue is empty, so the partial batch is the oldest.
+                if not self.partial:
+                    continue
+                (batch, self.partial) = (self.partial, [])
+
+            if batch is _END:
+                if self.error is not None:
+                    raise self.error
+                return None
+            return batch
+
+
+async def afilter(
+    source: AsyncIterable | Iterable,
+    query: Query,
+    /,
+    raw: bool = False,
+    batch_size: int = BATCH_SIZE,
+    queue_size: int = QUEUE_SIZE,
+    max_delay: float | None = MAX_DELAY,
+    executor: Executor | None = None,
+    offload_size: int = BATCH_SIZE,
+    concurrency: int = 1,
+) -> AsyncIterator:
+    """
+    lazily yields the records from `source` matching `query`, in order.
+
+    `source` yields dicts or NDJSON lines, as for `filter_stream` (including
+    `raw`). it is read up to `queue_size` batches of `batch_size` ahead of
+    the records being evaluated; a batch is handed out early once the source
+    has stalled for `max_delay` seconds (None to wait for full batches).
+
+    batches of at least `offload_size` records are evaluated in `executor`,
+    if given, with up to `concurrency` of them at once; smaller ones on the
+    event loop. for a `ProcessPoolExecutor` the query and the batches must
+    be picklable.
+    """
+    if isinstance(executor, ProcessPoolExecutor):
+        test = _picklable(query)
+    else:
+        test = predicate(query)
+    if not isinstance(source, AsyncIterable):
+        source = _iterate(source)
+
+    loop = asyncio.get_running_loop()
+    reader = _Reader(source, batch_size, queue_size)
+    task = asyncio.create_task(reader.run())
+    pending: deque[asyncio.Future] = deque()
+    try:
+        while (batch := await reader.take(max_delay)) is not None:
+            if executor is not None and len(batch) >= offload_size:
+                pending.append(
+                    loop.run_in_executor(executor, _matching, test, batch, raw)
+                )
+                while len(pending) >= concurrency:
+                    for item in await pending.popleft():
+                        yield item
+                continue
+
+            # earlier batches still in the executor come first.
+            while pending:
+                for item in await pending.popleft():
+                    yield item
+            for item in _matching(test, batch, raw):
+                yield item
+            # other tasks get to run between batches.
+            await asyncio.sleep(0)
+
+        while pending:
+            for item in await pending.popleft():
+                yield item
+    finally:
+        task.cancel()
+        for future in pending:
+            future.cancel()
+
+
+class AsyncExecutor:
+    """
+    runs queries against `table` on an async database connection, returning
+    `columns`.
+
+    the connection's `execute(sql, params)` must be awaitable and return a
+    cursor with awaitable `fetchmany` and `close`, as for aiosqlite and
+    psycopg's `AsyncConnection`; `dialect` must match its parameter style.
+    """
+
+    def __init__(
+        self,
+        connection: Any,
+        table: str,
+        columns: Iterable[str] = ("*",),
+        fetch_size: int = FETCH_SIZE,
+        dialect: Dialect = SQLITE,
+        list_mode: str = LIST_EXPAND,
+        list_threshold: int = LIST_THRESHOLD,
+        cache_size: int = 1024,
+    ):
+        if list_mode == LIST_TEMP_TABLE:
+            raise ValueError("temp table lists need a synchronous connection")
+        columns = list(columns)
+        if columns != ["*"]:
+            columns = [_identifier(x) for x in columns]
+
+        self.connection = connection
+        self.table = _identifier(table)
+        self.columns = ", ".join(columns)
+        self.fetch_size = fetch_size
+        self.dialect = dialect
+        self.list_mode = list_mode
+        self.list_threshold = list_threshold
+        self.cache = SqlCache(
+            cache_size,
+            list_mode=list_mode,
+            list_threshold=list_threshold,
+            dialect=dialect,
+        )
+
+    def _build(self, query: dict[str, Any] | Iterable[Operator]) -> tuple[str, dict]:
+        if isinstance(query, dict):
+            return self.cache.build(query)
+
+        return build(
+            list(query),
+            list_mode=self.list_mode,
+            list_threshold=self.list_threshold,
+            dialect=self.dialect,
+        )
+
+    async def select(
+        self, query: dict[str, Any] | Iterable[Operator]
+    ) -> AsyncIterator[tuple]:
+        """
+        lazily yields the rows matching `query`.
+        """
+        (where, params) = self._build(query)
+        cursor = await self.connection.execute(
+            f"select {self.columns} from {self.table} where {where}", params
+        )
+        try:
+            while True:
+                rows = await cursor.fetchmany(self.fetch_size)
+                if len(rows) == 0:
+                    return
+                for row in rows:
+                    yield row
+        finally:
+            await cursor.close()
+
+    async def count(self, query: dict[str, Any] | Iterable[Operator]) -> int:
+        """
+        the number of rows matching `query`.
+        """
+        (where, params) = self._build(query)
+        cursor = await self.connection.execute(
+            f"select count(*) from {self.table} where {where}", params
+        )
+        try:
+            (row,) = await cursor.fetchmany(1)
+        finally:
+            await cursor.close()
+        return row[0]
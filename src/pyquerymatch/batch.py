@@ -0,0 +1,209 @@
+"""
+vectorized matching over columnar data.
+
+columns are keyed by their (dot notation) field path, and are anything numpy
+can turn into a 1-d array. masked entries of a `numpy.ma.MaskedArray` are
+treated as missing values, as is a column that is not present at all.
+
+unlike `match`, ordering comparisons ($gt, $gte, $lt, $lte) on missing values
+do not raise; they are simply false.
+
+requires numpy, `pip install pyquerymatch[numpy]`.
+"""
+
+import operator as op
+from dataclasses import dataclass
+from typing import Any, Callable, Iterable, Mapping
+
+from pyquerymatch.match import (
+    CmpEqual,
+    CmpGreaterThan,
+    CmpGreaterThanOrEqual,
+    CmpIn,
+    CmpLessThan,
+    CmpLessThanOrEqual,
+    CmpNotEqual,
+    CmpNotIn,
+    Constant,
+    Exists,
+    LogicalAnd,
+    LogicalNor,
+    LogicalNot,
+    LogicalOr,
+    MatchKeyValue,
+    Operator,
+    Ranges,
+)
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+_ORDERING: dict[type, Callable[[Any, Any], Any]] = {
+    CmpGreaterThan: op.gt,
+    CmpGreaterThanOrEqual: op.ge,
+    CmpLessThan: op.lt,
+    CmpLessThanOrEqual: op.le,
+}
+
+
+@dataclass
+class _Column:
+    # None if the column is not present at all.
+    data: Any
+    exists: Any
+
+
+def _column(value: Any, length: int) -> _Column:
+    if value is None:
+        return _Column(None, np.zeros(length, dtype=bool))
+
+    if isinstance(value, np.ma.MaskedArray):
+        data = np.ma.getdata(value)
+        exists = ~np.ma.getmaskarray(value)
+    else:
+        data = np.asarray(value)
+        exists = np.ones(len(data), dtype=bool)
+
+    if data.ndim != 1 or len(data) != length:
+        raise ValueError(f"expected 1-d column of length {length}, got {data.shape}")
+    return _Column(data, exists)
+
+
+def _bool(result: Any, length: int) -> Any:
+    # comparisons between incompatible types may collapse to a scalar.
+    result = np.asarray(result)
+    if result.ndim == 0:
+        return np.full(length, bool(result))
+    return result.astype(bool, copy=False)
+
+
+def _where_exists(column: _Column, fn: Callable[[Any], Any], length: int) -> Any:
+    if column.data is None:
+        return np.zeros(length, dtype=bool)
+    if column.exists.all():
+        return _bool(fn(column.data), length)
+
+    # only evaluate present values, masked slots may hold anything.
+    result = np.zeros(length, dtype=bool)
+    result[column.exists] = _bool(fn(column.data[column.exists]), column.exists.sum())
+    return result
+
+
+def _is_none(column: _Column, length: int) -> Any:
+    missing = ~column.exists
+    if column.data is not None and column.data.dtype == object:
+        missing |= _where_exists(column, lambda x: np.equal(x, None), length)
+    return missing
+
+
+def _eq(column: _Column, value: Any, length: int) -> Any:
+    if value is None:
+        return _is_none(column, length)
+    return _where_exists(column, lambda x: x == value, length)
+
+
+def _isin(column: _Column, operator: CmpIn | CmpNotIn, length: int) -> Any:
+    values = operator.values
+
+    def fn(data):
+        if data.dtype == object or len(values.unhashable) > 0:
+            return np.fromiter((x in values for x in data), dtype=bool, count=len(data))
+        # keep numpy from coercing e.g. numbers and strings to a common type.
+        kind = (str,) if data.dtype.kind in "US" else (bool, int, float)
+        candidates = [x for x in values.hashed if isinstance(x, kind)]
+        if len(candidates) == 0:
+            return np.zeros(len(data), dtype=bool)
+        return np.isin(data, candidates)
+
+    result = _where_exists(column, fn, length)
+    if None in values:
+        result |= ~column.exists
+    return result
+
+
+def _eval(
+    operator: Operator, column: _Column | None, columns: Mapping[str, Any], length: int
+) -> Any:
+    if isinstance(operator, MatchKeyValue):
+        if column is not None:
+            raise ValueError("KeyValueOperator can only be used with a dict")
+        return _eval(
+            operator.value, _column(columns.get(operator.key), length), columns, length
+        )
+
+    if isinstance(operator, LogicalAnd):
+        result = np.ones(length, dtype=bool)
+        for x in operator.value:
+            result &= _eval(x, column, columns, length)
+        return result
+
+    if isinstance(operator, LogicalOr):
+        result = np.zeros(length, dtype=bool)
+        for x in operator.value:
+            result |= _eval(x, column, columns, length)
+        return result
+
+    if isinstance(operator, LogicalNot):
+        return ~_eval(operator.value, column, columns, length)
+
+    if isinstance(operator, LogicalNor):
+        return _eval(operator.value, column, columns, length)
+
+    if isinstance(operator, Constant):
+        return np.full(length, operator.value)
+
+    if isinstance(operator, Ranges):
+        return _eval(operator.expand(), column, columns, length)
+
+    if column is None:
+        raise ValueError(
+            f"operator '{operator.operator}' must be applied to a field in batch matching"
+        )
+
+    if isinstance(operator, Exists):
+        return column.exists.copy() if operator.value else ~column.exists
+
+    if isinstance(operator, CmpEqual):
+        return _eq(column, operator.value, length)
+
+    if isinstance(operator, CmpNotEqual):
+        return ~_eq(column, operator.value, length)
+
+    if isinstance(operator, CmpIn):
+        return _isin(column, operator, length)
+
+    if isinstance(operator, CmpNotIn):
+        return ~_isin(column, operator, length)
+
+    cmp = _ORDERING.get(type(operator))
+    if cmp is not None:
+        return _where_exists(column, lambda x: cmp(x, operator.value), length)
+
+    raise ValueError(f"operator '{type(operator)}' has no known batch logic")
+
+
+def match_batch(
+    columns: Mapping[str, Any],
+    matchers: Iterable[Operator],
+    length: int | None = None,
+) -> Any:
+    """
+    returns a boolean mask of the rows in `columns` matching all `matchers`.
+    `length` is only required when `columns` is empty.
+    """
+    if np is None:
+        raise ImportError(
+            "numpy is required for batch matching, install pyquerymatch[numpy]"
+        )
+
+    if length is None:
+        if len(columns) == 0:
+            raise ValueError("length must be set when no columns are given")
+        length = len(next(iter(columns.values())))
+
+    result = np.ones(length, dtype=bool)
+    for m in matchers:
+        result &= _eval(m, None, columns, length)
+    return result
@@ -0,0 +1,336 @@
+"""
+caches for services that see the same queries over and over.
+
+`QueryCache` keeps deserialized (and compiled) queries, keyed by the
+`canonical` form of the query document. `SqlCache` keeps the sql `build`
+generates, keyed by the `shape` of the query (its structure and the types of
+its values), so queries differing only in their values reuse the sql text and
+only bind their parameters again. both are bounded, thread safe LRUs.
+"""
+
+import json
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Hashable
+
+from pyquerymatch.compiler import compile
+from pyquerymatch.dialect import SQLITE, Dialect
+from pyquerymatch.match import (
+    KNOWN_VAL_OPERATORS,
+    Exists,
+    Operator,
+    deserialize,
+)
+from pyquerymatch.query import (
+    LIST_EXPAND,
+    LIST_JSON,
+    LIST_TEMP_TABLE,
+    LIST_THRESHOLD,
+    BuilderContext,
+    build,
+)
+
+
+def canonical(query: Any, sort_keys: bool = False) -> Hashable:
+    """
+    returns a hashable form of a query, equal for equal queries.
+
+    scalars carry their type, so that `1`, `1.0` and `True` (which compare
+    equal) do not share an entry. key order is significant unless `sort_keys`
+    is set, since it is the order operators are evaluated in.
+
+    raises TypeError for values that cannot be made hashable.
+    """
+    if isinstance(query, dict):
+        items = tuple((k, canonical(v, sort_keys)) for k, v in query.items())
+        if sort_keys:
+            items = tuple(sorted(items, key=lambda x: x[0]))
+        return dict, items
+
+    if isinstance(query, list):
+        return list, tuple(canonical(x, sort_keys) for x in query)
+
+    hash(query)
+    return type(query), query
+
+
+class _Lru:
+    """
+    a bounded, thread safe LRU mapping with hit / miss / eviction counters.
+    """
+
+    def __init__(self, max_size: int):
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._entries: OrderedDict[Hashable, Any] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Any | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+            return None
+
+    def miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def put(self, key: Hashable, entry: Any):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class _Counters:
+    _lru: _Lru
+
+    @property
+    def hits(self) -> int:
+        return self._lru.hits
+
+    @property
+    def misses(self) -> int:
+        return self._lru.misses
+
+    @property
+    def evictions(self) -> int:
+        return self._lru.evictions
+
+    def clear(self):
+        self._lru.clear()
+
+    def __len__(self) -> int:
+        return len(self._lru)
+
+
+@dataclass
+class _Entry:
+    matchers: tuple[Operator, ...]
+    compiled: Callable[[dict], bool] | None = None
+
+
+class QueryCache(_Counters):
+    """
+    a bounded LRU cache of deserialized (and optionally compiled) queries.
+
+    the cached operators are shared between callers and must not be mutated.
+    """
+
+    def __init__(
+        self, max_size: int = 1024, max_depth: int = 1024, sort_keys: bool = False
+    ):
+        self.max_size = max_size
+        self.max_depth = max_depth
+        self.sort_keys = sort_keys
+        self._lru = _Lru(max_size)
+
+    def _entry(self, query: dict[str, Any]) -> _Entry:
+        try:
+            key = canonical(query, self.sort_keys)
+        except TypeError:
+            # not cacheable, let deserialize decide whether it is valid.
+            self._lru.miss()
+            return _Entry(tuple(deserialize(query, self.max_depth)))
+
+        entry = self._lru.get(key)
+        if entry is not None:
+            return entry
+
+        # deserialize outside the lock; a concurrent miss on the same query
+        # only costs a redundant deserialize.
+        entry = _Entry(tuple(deserialize(query, self.max_depth)))
+        self._lru.put(key, entry)
+        return entry
+
+    def deserialize(self, query: dict[str, Any]) -> tuple[Operator, ...]:
+        return self._entry(query).matchers
+
+    def compile(self, query: dict[str, Any]) -> Callable[[dict], bool]:
+        entry = self._entry(query)
+        if entry.compiled is None:
+            entry.compiled = compile(entry.matchers)
+        return entry.compiled
+
+
+class _Json:
+    """
+    a list bound as a single json parameter.
+    """
+
+    __slots__ = ("value",)
+
+    def __init__(self, value: list):
+        self.value = value
+
+
+def shape(
+    query: Any,
+    list_mode: str = LIST_EXPAND,
+    list_threshold: int = LIST_THRESHOLD,
+    dialect: Dialect = SQLITE,
+) -> tuple[Hashable, list]:
+    """
+    splits a query into its shape and its literal values, in the order `build`
+    binds them as parameters.
+
+    queries of the same shape build to the same sql text in `dialect`.
+    literals are part of the shape by type only (along with the length of
+    expanded lists, and the kind `dialect` compares them as), except for
+    `$exists`, which changes the sql.
+
+    raises TypeError for `$exists` values that cannot be made hashable.
+    """
+    slots: list = []
+
+    def literal(value: Any) -> Hashable:
+        # the kind picks the cast, e.g. by length for strings on mysql.
+        return dialect.kind(value), typed(value)
+
+    def typed(value: Any) -> Hashable:
+        if isinstance(value, list):
+            if list_mode == LIST_JSON and len(value) > list_threshold:
+                slots.append(_Json(value))
+                return _Json
+            return list, tuple(typed(x) for x in value)
+        slots.append(value)
+        return type(value)
+
+    def walk(query: Any) -> Hashable:
+        if isinstance(query, dict):
+            items = []
+            for key, value in query.items():
+                if key == Exists.operator:
+                    items.append((key, canonical(value)))
+                elif key in KNOWN_VAL_OPERATORS:
+                    items.append((key, literal(value)))
+                elif isinstance(value, (dict, list)) or key.startswith("$"):
+                    items.append((key, walk(value)))
+                else:
+                    items.append((key, literal(value)))
+            return dict, tuple(items)
+        if isinstance(query, list):
+            return list, tuple(walk(x) for x in query)
+        # invalid, but deserialize is the one to say so.
+        return type(query), None
+
+    return walk(query), slots
+
+
+@dataclass
+class _Template:
+    sql: str
+    # parameter names, one per slot of the shape.
+    names: list[str]
+
+
+def _bind(names: list[str], slots: list) -> dict:
+    params = {}
+    for name, value in zip(names, slots):
+        if isinstance(value, _Json):
+            try:
+                value = json.dumps(value.value)
+            except (TypeError, ValueError) as e:
+                raise ValueError(f"list is not json serializable: {e}") from e
+        params[name] = value
+    return params
+
+
+def _template(sql: str, params: dict, slots: list) -> _Template | None:
+    """
+    the template for sql built from `slots`, if its params line up with them.
+    """
+    if len(params) != len(slots):
+        return None
+    for value, slot in zip(params.values(), slots):
+        if isinstance(slot, _Json):
+            if value != json.dumps(slot.value):
+                return None
+        elif value is not slot:
+            return None
+    return _Template(sql, list(params))
+
+
+class SqlCache(_Counters):
+    """
+    a bounded LRU cache of the sql `build` generates, per query shape (see
+    `shape`).
+
+    queries differing only in their literal values share one entry: only the
+    parameters are bound again on a hit, and the sql text stays identical, so
+    drivers and servers can reuse prepared statements and plans.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 1024,
+        max_depth: int = 1024,
+        list_mode: str = LIST_EXPAND,
+        list_threshold: int = LIST_THRESHOLD,
+        dialect: Dialect = SQLITE,
+    ):
+        if list_mode == LIST_TEMP_TABLE:
+            raise ValueError("temp table lists cannot be cached")
+        # validates list_mode.
+        BuilderContext(list_mode=list_mode, list_threshold=list_threshold)
+
+        self.max_size = max_size
+        self.max_depth = max_depth
+        self.list_mode = list_mode
+        self.list_threshold = list_threshold
+        self.dialect = dialect
+        self._lru = _Lru(max_size)
+
+    def build(self, query: dict[str, Any]) -> tuple[str, dict]:
+        """
+        same as `build(deserialize(query), dialect=dialect)`.
+        """
+        try:
+            (key, slots) = shape(
+                query, self.list_mode, self.list_threshold, self.dialect
+            )
+        except TypeError:
+            key = None
+
+        if key is not None:
+            template = self._lru.get(key)
+            if template is not None:
+                return template.sql, _bind(template.names, slots)
+        else:
+            self._lru.miss()
+
+        (sql, params) = build(
+            list(deserialize(query, self.max_depth)),
+            self.max_depth,
+            list_mode=self.list_mode,
+            list_threshold=self.list_threshold,
+            dialect=self.dialect,
+        )
+        if key is not None:
+            template = _template(sql, params, slots)
+            if template is not None:
+                self._lru.put(key, template)
+        return sql, params
@@ -0,0 +1,317 @@
+"""
+repeated queries over a static, in-memory list of records.
+
+`IndexedCollection` keeps optional indexes on chosen paths: hash indexes for
+$eq/$ne/$in/$nin, sorted indexes for $gt/$gte/$lt/$lte and existence sets for
+$exists. queries are planned against them, combining index results through
+set intersection ($and), union ($or) and complement ($not); whatever the
+indexes cannot answer exactly is checked per candidate record, and queries
+the indexes cannot narrow down at all fall back to a scan.
+
+records for which `match` would raise are never returned.
+"""
+
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass, field
+from typing import Any, Iterable, Sequence
+
+from pyquerymatch.compiler import compile
+from pyquerymatch.match import (
+    _MISSING,
+    CmpEqual,
+    CmpGreaterThan,
+    CmpGreaterThanOrEqual,
+    CmpIn,
+    CmpLessThan,
+    CmpLessThanOrEqual,
+    CmpNotEqual,
+    CmpNotIn,
+    Exists,
+    FieldPath,
+    LogicalAnd,
+    LogicalNor,
+    LogicalNot,
+    LogicalOr,
+    MatchKeyValue,
+    Operator,
+)
+from pyquerymatch.queryindex import Interval, family
+
+_LOWER = (CmpGreaterThan, CmpGreaterThanOrEqual)
+_UPPER = (CmpLessThan, CmpLessThanOrEqual)
+
+
+@dataclass
+class _Plan:
+    # a superset of the matching rows.
+    rows: set[int]
+    # whether `rows` are exactly the matching rows, and none of them raise.
+    exact: bool
+
+
+@dataclass
+class _SortedIndex:
+    values: list
+    rows: list[int]
+    # rows holding NaN, left out of `values`: no bound matches them.
+    nan: int = 0
+
+
+@dataclass
+class _PathIndex:
+    path: FieldPath
+    # rows the path cannot be resolved on (dot notation through a non-dict).
+    errors: set[int] = field(default_factory=set)
+    equal: dict[Any, list[int]] | None = None
+    ordered: dict[type, _SortedIndex] | None = None
+    exists: set[int] | None = None
+
+
+class IndexedCollection:
+    """
+    a static list of records, with indexes on some of their paths.
+    """
+
+    def __init__(
+        self,
+        items: Sequence[dict],
+        hash_paths: Iterable[str] = (),
+        sorted_paths: Iterable[str] = (),
+        exists_paths: Iterable[str] = (),
+    ):
+        self.items = items
+        self._all = set(range(len(items)))
+        self._indexes: dict[str, _PathIndex] = {}
+
+        hash_paths = set(hash_paths)
+        sorted_paths = set(sorted_paths)
+        exists_paths = set(exists_paths)
+        for path in hash_paths | sorted_paths | exists_paths:
+            self._indexes[path] = self._build(
+                path, path in hash_paths, path in sorted_paths, path in exists_paths
+            )
+
+    def _build(
+        self, path: str, hashed: bool, ordered: bool, exists: bool
+    ) -> _PathIndex:
+        index = _PathIndex(FieldPath(path))
+        values: dict[type, list[tuple[Any, int]]] = {}
+        nan: dict[type, int] = {}
+        equal: dict[Any, list[int]] = {}
+        present: set[int] = set()
+        for row, item in enumerate(self.items):
+            try:
+                value = index.path.resolve(item)
+            except ValueError:
+                index.errors.add(row)
+                continue
+
+            if value is not _MISSING:
+                present.add(row)
+            else:
+                value = None
+
+            if hashed:
+                try:
+                    equal.setdefault(value, []).append(row)
+                except TypeError:
+                    # unhashable, never equal to an indexable constant.
+                    pass
+
+            if ordered:
+                kind = family(value)
+                if kind is None:
+                    pass
+                elif value != value:
+                    # unordered against everything, and would break the sort.
+                    nan[kind] = nan.get(kind, 0) + 1
+                else:
+                    values.setdefault(kind, []).append((value, row))
+
+        if hashed:
+            index.equal = equal
+        if ordered:
+            index.ordered = {}
+            for kind in values.keys() | nan.keys():
+                pairs = sorted(values.get(kind, ()), key=lambda x: x[0])
+                index.ordered[kind] = _SortedIndex(
+                    [x[0] for x in pairs], [x[1] for x in pairs], nan.get(kind, 0)
+                )
+        if exists:
+            index.exists = present
+        return index
+
+    def _plan_equal(self, index: _PathIndex, values: list) -> _Plan | None:
+        if index.equal is None:
+            return None
+        rows: set[int] = set()
+        for value in values:
+            try:
+                rows.update(index.equal.get(value, ()))
+            except TypeError:
+                return None
+        return _Plan(rows, len(index.errors) == 0)
+
+    def _plan_range(self, index: _PathIndex, interval: Interval) -> _Plan | None:
+        if index.ordered is None:
+            return None
+        kind = family(interval.lo if interval.lo is not None else interval.hi)
+        if kind is None:
+            return None
+
+        ordered = index.ordered.get(kind)
+        if ordered is None:
+            return _Plan(set(), False)
+
+        start, end = 0, len(ordered.values)
+        try:
+            if interval.lo is not None:
+                bisect = bisect_left if interval.lo_inclusive else bisect_right
+                start = bisect(ordered.values, interval.lo)
+            if interval.hi is not None:
+                bisect = bisect_right if interval.hi_inclusive else bisect_left
+                end = bisect(ordered.values, interval.hi)
+        except TypeError:
+            return None
+
+        # everything outside the family raises when compared.
+        exact = len(ordered.rows) + ordered.nan == len(self.items)
+        return _Plan(set(ordered.rows[start:end]), exact)
+
+    def _plan_field(self, path: str, operator: Operator) -> _Plan | None:
+        index = self._indexes.get(path)
+        if index is None:
+            return None
+
+        if isinstance(operator, LogicalNor):
+            return self._plan_field(path, operator.value)
+
+        if isinstance(operator, LogicalNot):
+            return self._complement(self._plan_field(path, operator.value))
+
+        if isinstance(operator, LogicalOr):
+            return self._union([self._plan_field(path, x) for x in operator.value])
+
+        if isinstance(operator, LogicalAnd):
+            # bounds on the value combine into one range lookup.
+            interval = Interval()
+            rest = []
+            for x in operator.value:
+                kind = family(x.value) if isinstance(x, _LOWER + _UPPER) else None
+                if kind is None or not self._extend(interval, x):
+                    rest.append(x)
+            plans = [self._plan_field(path, x) for x in rest]
+            if interval.lo is not None or interval.hi is not None:
+                plans.append(self._plan_range(index, interval))
+            return self._intersection(plans)
+
+        if isinstance(operator, CmpEqual):
+            return self._plan_equal(index, [operator.value])
+
+        if isinstance(operator, CmpIn):
+            return self._plan_equal(index, operator.value)
+
+        if isinstance(operator, CmpNotEqual):
+            return self._complement(self._plan_equal(index, [operator.value]))
+
+        if isinstance(operator, CmpNotIn):
+            return self._complement(self._plan_equal(index, operator.value))
+
+        if isinstance(operator, _LOWER + _UPPER):
+            interval = Interval()
+            if family(operator.value) is None or not self._extend(interval, operator):
+                return None
+            return self._plan_range(index, interval)
+
+        if isinstance(operator, Exists):
+            if index.exists is None:
+                return None
+            rows = index.exists if operator.value else self._all - index.exists
+            return _Plan(set(rows) - index.errors, len(index.errors) == 0)
+
+        return None
+
+    @staticmethod
+    def _extend(interval: Interval, operator: Operator) -> bool:
+        inclusive = isinstance(operator, (CmpGreaterThanOrEqual, CmpLessThanOrEqual))
+        bound = operator.value
+        current = interval.lo if interval.lo is not None else interval.hi
+        if current is not None and family(current) != family(bound):
+            return False
+        if bound != bound:
+            # NaN, which bisection (and merging bounds) cannot handle.
+            return False
+
+        if isinstance(operator, _LOWER):
+            if interval.lo is None or bound > interval.lo:
+                interval.lo, interval.lo_inclusive = bound, inclusive
+            elif bound == interval.lo:
+                interval.lo_inclusive = interval.lo_inclusive and inclusive
+        else:
+            if interval.hi is None or bound < interval.hi:
+                interval.hi, interval.hi_inclusive = bound, inclusive
+            elif bound == interval.hi:
+                interval.hi_inclusive = interval.hi_inclusive and inclusive
+        return True
+
+    def _complement(self, plan: _Plan | None) -> _Plan | None:
+        if plan is None or not plan.exact:
+            return None
+        return _Plan(self._all - plan.rows, True)
+
+    @staticmethod
+    def _union(plans: list[_Plan | None]) -> _Plan | None:
+        if any(x is None for x in plans):
+            return None
+        rows: set[int] = set()
+        for x in plans:
+            rows |= x.rows
+        return _Plan(rows, all(x.exact for x in plans))
+
+    def _intersection(self, plans: list[_Plan | None]) -> _Plan | None:
+        known = sorted([x for x in plans if x is not None], key=lambda x: len(x.rows))
+        if len(known) == 0:
+            return None
+        rows = set(known[0].rows)
+        for x in known[1:]:
+            rows &= x.rows
+        return _Plan(rows, len(known) == len(plans) and all(x.exact for x in known))
+
+    def _plan(self, operator: Operator) -> _Plan | None:
+        if isinstance(operator, MatchKeyValue):
+            return self._plan_field(operator.key, operator.value)
+        if isinstance(operator, LogicalNor):
+            return self._plan(operator.value)
+        if isinstance(operator, LogicalNot):
+            return self._complement(self._plan(operator.value))
+        if isinstance(operator, LogicalAnd):
+            return self._intersection([self._plan(x) for x in operator.value])
+        if isinstance(operator, LogicalOr):
+            return self._union([self._plan(x) for x in operator.value])
+        return None
+
+    def positions(self, matchers: Iterable[Operator]) -> list[int]:
+        """
+        ascending positions of the records matching all `matchers`.
+        """
+        matchers = list(matchers)
+        plan = self._plan(LogicalAnd(matchers))
+        if plan is not None and plan.exact:
+            return sorted(plan.rows)
+
+        test = compile(matchers)
+        rows = range(len(self.items)) if plan is None else sorted(plan.rows)
+        result = []
+        for row in rows:
+            try:
+                if test(self.items[row]):
+                    result.append(row)
+            except (TypeError, ValueError):
+                pass
+        return result
+
+    def find(self, matchers: Iterable[Operator]) -> list[dict]:
+        """
+        the records matching all `matchers`, in their original order.
+        """
+        return [self.items[x] for x in self.positions(matchers)]
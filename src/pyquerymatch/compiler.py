@@ -0,0 +1,207 @@
+"""
+compiles a deserialized operator tree into a single python predicate.
+
+the generated function evaluates the same semantics as `match.match`, but
+paths, constants and the tree shape are baked in at compile time; there is no
+per-record dispatch, wrapping or path splitting.
+"""
+
+import builtins
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterable
+
+from pyquerymatch.match import (
+    CmpEqual,
+    CmpGreaterThan,
+    CmpGreaterThanOrEqual,
+    CmpIn,
+    CmpLessThan,
+    CmpLessThanOrEqual,
+    CmpNotEqual,
+    CmpNotIn,
+    Constant,
+    Exists,
+    LogicalAnd,
+    LogicalNor,
+    LogicalNot,
+    LogicalOr,
+    MatchKeyValue,
+    Operator,
+    Ranges,
+    _MISSING,
+    match,
+)
+
+logger = logging.getLogger(__name__)
+
+_COMPARISONS: dict[type, str] = {
+    CmpEqual: "==",
+    CmpGreaterThan: ">",
+    CmpGreaterThanOrEqual: ">=",
+    CmpLessThan: "<",
+    CmpLessThanOrEqual: "<=",
+    CmpNotEqual: "!=",
+}
+
+
+@dataclass
+class _Subject:
+    # name of the local holding the (unwrapped) value under test
+    value: str
+    # expression evaluating to the existence of the value, if within a field
+    exists: str | None
+
+
+@dataclass
+class _CodeGen:
+    namespace: dict[str, Any] = field(default_factory=dict)
+    local_ctr: int = 0
+    uses_item_as_dict: bool = False
+
+    def const(self, value: Any) -> str:
+        name = f"c{len(self.namespace)}"
+        self.namespace[name] = value
+        return name
+
+    def local(self, prefix: str) -> str:
+        name = f"{prefix}{self.local_ctr}"
+        self.local_ctr += 1
+        return name
+
+
+def _gen_kv(gen: _CodeGen, operator: MatchKeyValue, subject: _Subject) -> str:
+    if subject.exists is not None:
+        raise ValueError("KeyValueOperator can only be used with a dict")
+    gen.uses_item_as_dict = True
+
+    raw = gen.local("r")
+    value = gen.local("v")
+    if len(operator.path.parents) == 0:
+        lookup = f"{subject.value}.get({operator.path.leaf!r}, _MISSING)"
+    else:
+        lookup = f"{gen.const(operator.path.resolve)}({subject.value})"
+
+    inner = _gen(gen, operator.value, _Subject(value, f"({raw} is not _MISSING)"))
+    # bind both locals up front; `(x := ...) is x` is always true, without
+    # testing the truth of values (which raises for e.g. numpy arrays).
+    return (
+        f"((({raw} := {lookup}) is {raw})"
+        f" and (({value} := None if {raw} is _MISSING else {raw}) is {value})"
+        f" and {inner})"
+    )
+
+
+def _gen_logical(
+    gen: _CodeGen,
+    joiner: str,
+    empty: str,
+    operand: Iterable[Operator],
+    subject: _Subject,
+) -> str:
+    parts = [_gen(gen, op, subject) for op in operand]
+    if len(parts) == 0:
+        return empty
+    return "(" + f" {joiner} ".join(parts) + ")"
+
+
+def _gen(gen: _CodeGen, operator: Operator, subject: _Subject) -> str:
+    if isinstance(operator, MatchKeyValue):
+        return _gen_kv(gen, operator, subject)
+
+    cmp = _COMPARISONS.get(type(operator))
+    if cmp is not None:
+        return f"({subject.value} {cmp} {gen.const(operator.value)})"
+
+    if isinstance(operator, CmpIn):
+        return f"({subject.value} in {gen.const(operator.values)})"
+
+    if isinstance(operator, CmpNotIn):
+        return f"({subject.value} not in {gen.const(operator.values)})"
+
+    if isinstance(operator, LogicalAnd):
+        return _gen_logical(gen, "and", "True", operator.value, subject)
+
+    if isinstance(operator, LogicalOr):
+        return _gen_logical(gen, "or", "False", operator.value, subject)
+
+    if isinstance(operator, LogicalNot):
+        return f"(not {_gen(gen, operator.value, subject)})"
+
+    if isinstance(operator, LogicalNor):
+        return _gen(gen, operator.value, subject)
+
+    if isinstance(operator, Exists):
+        if subject.exists is None:
+            raise ValueError("ExistsOperator can only be used with an ItemValueWrapper")
+        if operator.value:
+            return subject.exists
+        return f"(not {subject.exists})"
+
+    if isinstance(operator, Constant):
+        return "True" if operator.value else "False"
+
+    if isinstance(operator, Ranges):
+        return f"{gen.const(operator.contains)}({subject.value})"
+
+    raise ValueError(f"operator '{type(operator)}' has no known compilation logic")
+
+
+def source(matchers: Iterable[Operator]) -> tuple[str, dict[str, Any]]:
+    """
+    returns the generated source and the namespace it must be executed in.
+    mostly useful for debugging; see `compile`.
+    """
+    gen = _CodeGen()
+    body = _gen_logical(gen, "and", "True", matchers, _Subject("item", None))
+
+    lines = ["def _compiled(item):"]
+    if gen.uses_item_as_dict:
+        lines.append("    if not isinstance(item, dict):")
+        lines.append(
+            "        raise ValueError('KeyValueOperator can only be used with a dict')"
+        )
+    lines.append(f"    return {body}")
+
+    namespace = {
+        **gen.namespace,
+        "_MISSING": _MISSING,
+    }
+    return "\n".join(lines) + "\n", namespace
+
+
+def compile(matchers: Iterable[Operator]) -> Callable[[dict], bool]:
+    """
+    compiles the output of `deserialize` into a predicate equivalent to
+    `lambda item: match(item, matchers)`.
+    """
+    matchers = list(matchers)
+    try:
+        code, namespace = source(matchers)
+        exec(builtins.compile(code, "<pyquerymatch>", "exec"), namespace)
+    except (MemoryError, RecursionError, SyntaxError):
+        # trees nested deeper than the parser allows; use the interpreter.
+        logger.warning("query too deep to compile, falling back to match()")
+        return lambda item: match(item, matchers)
+    return namespace["_compiled"]
+
+
+class CompiledQuery:
+    """
+    a compiled predicate that can be pickled, e.g. to ship to worker
+    processes. only the operators are pickled, the predicate is compiled
+    again on unpickling.
+    """
+
+    def __init__(self, matchers: Iterable[Operator]):
+        self.matchers = list(matchers)
+        self._compiled = compile(self.matchers)
+
+    def __call__(self, item: dict) -> bool:
+        return self._compiled(item)
+
+    def __getstate__(self) -> dict:
+        return {"matchers": self.matchers}
+
+    def __setstate__(self, state: dict):
+        self.__init__(state["matchers"])
@@ -0,0 +1,250 @@
+"""
+sql dialects for `build`: how each database spells parameters, json paths,
+list sub-queries and the indexes that serve them.
+
+json paths are emitted in the form each database can match against an
+expression index, cast by the type of the value they are compared to where
+the database needs it (see `IndexHint` and `query.index_ddl`).
+"""
+
+import re
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Any
+
+NUMBER = "number"
+BOOLEAN = "boolean"
+STRING = "string"
+# strings too long for the indexed (fixed length) form of a dialect.
+TEXT = "text"
+
+_PLAIN_SEGMENT = re.compile("[A-Za-z0-9_]+")
+_UNCLEAN_NAME_CHARS = re.compile("[^a-zA-Z0-9]+")
+
+# postgres truncates longer identifiers.
+_MAX_NAME = 63
+
+
+def kind(value: Any) -> str | None:
+    """
+    the type family a json value is compared as, None if mixed or unknown.
+    """
+    if isinstance(value, list):
+        kinds = {kind(x) for x in value}
+        return kinds.pop() if len(kinds) == 1 else None
+    if isinstance(value, bool):
+        return BOOLEAN
+    if isinstance(value, (int, float)):
+        return NUMBER
+    if isinstance(value, str):
+        return STRING
+    return None
+
+
+def _literal(text: str) -> str:
+    return "'" + text.replace("'", "''") + "'"
+
+
+@dataclass
+class IndexHint:
+    # what the index is on, for its name.
+    key: str
+    # an expression as it appears in queries, or a column for `gin`.
+    expression: str
+    # a plain column rather than an expression.
+    column: bool = False
+    # a containment (jsonb_path_ops) index on the column.
+    gin: bool = False
+
+
+class Dialect(ABC):
+    name: str = ""
+    # whether $eq on json paths is rewritten to containment (see `contains`).
+    containment: bool = False
+
+    def param(self, name: str) -> str:
+        return f":{name}"
+
+    def kind(self, value: Any) -> str | None:
+        """
+        the type family `value` is compared as, see `kind`.
+        """
+        return kind(value)
+
+    def indexable(self, value_kind: str | None) -> bool:
+        """
+        whether an index can be declared on a json path cast as `value_kind`.
+        """
+        return True
+
+    @abstractmethod
+    def json_ref(self, column: str, path: list[str], value_kind: str | None) -> str:
+        """
+        the expression for `path` within the json `column`, compared to values
+        of `value_kind`.
+        """
+
+    @abstractmethod
+    def contains(self, column: str, param: str) -> str:
+        """
+        whether the json `column` contains the bound json document `param`,
+        used for $eq with `containment`.
+        """
+
+    def json_list(self, param: str) -> str | None:
+        """
+        a sub-query over the elements of a bound json array, None if unsupported.
+        """
+        return None
+
+    def values(self, binds: list[str]) -> str:
+        return "values " + ", ".join([f"({x})" for x in binds])
+
+    def index_name(self, table: str, hint: IndexHint) -> str:
+        name = f"ix_{table}_{hint.key}"
+        return _UNCLEAN_NAME_CHARS.sub("_", name).strip("_")[:_MAX_NAME]
+
+    def ddl(self, table: str, hint: IndexHint) -> str:
+        name = self.index_name(table, hint)
+        if hint.column:
+            return f"create index if not exists {name} on {table} ({hint.expression})"
+        return f"create index if not exists {name} on {table} (({hint.expression}))"
+
+
+class SqliteDialect(Dialect):
+    name = "sqlite"
+
+    def json_ref(self, column: str, path: list[str], value_kind: str | None) -> str:
+        # ->> returns sql values of the json type, nothing to cast.
+        return f"{column}->>{_literal('$.' + '.'.join(path))}"
+
+    def contains(self, column: str, param: str) -> str:
+        raise ValueError("sqlite has no json containment")
+
+    def json_list(self, param: str) -> str | None:
+        return f"select value from json_each({param})"
+
+
+class PostgresDialect(Dialect):
+    """
+    postgres (psycopg parameters), over jsonb columns.
+
+    with `containment`, $eq on a json path becomes `column @> document`, which
+    a gin index serves for every path of the column at once. like mongodb, and
+    unlike `match`, containment also matches arrays holding the value.
+
+    casts only apply to values of the json type they cast to, others are null,
+    so rows holding a different type at the path never make the cast fail.
+    """
+
+    name = "postgres"
+
+    def __init__(self, containment: bool = True):
+        self.containment = containment
+
+    def param(self, name: str) -> str:
+        return f"%({name})s"
+
+    def json_ref(self, column: str, path: list[str], value_kind: str | None) -> str:
+        if len(path) == 1:
+            (value, ref) = (f"{column}->", f"{column}->>")
+            literal = _literal(path[0])
+        else:
+            segments = [
+                x
+                if _PLAIN_SEGMENT.fullmatch(x)
+                else '"' + re.sub(r'(["\\])', r"\\\1", x) + '"'
+                for x in path
+            ]
+            (value, ref) = (f"{column} #> ", f"{column} #>> ")
+            literal = _literal("{" + ",".join(segments) + "}")
+        (value, ref) = (value + literal, ref + literal)
+
+        if value_kind == NUMBER:
+            return (
+                f"(case jsonb_typeof({value}) when 'number' then ({ref})::numeric end)"
+            )
+        if value_kind == BOOLEAN:
+            return (
+                f"(case jsonb_typeof({value}) when 'boolean' then ({ref})::boolean end)"
+            )
+        return ref
+
+    def contains(self, column: str, param: str) -> str:
+        return f"{column} @> {param}::jsonb"
+
+    def ddl(self, table: str, hint: IndexHint) -> str:
+        if hint.gin:
+            name = self.index_name(table, hint)
+            return (
+                f"create index if not exists {name} on {table}"
+                f" using gin ({hint.expression} jsonb_path_ops)"
+            )
+        return super().ddl(table, hint)
+
+
+class MysqlDialect(Dialect):
+    """
+    mysql 8 (mysqlclient / pymysql parameters), over json columns.
+
+    json paths are cast the way a functional index has to declare them, so
+    the index applies to the queries. strings are indexed as their first
+    `string_length` characters, which compares exactly against shorter
+    strings; comparisons with longer ones use the whole (unindexed) value.
+    """
+
+    name = "mysql"
+
+    def __init__(self, string_length: int = 255):
+        self.string_length = string_length
+
+    def param(self, name: str) -> str:
+        return f"%({name})s"
+
+    def kind(self, value: Any) -> str | None:
+        value_kind = kind(value)
+        if value_kind == STRING:
+            values = value if isinstance(value, list) else [value]
+            if any(len(x) >= self.string_length for x in values):
+                return TEXT
+        return value_kind
+
+    def indexable(self, value_kind: str | None) -> bool:
+        # text (longtext) cannot be indexed without a prefix.
+        return value_kind != TEXT
+
+    def json_ref(self, column: str, path: list[str], value_kind: str | None) -> str:
+        literal = _literal("$." + ".".join(path))
+        ref = f"{column}->>{literal}"
+        if value_kind == NUMBER:
+            return f"cast({ref} as double)"
+        if value_kind == BOOLEAN:
+            # ->> gives 'true' / 'false' text, compare the json value instead.
+            value = f"{column}->{literal}"
+            return (
+                f"(case json_type({value}) when 'BOOLEAN'"
+                f" then {value} = cast('true' as json) end)"
+            )
+        if value_kind == STRING:
+            return f"cast({ref} as char({self.string_length})) collate utf8mb4_bin"
+        if value_kind == TEXT:
+            return f"cast({ref} as char) collate utf8mb4_bin"
+        return ref
+
+    def contains(self, column: str, param: str) -> str:
+        return f"json_contains({column}, {param})"
+
+    def values(self, binds: list[str]) -> str:
+        return "values " + ", ".join([f"row({x})" for x in binds])
+
+    def ddl(self, table: str, hint: IndexHint) -> str:
+        # no `if not exists` for indexes.
+        name = self.index_name(table, hint)
+        if hint.column:
+            return f"create index {name} on {table} ({hint.expression})"
+        return f"create index {name} on {table} (({hint.expression}))"
+
+
+SQLITE = SqliteDialect()
+POSTGRES = PostgresDialect()
+MYSQL = MysqlDialect()
@@ -0,0 +1,261 @@
+"""
+matching raw NDJSON lines while decoding only the fields a query reads.
+
+`RawMatcher` collects the top level fields each top level clause of a query
+needs, finds them in the line with byte searches, and decodes just their
+values; the rest of the line is skipped, not parsed. clauses are evaluated as
+their fields are decoded, so a record is rejected as soon as one of them
+fails, without touching the fields of later ones.
+
+a field is found by searching for its quoted name followed by a colon,
+outside of any string and directly in the top level object. the nesting
+depth at a candidate is counted from the brackets before it, which is only
+exact when no string holds an escape or a bracket: lines with a backslash
+are parsed in full, and so are those where a bracket turns up inside a
+string before the last field read. lines are not otherwise validated, so
+malformed json may match where `json.loads` would raise.
+"""
+
+import json
+import mmap
+import os
+import re
+from bisect import bisect_right
+from typing import IO, Any, Callable, Iterable, Iterator
+
+from pyquerymatch.compiler import compile
+from pyquerymatch.match import (
+    _MISSING,
+    LogicalAnd,
+    MatchKeyValue,
+    Operator,
+    deserialize,
+)
+
+_DECODER = json.JSONDecoder()
+# bytes decoded for a value at first, doubled until it fits.
+_WINDOW = 64
+_AFTER_VALUE = " \t\n\r,}]"
+_BLANK = re.compile(rb"[ \t\n\r]*")
+_OBJECT = re.compile(rb"[ \t\n\r]*\{")
+_COLON = re.compile(rb"[ \t\n\r]*:[ \t\n\r]*")
+# a name that cannot continue a string or a value, so finding it quoted
+# means its first quote opens a string.
+_PLAIN_NAME = re.compile(rb'[^"\\:,{}\[\] \t\n\r]+')
+# everything but quotes and brackets.
+_NOT_STRUCTURAL = bytes(x for x in range(256) if x not in b'"{}[]')
+
+RawLine = bytes | bytearray | memoryview
+
+
+class _Unclean(Exception):
+    """
+    a string holds a bracket, bracket depths cannot be counted.
+    """
+
+
+class _Line:
+    """
+    a line being searched, with the depths known at positions in it.
+    """
+
+    __slots__ = ("data", "positions", "depths")
+
+    def __init__(self, data: bytes):
+        self.data = data
+        # sorted, every position is outside of strings.
+        self.positions = [0]
+        self.depths = [0]
+
+    def depth(self, pos: int) -> int:
+        """
+        the bracket depth at `pos`, which must be outside of strings.
+        """
+        idx = bisect_right(self.positions, pos) - 1
+        start = self.positions[idx]
+        depth = self.depths[idx]
+        if start == pos:
+            return depth
+
+        structure = self.data[start:pos].translate(None, _NOT_STRUCTURAL)
+        # strings without brackets are left as pairs of quotes.
+        structure = structure.replace(b'""', b"")
+        if b'"' in structure:
+            raise _Unclean()
+        depth += (
+            structure.count(b"{")
+            + structure.count(b"[")
+            - structure.count(b"}")
+            - structure.count(b"]")
+        )
+        self.positions.insert(idx + 1, pos)
+        self.depths.insert(idx + 1, depth)
+        return depth
+
+    def value(self, needle: bytes, plain: bool) -> Any:
+        """
+        the value of the top level field `needle` (its quoted name), or
+        `_MISSING`. the last one wins for duplicate names, as for json.loads.
+        """
+        data = self.data
+        found = -1
+        pos = data.find(needle)
+        while pos >= 0:
+            end = pos + len(needle)
+            colon = _COLON.match(data, end)
+            if (
+                colon is not None
+                and (plain or data.count(b'"', 0, pos) % 2 == 0)
+                and self.depth(pos) == 1
+            ):
+                found = colon.end()
+            # the closing quote may open the next candidate.
+            pos = data.find(needle, end - 1)
+
+        if found < 0:
+            return _MISSING
+        return _decode(data, found)
+
+
+def _decode(data: bytes, start: int) -> Any:
+    """
+    the json value starting at `start`, decoding a window after it that grows
+    until the value ends inside of it, rather than the rest of the line.
+    """
+    size = _WINDOW
+    while True:
+        end = start + size
+        if end >= len(data):
+            (value, _) = _DECODER.raw_decode(data[start:].decode())
+            return value
+        # not in the middle of a utf-8 sequence.
+        while data[end] & 0xC0 == 0x80:
+            end -= 1
+        text = data[start:end].decode()
+        try:
+            (value, stop) = _DECODER.raw_decode(text)
+        except json.JSONDecodeError:
+            pass
+        else:
+            # a number may continue past the window ("2." of "2.5").
+            if stop < len(text) and text[stop] in _AFTER_VALUE:
+                return value
+        size *= 2
+
+
+def _fields(operator: Operator) -> list[str]:
+    """
+    the top level fields `operator` reads, in order of appearance.
+    """
+    result: dict[str, None] = {}
+    stack = [operator]
+    while stack:
+        operator = stack.pop()
+        if isinstance(operator, MatchKeyValue):
+            # nested fields are read from the decoded value.
+            result[operator.path.segments[0]] = None
+            continue
+        value = getattr(operator, "value", None)
+        if isinstance(value, Operator):
+            stack.append(value)
+        elif isinstance(value, list):
+            stack.extend(reversed([x for x in value if isinstance(x, Operator)]))
+    return list(result)
+
+
+class RawMatcher:
+    """
+    a predicate over NDJSON lines (bytes, bytearray or memoryview), which
+    decodes only the fields `matchers` read, equivalent to
+    `lambda line: match(json.loads(line), matchers)` for valid json.
+    """
+
+    def __init__(self, matchers: Iterable[Operator]):
+        matchers = list(matchers)
+        clauses: list[Operator] = []
+        stack = list(reversed(matchers))
+        while stack:
+            operator = stack.pop()
+            if isinstance(operator, LogicalAnd):
+                stack.extend(reversed(operator.value))
+            else:
+                clauses.append(operator)
+
+        self._test = compile(matchers)
+        # per clause, its predicate and the fields not read by earlier ones.
+        self._clauses: list[tuple[Callable[[dict], bool], list]] = []
+        seen: set[str] = set()
+        for clause in clauses:
+            fields = []
+            for name in _fields(clause):
+                if name in seen:
+                    continue
+                seen.add(name)
+                needle = json.dumps(name, ensure_ascii=False).encode()
+                plain = _PLAIN_NAME.fullmatch(name.encode()) is not None
+                fields.append((name, needle, plain))
+            self._clauses.append((compile([clause]), fields))
+        self.fields = [x for _, fields in self._clauses for x, _, _ in fields]
+
+    def __call__(self, line: RawLine) -> bool:
+        if not isinstance(line, bytes):
+            line = bytes(line)
+        if b"\\" in line or _OBJECT.match(line) is None:
+            return self._test(json.loads(line))
+
+        searched = _Line(line)
+        record: dict[str, Any] = {}
+        try:
+            for test, fields in self._clauses:
+                for name, needle, plain in fields:
+                    value = searched.value(needle, plain)
+                    if value is not _MISSING:
+                        record[name] = value
+                if not test(record):
+                    return False
+        except _Unclean:
+            return self._test(json.loads(line))
+        return True
+
+
+def mmap_lines(path: str | os.PathLike) -> Iterator[bytes]:
+    """
+    the lines of the file at `path` (including their terminators), read
+    through a memory map rather than buffered reads.
+    """
+    with open(path, "rb") as fp:
+        if os.fstat(fp.fileno()).st_size == 0:
+            return
+        with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            find = mapped.find
+            start = 0
+            size = len(mapped)
+            while start < size:
+                end = find(b"\n", start)
+                end = size if end < 0 else end + 1
+                yield mapped[start:end]
+                start = end
+
+
+def filter_raw(
+    source: Iterable[RawLine] | IO[bytes] | str | os.PathLike,
+    query: dict[str, Any] | Iterable[Operator],
+) -> Iterator[RawLine]:
+    """
+    lazily yields the NDJSON lines from `source` matching `query`, as read.
+
+    `source` may be a path (read through `mmap_lines`), a binary file handle,
+    or an iterable of lines. see `RawMatcher` for how lines are matched.
+    """
+    if isinstance(query, dict):
+        query = deserialize(query)
+    test = RawMatcher(query)
+
+    if isinstance(source, (str, os.PathLike)):
+        source = mmap_lines(source)
+
+    for line in source:
+        if _BLANK.fullmatch(line) is not None:
+            continue
+        if test(line):
+            yield line
@@ -0,0 +1,148 @@
+"""
+keeping the result of a query over a changing collection up to date.
+
+`LiveQuery` holds the records matching a query, keyed by a caller chosen key,
+and takes change events `(old, new)` as they happen: `(None, new)` for an
+insert, `(old, None)` for a delete and both for an update. only the changed
+record is evaluated, and an update is skipped entirely when none of the paths
+the query reads differ between `old` and `new`, so the cost of a change does
+not depend on the size of the collection. `old` has to be the record as it
+was before the change, not the same (mutated) dict as `new`.
+
+a query raising for a record (e.g. ordering a missing value) is treated as
+not matching it, as in `QueryIndex`.
+"""
+
+from dataclasses import dataclass
+from operator import itemgetter
+from typing import Any, Callable, Hashable, Iterable, Iterator
+
+from pyquerymatch.compiler import compile
+from pyquerymatch.match import FieldPath, Operator, fields
+
+ENTERED = "entered"
+LEFT = "left"
+
+_ERROR = object()
+
+
+@dataclass(frozen=True, slots=True)
+class Event:
+    # ENTERED or LEFT.
+    kind: str
+    key: Hashable
+    # the record as it entered, or its last version when it left.
+    item: dict
+
+
+class LiveQuery:
+    """
+    the records matching `matchers`, kept up to date by `apply`.
+
+    `items` are the records the collection starts with, `key` returns the
+    identity of a record (its `_id` by default), and `listener`, if given, is
+    called with every event as it happens.
+    """
+
+    def __init__(
+        self,
+        matchers: Iterable[Operator],
+        items: Iterable[dict] = (),
+        key: Callable[[dict], Hashable] = itemgetter("_id"),
+        listener: Callable[[Event], Any] | None = None,
+    ):
+        matchers = list(matchers)
+        self._test = compile(matchers)
+        self._paths = [FieldPath(x) for x in fields(matchers)]
+        self.key = key
+        self.listener = listener
+        self.matching: dict[Hashable, dict] = {}
+        self.evaluated = 0
+        self.skipped = 0
+
+        for item in items:
+            if self._match(item):
+                self.matching[key(item)] = item
+
+    def _match(self, item: dict) -> bool:
+        self.evaluated += 1
+        try:
+            return bool(self._test(item))
+        except (TypeError, ValueError):
+            return False
+
+    def _resolve(self, path: FieldPath, item: dict) -> Any:
+        try:
+            return path.resolve(item)
+        except ValueError:
+            return _ERROR
+
+    def _unchanged(self, old: dict, new: dict) -> bool:
+        """
+        whether `old` and `new` agree on every path the query reads.
+        """
+        for path in self._paths:
+            a = self._resolve(path, old)
+            b = self._resolve(path, new)
+            if a is not b and a != b:
+                return False
+        return True
+
+    def _put(self, key: Hashable, item: dict, events: list[Event]):
+        if self._match(item):
+            if key not in self.matching:
+                events.append(Event(ENTERED, key, item))
+            self.matching[key] = item
+        elif key in self.matching:
+            del self.matching[key]
+            events.append(Event(LEFT, key, item))
+
+    def apply(self, old: dict | None, new: dict | None) -> list[Event]:
+        """
+        applies one change, returning the events it caused: none, one, or a
+        LEFT and an ENTERED for an update that changes the key.
+        """
+        events: list[Event] = []
+        if old is not None and new is not None:
+            key = self.key(new)
+            if self.key(old) == key:
+                if self._unchanged(old, new):
+                    self.skipped += 1
+                    if key in self.matching:
+                        self.matching[key] = new
+                else:
+                    self._put(key, new, events)
+                return self._notify(events)
+
+        if old is not None:
+            key = self.key(old)
+            item = self.matching.pop(key, None)
+            if item is not None:
+                events.append(Event(LEFT, key, item))
+        if new is not None:
+            self._put(self.key(new), new, events)
+        return self._notify(events)
+
+    def _notify(self, events: list[Event]) -> list[Event]:
+        if self.listener is not None:
+            for event in events:
+                self.listener(event)
+        return events
+
+    def insert(self, item: dict) -> list[Event]:
+        return self.apply(None, item)
+
+    def update(self, old: dict, new: dict) -> list[Event]:
+        return self.apply(old, new)
+
+    def delete(self, item: dict) -> list[Event]:
+        return self.apply(item, None)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.matching
+
+    def __len__(self) -> int:
+        return len(self.matching)
+
+    def __iter__(self) -> Iterator[dict]:
+        return iter(self.matching.values())
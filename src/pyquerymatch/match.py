@@ -6,7 +6,8 @@ TODO:
 
 import logging
 from abc import ABC, abstractmethod
-from dataclasses import dataclass
+from bisect import bisect_left
+from dataclasses import dataclass, field
 from typing import (
     Any,
     Generator,
@@ -34,6 +35,8 @@ CT = TypeVar("CT", bound=Comparable)
 
 
 class ItemValueWrapper(Generic[T]):
+    __slots__ = ("item", "exists", "value")
+
     def __init__(self, item: dict, exists: bool, value: T | None):
         self.item = item
 
@@ -47,7 +50,66 @@ def _unwrap(value: T | ItemValueWrapper[T] | None) -> T | None:
     return value
 
 
+class ValueSet:
+    """
+    membership over the values of an `$in`/`$nin` list.
+
+    hashable values are looked up in a frozenset; anything unhashable is kept
+    sorted for bisection where possible, and scanned otherwise. equality is
+    the same as for a list, including `True == 1` and `1 == 1.0`.
+    """
+
+    __slots__ = ("hashed", "unhashable", "ordered")
+
+    def __init__(self, values: Iterable[Any]):
+        hashable = []
+        unhashable = []
+        for value in values:
+            try:
+                hash(value)
+            except TypeError:
+                unhashable.append(value)
+            else:
+                hashable.append(value)
+
+        self.hashed = frozenset(hashable)
+        try:
+            self.unhashable = sorted(unhashable)
+            self.ordered = True
+        except TypeError:
+            self.unhashable = unhashable
+            self.ordered = False
+
+    def __contains__(self, value: Any) -> bool:
+        try:
+            return value in self.hashed
+        except TypeError:
+            # unhashable, can only be equal to one of our unhashable values.
+            pass
+
+        if self.ordered:
+            try:
+                idx = bisect_left(self.unhashable, value)
+            except TypeError:
+                return value in self.unhashable
+            return idx < len(self.unhashable) and self.unhashable[idx] == value
+
+        return value in self.unhashable
+
+    def __len__(self) -> int:
+        return len(self.hashed) + len(self.unhashable)
+
+
 class Operator(ABC):
+    """
+    a node of a deserialized query.
+
+    the operators here are frozen and slotted: they are shared between
+    threads and caches, and a process may keep many thousands of them.
+    """
+
+    __slots__ = ()
+
     operator: str
     basic_sql_operator: str | None = None
     logical_sql_operator: str | None = None
@@ -57,7 +119,20 @@ class Operator(ABC):
         pass
 
 
-@dataclass
+def _reduce_init_fields(operator: Operator) -> tuple:
+    """
+    pickles an operator as its constructor arguments, so derived fields (value
+    sets, paths) are rebuilt when unpickled rather than carried along.
+    """
+    values = [
+        getattr(operator, x.name)
+        for x in operator.__dataclass_fields__.values()
+        if x.init
+    ]
+    return type(operator), tuple(values)
+
+
+@dataclass(frozen=True, slots=True)
 class CmpEqual(Generic[CT], Operator):
     operator = "$eq"
     basic_sql_operator = "="
@@ -67,7 +142,7 @@ class CmpEqual(Generic[CT], Operator):
         return _unwrap(value) == self.value
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class CmpGreaterThan(Generic[CT], Operator):
     operator = "$gt"
     basic_sql_operator = ">"
@@ -77,7 +152,7 @@ class CmpGreaterThan(Generic[CT], Operator):
         return _unwrap(value) > self.value
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class CmpGreaterThanOrEqual(Generic[CT], Operator):
     operator = "$gte"
     basic_sql_operator = ">="
@@ -87,17 +162,23 @@ class CmpGreaterThanOrEqual(Generic[CT], Operator):
         return _unwrap(value) >= self.value
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class CmpIn(Generic[CT], Operator):
     operator = "$in"
     basic_sql_operator = "in"
     value: list[CT]
+    values: ValueSet = field(init=False, repr=False, compare=False)
+
+    __reduce__ = _reduce_init_fields
+
+    def __post_init__(self):
+        object.__setattr__(self, "values", ValueSet(self.value))
 
     def match(self, value: CT | ItemValueWrapper[CT] | None) -> bool:
-        return _unwrap(value) in self.value
+        return _unwrap(value) in self.values
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class CmpLessThan(Generic[CT], Operator):
     operator = "$lt"
     basic_sql_operator = "<"
@@ -107,7 +188,7 @@ class CmpLessThan(Generic[CT], Operator):
         return _unwrap(value) < self.value
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class CmpLessThanOrEqual(Generic[CT], Operator):
     operator = "$lte"
     basic_sql_operator = "<="
@@ -117,7 +198,7 @@ class CmpLessThanOrEqual(Generic[CT], Operator):
         return _unwrap(value) <= self.value
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class CmpNotEqual(Generic[CT], Operator):
     operator = "$ne"
     basic_sql_operator = "!="
@@ -127,27 +208,37 @@ class CmpNotEqual(Generic[CT], Operator):
         return _unwrap(value) != self.value
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class CmpNotIn(Generic[CT], Operator):
     operator = "$nin"
     basic_sql_operator = "not in"
     value: list[CT]
+    values: ValueSet = field(init=False, repr=False, compare=False)
+
+    __reduce__ = _reduce_init_fields
+
+    def __post_init__(self):
+        object.__setattr__(self, "values", ValueSet(self.value))
 
     def match(self, value: CT | ItemValueWrapper[CT] | None) -> bool:
-        return _unwrap(value) not in self.value
+        return _unwrap(value) not in self.values
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class LogicalAnd(Generic[CT], Operator):
     operator = "$and"
     logical_sql_operator = "and"
     value: list[Operator]
 
     def match(self, theirs: CT | ItemValueWrapper[CT] | None) -> bool:
-        return all(op.match(theirs) for op in self.value)
+        # a loop rather than all(), which allocates a generator per call.
+        for op in self.value:
+            if not op.match(theirs):
+                return False
+        return True
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class LogicalNot(Generic[CT], Operator):
     operator = "$not"
     value: Operator
@@ -156,28 +247,32 @@ class LogicalNot(Generic[CT], Operator):
         return not self.value.match(theirs)
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class LogicalNor(Generic[CT], Operator):
     operator = "$nor"
+    value: LogicalNot
 
     def __init__(self, value: list[Operator]):
-        self.value = LogicalNot(LogicalOr(value))
+        object.__setattr__(self, "value", LogicalNot(LogicalOr(value)))
 
     def match(self, theirs: CT | ItemValueWrapper[CT] | None) -> bool:
         return self.value.match(theirs)
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class LogicalOr(Generic[CT], Operator):
     operator = "$or"
     logical_sql_operator = "or"
     value: list[Operator]
 
     def match(self, theirs: CT | ItemValueWrapper[CT] | None) -> bool:
-        return any(op.match(theirs) for op in self.value)
+        for op in self.value:
+            if op.match(theirs):
+                return True
+        return False
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Exists(Generic[CT], Operator):
     operator = "$exists"
     value: bool
@@ -189,48 +284,225 @@ class Exists(Generic[CT], Operator):
         return item.exists == self.value
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
+class Constant(Operator):
+    """
+    always (or never) matches. not part of the query notation, this is what
+    the optimizer folds trivially true (or false) subtrees into.
+    """
+
+    operator = "$const"
+    value: bool
+
+    def match(self, theirs: ...) -> bool:
+        return self.value
+
+
+def _ranges_table(
+    intervals: Iterable[tuple[Any, bool, Any, bool]],
+) -> tuple[list, list[bool], list[bool]]:
+    """
+    the sorted bounds of `intervals`, whether each bound is inside any of
+    them, and whether each gap between (and around) the bounds is.
+    """
+    intervals = list(intervals)
+    points = sorted(
+        {x for lo, _, hi, _ in intervals for x in (lo, hi) if x is not None}
+    )
+    # counts of intervals starting / ending inside, summed up below.
+    at_count = [0] * (len(points) + 1)
+    between_count = [0] * (len(points) + 2)
+    at = [False] * len(points)
+    for lo, lo_inclusive, hi, hi_inclusive in intervals:
+        start = -1 if lo is None else bisect_left(points, lo)
+        end = len(points) if hi is None else bisect_left(points, hi)
+        if start >= end:
+            # empty, or a single point.
+            if start == end and lo_inclusive and hi_inclusive:
+                at[start] = True
+            continue
+        # the points strictly inside, and gap `idx` between points `idx - 1`
+        # and `idx` for the gaps inside.
+        at_count[start + 1] += 1
+        at_count[end] -= 1
+        between_count[start + 1] += 1
+        between_count[end + 1] -= 1
+        if lo is not None and lo_inclusive:
+            at[start] = True
+        if hi is not None and hi_inclusive:
+            at[end] = True
+
+    between = []
+    (inside, count) = (0, 0)
+    for idx in range(len(points) + 1):
+        count += between_count[idx]
+        between.append(count > 0)
+        if idx < len(points):
+            inside += at_count[idx]
+            at[idx] = at[idx] or inside > 0
+    return points, at, between
+
+
+@dataclass(frozen=True, slots=True)
+class Ranges(Operator):
+    """
+    a value within any of a set of intervals, found with a single bisection.
+    not part of the query notation, this is what the optimizer merges bounds
+    on the same field under an $or into.
+
+    `value` holds sorted, disjoint `(lo, lo_inclusive, hi, hi_inclusive)`
+    intervals, where a None bound is unbounded. like the bounds it replaces,
+    it raises for values that cannot be ordered against them.
+    """
+
+    operator = "$ranges"
+    value: tuple[tuple[Any, bool, Any, bool], ...]
+    points: list = field(init=False, repr=False, compare=False)
+    at: list[bool] = field(init=False, repr=False, compare=False)
+    between: list[bool] = field(init=False, repr=False, compare=False)
+
+    __reduce__ = _reduce_init_fields
+
+    def __post_init__(self):
+        (points, at, between) = _ranges_table(self.value)
+        if len(points) == 0:
+            raise ValueError("ranges must have at least one bound")
+        object.__setattr__(self, "points", points)
+        object.__setattr__(self, "at", at)
+        object.__setattr__(self, "between", between)
+
+    def contains(self, value: Any) -> bool:
+        idx = bisect_left(self.points, value)
+        if idx < len(self.points) and self.points[idx] == value:
+            return self.at[idx]
+        # nan is within no interval, but sorts before everything.
+        if value != value:
+            return False
+        return self.between[idx]
+
+    def match(self, value: Any | ItemValueWrapper[Any] | None) -> bool:
+        return self.contains(_unwrap(value))
+
+    def expand(self) -> Operator:
+        """
+        the same intervals as an $or of bounds, for evaluators without a
+        use for the bisection.
+        """
+        children: list[Operator] = []
+        for lo, lo_inclusive, hi, hi_inclusive in self.value:
+            bounds: list[Operator] = []
+            if lo is not None:
+                cls = CmpGreaterThanOrEqual if lo_inclusive else CmpGreaterThan
+                bounds.append(cls(lo))
+            if hi is not None:
+                cls = CmpLessThanOrEqual if hi_inclusive else CmpLessThan
+                bounds.append(cls(hi))
+            children.append(bounds[0] if len(bounds) == 1 else LogicalAnd(bounds))
+        return children[0] if len(children) == 1 else LogicalOr(children)
+
+
+# sentinel for values absent from an item, distinct from an explicit None.
+_MISSING = object()
+
+
+class FieldPath:
+    """
+    a dot notation path, split once up front so lookups do no string work.
+    """
+
+    __slots__ = ("path", "segments", "parents", "leaf")
+
+    def __init__(self, path: str):
+        # TODO: support array indexing
+        segments = tuple(path.split("."))
+        if any(len(x) == 0 for x in segments):
+            raise ValueError(f"improper Dot Notation ({path})")
+
+        self.path = path
+        self.segments = segments
+        self.parents = segments[:-1]
+        self.leaf = segments[-1]
+
+    def resolve(self, item: dict) -> Any:
+        """
+        returns the value at the path, or `_MISSING` if it does not exist.
+        """
+        for segment in self.parents:
+            item = item.get(segment, None)
+
+            # exception: we are None
+            if item is None:
+                return _MISSING
+
+            # exception: item not a dict.
+            if not isinstance(item, dict):
+                raise ValueError(
+                    f"attempting to use dot notation on non-dict (path: {self.path})"
+                )
+
+        return item.get(self.leaf, _MISSING)
+
+    def __repr__(self) -> str:
+        return f"FieldPath({self.path!r})"
+
+
+def _contains(operator: Operator, types: tuple[Type[Operator], ...]) -> bool:
+    stack = [operator]
+    while stack:
+        operator = stack.pop()
+        if isinstance(operator, types):
+            return True
+        value = getattr(operator, "value", None)
+        if isinstance(value, Operator):
+            stack.append(value)
+        elif isinstance(value, list):
+            stack.extend(x for x in value if isinstance(x, Operator))
+    return False
+
+
+@dataclass(frozen=True, slots=True)
 class MatchKeyValue(Generic[CT], Operator):
     operator = "$kv"
     key: str
     value: Operator
+    path: FieldPath = field(init=False, repr=False, compare=False)
+    _wrap: bool = field(init=False, repr=False, compare=False)
+
+    __reduce__ = _reduce_init_fields
+
+    def __post_init__(self):
+        object.__setattr__(self, "path", FieldPath(self.key))
+        # only operators that care about existence (or need to reject being
+        # handed a field) see the wrapper, the rest get the bare value.
+        object.__setattr__(
+            self, "_wrap", _contains(self.value, (Exists, MatchKeyValue))
+        )
 
     @staticmethod
     def extract(
         item: dict | None, path: str, /, original_item: dict, original_path: str
     ) -> ItemValueWrapper:
-        # TODO: support array indexing
-
-        if len(path) == 0:
-            raise ValueError(f"improper Dot Notation ({original_path})")
-
-        if "." not in path:
-            return ItemValueWrapper(original_item, path in item, item.get(path, None))
-
-        # exception: we are None
         if item is None:
             return ItemValueWrapper(original_item, False, None)
 
-        # exception: item not a dict.
-        if not isinstance(item, dict):
-            raise ValueError(
-                f"attempting to use dot notation on non-dict (path: {original_path})"
-            )
-
-        (first, rest) = path.split(".", maxsplit=2)
-        return MatchKeyValue.extract(
-            item.get(first, None), rest, original_item, original_path
-        )
+        value = FieldPath(path).resolve(item)
+        if value is _MISSING:
+            return ItemValueWrapper(original_item, False, None)
+        return ItemValueWrapper(original_item, True, value)
 
     def match(self, item: dict) -> bool:
         if not isinstance(item, dict):
             raise ValueError("KeyValueOperator can only be used with a dict")
 
-        return self.value.match(
-            MatchKeyValue.extract(
-                item, self.key, original_item=item, original_path=self.key
-            )
-        )
+        value = self.path.resolve(item)
+        if self._wrap:
+            if value is _MISSING:
+                return self.value.match(ItemValueWrapper(item, False, None))
+            return self.value.match(ItemValueWrapper(item, True, value))
+
+        if value is _MISSING:
+            return self.value.match(None)
+        return self.value.match(value)
 
 
 KNOWN_VAL_OPERATORS: dict[str, Type[Operator]] = {
@@ -252,11 +524,42 @@ KNOWN_LOGICAL_OPERATORS: dict[str, Type[Operator]] = {
     LogicalOr.operator: LogicalOr,
 }
 
+# frozen dataclasses hash by their fields, which only works for operators
+# without lists in them. keep them all unhashable instead, as they were
+# before being frozen, rather than hashable depending on the query.
+for _operator in [
+    *KNOWN_VAL_OPERATORS.values(),
+    *KNOWN_LOGICAL_OPERATORS.values(),
+    MatchKeyValue,
+    Constant,
+    Ranges,
+]:
+    _operator.__hash__ = None
+del _operator
+
 _KIND_UNSET = 0
 _KIND_FIELD = 1
 _KIND_OPERATOR = 2
 
 
+def fields(matchers: Iterable[Operator]) -> list[str]:
+    """
+    the (dot notation) paths `matchers` read, sorted.
+    """
+    result: dict[str, None] = {}
+    stack = list(matchers)
+    while stack:
+        operator = stack.pop()
+        if isinstance(operator, MatchKeyValue):
+            result[operator.key] = None
+        value = getattr(operator, "value", None)
+        if isinstance(value, Operator):
+            stack.append(value)
+        elif isinstance(value, list):
+            stack.extend(x for x in value if isinstance(x, Operator))
+    return sorted(result)
+
+
 def _check_and_set_kind(kind: int, new_kind: int) -> int:
     if kind == _KIND_UNSET:
         return new_kind
@@ -267,43 +570,34 @@ def _check_and_set_kind(kind: int, new_kind: int) -> int:
     return kind
 
 
-def _at_least(
-    n: int,
-    generator: Generator[T, None, None],
-) -> Generator[T, None, None]:
-    count = 0
-    for op in generator:
-        yield op
-        count += 1
+_NO_TYPE_HINT = object()
 
-    if count < n:
-        raise ValueError(f"too few values, expected at least '{n}' values")
 
+def _value_origin(cls: Type[Operator]) -> Any:
+    try:
+        type_hints = get_type_hints(cls)["value"]
+    except KeyError:
+        return _NO_TYPE_HINT
+    return get_origin(type_hints)
 
-def _at_most(
-    n: int,
-    generator: Generator[T, None, None],
-) -> Generator[T, None, None]:
-    count = 0
-    for op in generator:
-        if count >= n:
-            raise ValueError(f"too many values, only expected '{n}' values")
 
-        yield op
-        count += 1
+# get_type_hints is far too slow to call per operator, resolve these up front.
+_VALUE_ORIGINS: dict[Type[Operator], Any] = {
+    cls: _value_origin(cls)
+    for cls in [*KNOWN_VAL_OPERATORS.values(), *KNOWN_LOGICAL_OPERATORS.values()]
+}
 
 
 def _check_value_type(
     cls: Type[Operator],
     value: Any,
 ) -> Any:
-    try:
-        type_hints = get_type_hints(cls)["value"]
-    except KeyError:
-        logger.warning("no type hint found for 'value' in class '%s'", cls)
-        return value
+    origin = _VALUE_ORIGINS.get(cls)
+    if origin is None and cls not in _VALUE_ORIGINS:
+        origin = _VALUE_ORIGINS.setdefault(cls, _value_origin(cls))
+        if origin is _NO_TYPE_HINT:
+            logger.warning("no type hint found for 'value' in class '%s'", cls)
 
-    origin = get_origin(type_hints)
     if origin == list:
         if not isinstance(value, origin):
             raise ValueError(
@@ -313,77 +607,165 @@ def _check_value_type(
     return value
 
 
+class _Frame:
+    """
+    a dict being deserialized, see `deserialize`.
+    """
+
+    __slots__ = ("items", "depth", "kind", "out", "parent", "wrap", "key")
+
+    def __init__(self, query: dict, depth: int, parent, wrap: int, key: str | None):
+        self.items = iter(query.items())
+        self.depth = depth
+        self.kind = _KIND_UNSET
+        self.out: list[Operator] = []
+        self.parent = parent
+        self.wrap = wrap
+        self.key = key
+
+
+class _ListFrame:
+    """
+    the elements of an $and / $or / $nor being deserialized.
+    """
+
+    __slots__ = ("elements", "depth", "out", "parent", "cls")
+
+    def __init__(self, elements: list, depth: int, parent: _Frame, cls):
+        self.elements = iter(elements)
+        self.depth = depth
+        self.out: list[Operator] = []
+        self.parent = parent
+        self.cls = cls
+
+
+# what the operators of a finished dict become.
+_WRAP_ROOT = 0
+_WRAP_KV = 1
+_WRAP_NOT = 2
+_WRAP_ELEMENT = 3
+
+
+def _frame(
+    query: Any, max_depth: int, depth: int, parent, wrap: int, key: str | None = None
+) -> _Frame:
+    if depth > max_depth:
+        raise ValueError(f"max depth of {max_depth} exceeded")
+    if not isinstance(query, dict):
+        raise ValueError("query must be a dict")
+
+    # every key makes exactly one operator.
+    if wrap != _WRAP_ROOT and len(query) < 1:
+        raise ValueError("too few values, expected at least '1' values")
+    if wrap == _WRAP_ELEMENT and len(query) > 1:
+        raise ValueError("too many values, only expected '1' values")
+    return _Frame(query, depth, parent, wrap, key)
+
+
+def _conjunction(operators: list[Operator]) -> Operator:
+    if len(operators) == 1:
+        return operators[0]
+    return LogicalAnd(operators)
+
+
 def deserialize(
     query: dict[str, Any], max_depth: int = 1024, /, depth=0
 ) -> Generator[Operator, None, None]:
-    if depth > max_depth:
-        raise ValueError(f"max depth of {max_depth} exceeded")
+    """
+    the operators of a query document, one per top level key.
 
-    if depth == 0 and not isinstance(query, dict):
-        raise ValueError("query must be a dict")
+    nested documents are handled with an explicit stack rather than
+    recursion, so `max_depth` is not bounded by the interpreter's recursion
+    limit, and time and memory are linear in the size of the query.
+    """
+    root = _frame(query, max_depth, depth, None, _WRAP_ROOT)
+    stack: list[_Frame | _ListFrame] = [root]
+    while stack:
+        frame = stack[-1]
+
+        if isinstance(frame, _ListFrame):
+            element = next(frame.elements, _MISSING)
+            if element is not _MISSING:
+                stack.append(
+                    _frame(element, max_depth, frame.depth + 1, frame, _WRAP_ELEMENT)
+                )
+                continue
+
+            stack.pop()
+            cls = frame.cls
+            frame.parent.out.append(cls(_check_value_type(cls, frame.out)))
 
-    kind = _KIND_UNSET
-    for key, value in query.items():
-        if key.startswith("$"):
-            kind = _check_and_set_kind(kind, _KIND_FIELD)
-
-            if key in KNOWN_VAL_OPERATORS:
-                cls = KNOWN_VAL_OPERATORS[key]
-                yield cls(_check_value_type(cls, value))
-            elif key in KNOWN_LOGICAL_OPERATORS:
-                cls = KNOWN_LOGICAL_OPERATORS[key]
-                # input for {and, or, nor} is always a list
-                if key in {
-                    LogicalAnd.operator,
-                    LogicalNor.operator,
-                    LogicalOr.operator,
-                }:
-                    if not isinstance(value, list):
-                        raise ValueError(f"'{key}' must be a list")
-                    operators = [
-                        list(
-                            _at_least(
-                                1,
-                                _at_most(
-                                    1,
-                                    deserialize(x, max_depth, depth + 1),
-                                ),
-                            )
-                        )[0]
-                        for x in value
-                    ]
-                    yield cls(_check_value_type(cls, operators))
-                # input for {not} is always a single operator
-                # if multiple are provided, 'and' the whole thing
-                elif key == LogicalNot.operator:
-                    if not isinstance(value, dict):
-                        raise ValueError(f"'{key}' must be a dict")
-                    operators = list(
-                        _at_least(1, deserialize(value, max_depth, depth + 1))
-                    )
-                    if len(operators) == 1:
-                        yield LogicalNot(operators[0])
-                    else:
-                        yield LogicalNot(LogicalAnd(operators))
-            else:
-                raise ValueError(f"unknown operator '{key}'")
         else:
-            kind = _check_and_set_kind(kind, _KIND_OPERATOR)
+            entry = next(frame.items, _MISSING)
+            if entry is not _MISSING:
+                (key, value) = entry
+                child = _deserialize_entry(frame, key, value, max_depth)
+                if child is not None:
+                    stack.append(child)
+                continue
+
+            stack.pop()
+            if frame.wrap == _WRAP_KV:
+                frame.parent.out.append(
+                    MatchKeyValue(frame.key, _conjunction(frame.out))
+                )
+            elif frame.wrap == _WRAP_NOT:
+                frame.parent.out.append(LogicalNot(_conjunction(frame.out)))
+            elif frame.wrap == _WRAP_ELEMENT:
+                frame.parent.out.append(frame.out[0])
 
-            if isinstance(value, dict):
-                operators = list(_at_least(1, deserialize(value, max_depth, depth + 1)))
-                if len(operators) == 1:
-                    yield MatchKeyValue(key, operators[0])
-                else:
-                    yield MatchKeyValue(key, LogicalAnd(operators))
+        # top level operators are handed out as soon as they are complete.
+        if len(stack) == 1 and root.out:
+            yield from root.out
+            root.out.clear()
 
-            elif isinstance(value, (int, float, str, bool, None)):
-                yield MatchKeyValue(key, CmpEqual(value))
+    yield from root.out
 
-            else:
-                raise ValueError(
-                    f"unknown value type '{type(value)}' for operator '{key}'"
-                )
+
+def _deserialize_entry(
+    frame: _Frame, key: str, value: Any, max_depth: int
+) -> _Frame | _ListFrame | None:
+    """
+    deserializes one key of `frame`, or returns the frame to continue with.
+    """
+    if key.startswith("$"):
+        frame.kind = _check_and_set_kind(frame.kind, _KIND_FIELD)
+
+        if key in KNOWN_VAL_OPERATORS:
+            cls = KNOWN_VAL_OPERATORS[key]
+            frame.out.append(cls(_check_value_type(cls, value)))
+            return None
+
+        if key in KNOWN_LOGICAL_OPERATORS:
+            cls = KNOWN_LOGICAL_OPERATORS[key]
+            # input for {and, or, nor} is always a list
+            if key in {
+                LogicalAnd.operator,
+                LogicalNor.operator,
+                LogicalOr.operator,
+            }:
+                if not isinstance(value, list):
+                    raise ValueError(f"'{key}' must be a list")
+                return _ListFrame(value, frame.depth, frame, cls)
+
+            # input for {not} is always a single operator
+            # if multiple are provided, 'and' the whole thing
+            if not isinstance(value, dict):
+                raise ValueError(f"'{key}' must be a dict")
+            return _frame(value, max_depth, frame.depth + 1, frame, _WRAP_NOT)
+
+        raise ValueError(f"unknown operator '{key}'")
+
+    frame.kind = _check_and_set_kind(frame.kind, _KIND_OPERATOR)
+
+    if isinstance(value, dict):
+        return _frame(value, max_depth, frame.depth + 1, frame, _WRAP_KV, key)
+
+    if isinstance(value, (int, float, str, bool, type(None))):
+        frame.out.append(MatchKeyValue(key, CmpEqual(value)))
+        return None
+
+    raise ValueError(f"unknown value type '{type(value)}' for operator '{key}'")
 
 
 def match(
@@ -394,4 +776,7 @@ def match(
     simply provided as a helper for a reference implementation.
     possibly deal with object wrapping in the future.
     """
-    return all(m.match(item) for m in matchers)
+    for m in matchers:
+        if not m.match(item):
+            return False
+    return True
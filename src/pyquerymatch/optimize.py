@@ -0,0 +1,537 @@
+"""
+rewrites deserialized operator trees into smaller, cheaper, equivalent ones.
+
+- $nor is replaced by the $not($or(...)) it wraps, and double negation removed
+- nested $and/$or of the same kind are flattened, duplicates removed
+- single-element $and/$or are unwrapped, empty ones folded into constants
+- constants are propagated, e.g. an $and with a false child is false
+- bounds on the same field are merged, contradictions folded to false
+- operators on the same field under an $and are merged into one lookup
+- under an $or, equality checks on the same field are merged into one $in,
+  and bounds into one `Ranges` (a single bisection) per type of value
+- children of $and/$or are ordered so cheap, deciding checks run first
+
+`match` raises on some records, e.g. when ordering a missing (None) value.
+the optimized tree gives the same result for every record the original does
+not raise on, and never raises where the original would not; where the
+original raised, it may return either result.
+"""
+
+import heapq
+from dataclasses import dataclass
+from typing import Any, Callable, Iterable
+
+from pyquerymatch.match import (
+    CmpEqual,
+    CmpGreaterThan,
+    CmpGreaterThanOrEqual,
+    CmpIn,
+    CmpLessThan,
+    CmpLessThanOrEqual,
+    CmpNotEqual,
+    CmpNotIn,
+    Constant,
+    Exists,
+    LogicalAnd,
+    LogicalNor,
+    LogicalNot,
+    LogicalOr,
+    MatchKeyValue,
+    Operator,
+    Ranges,
+    _contains,
+    _ranges_table,
+)
+from pyquerymatch.queryindex import family
+
+_ORDERING = (CmpGreaterThan, CmpGreaterThanOrEqual, CmpLessThan, CmpLessThanOrEqual)
+_LOWER = (CmpGreaterThan, CmpGreaterThanOrEqual)
+_UPPER = (CmpLessThan, CmpLessThanOrEqual)
+
+# values the optimizer reasons about; anything else is left alone.
+_PLAIN = (bool, int, float, str)
+
+
+@dataclass
+class Estimate:
+    # relative cost of evaluating the operator once.
+    cost: float
+    # probability of the operator being true.
+    selectivity: float
+
+
+def _is_plain(value: Any) -> bool:
+    return type(value) in _PLAIN
+
+
+def _key(operator: Operator) -> Any:
+    """
+    structural identity; unlike `==` on the dataclasses, `1` and `True` differ.
+    """
+
+    def typed(value: Any) -> Any:
+        if isinstance(value, Operator):
+            return _key(value)
+        if isinstance(value, list):
+            return list, tuple(typed(x) for x in value)
+        if isinstance(value, dict):
+            return dict, tuple((k, typed(v)) for k, v in value.items())
+        return type(value), value
+
+    if isinstance(operator, MatchKeyValue):
+        return MatchKeyValue, operator.key, _key(operator.value)
+    return type(operator), typed(getattr(operator, "value", None))
+
+
+def unsafe(operator: Operator) -> bool:
+    """
+    whether evaluating the operator may raise for some records; these must
+    never be moved ahead of a check that would otherwise skip them.
+    """
+    return _unsafe(operator, False)
+
+
+def _unsafe(operator: Operator, in_field: bool) -> bool:
+    if isinstance(operator, _ORDERING + (Ranges,)):
+        return True
+    if isinstance(operator, Exists):
+        # only a field hands it the wrapper it needs, elsewhere it raises.
+        return not in_field
+    if isinstance(operator, MatchKeyValue):
+        # a field nested under another one is matched against a value, not
+        # a dict, and raises.
+        return (
+            len(operator.path.parents) > 0
+            or _contains(operator.value, (MatchKeyValue,))
+            or _unsafe(operator.value, True)
+        )
+    value = getattr(operator, "value", None)
+    if isinstance(value, Operator):
+        return _unsafe(value, in_field)
+    if isinstance(value, list):
+        return any(_unsafe(x, in_field) for x in value if isinstance(x, Operator))
+    return False
+
+
+def estimate(operator: Operator) -> Estimate:
+    if isinstance(operator, Constant):
+        return Estimate(0.0, 1.0 if operator.value else 0.0)
+
+    if isinstance(operator, Exists):
+        return Estimate(1.0, 0.9 if operator.value else 0.1)
+
+    if isinstance(operator, CmpEqual):
+        return Estimate(1.0, 0.1)
+
+    if isinstance(operator, CmpNotEqual):
+        return Estimate(1.0, 0.9)
+
+    if isinstance(operator, (CmpIn, CmpNotIn)):
+        p = min(0.1 * len(operator.values), 0.9)
+        return Estimate(1.5, p if isinstance(operator, CmpIn) else 1 - p)
+
+    if isinstance(operator, _ORDERING):
+        return Estimate(1.0, 0.5)
+
+    if isinstance(operator, Ranges):
+        return Estimate(1.5, min(0.3 * len(operator.value), 0.9))
+
+    if isinstance(operator, MatchKeyValue):
+        inner = estimate(operator.value)
+        return Estimate(
+            1.0 + len(operator.path.segments) + inner.cost, inner.selectivity
+        )
+
+    if isinstance(operator, LogicalNor):
+        return estimate(operator.value)
+
+    if isinstance(operator, LogicalNot):
+        inner = estimate(operator.value)
+        return Estimate(inner.cost, 1 - inner.selectivity)
+
+    if isinstance(operator, LogicalAnd):
+        return _estimate_chain([estimate(x) for x in operator.value], True)
+
+    if isinstance(operator, LogicalOr):
+        return _estimate_chain([estimate(x) for x in operator.value], False)
+
+    return Estimate(1.0, 0.5)
+
+
+def _estimate_chain(estimates: list[Estimate], conjunction: bool) -> Estimate:
+    # expected cost, given evaluation stops at the first deciding child.
+    cost = 0.0
+    reach = 1.0
+    for x in estimates:
+        cost += reach * x.cost
+        reach *= x.selectivity if conjunction else 1 - x.selectivity
+    if conjunction:
+        return Estimate(cost, reach)
+    return Estimate(cost, 1 - reach)
+
+
+def rank(estimate: Estimate, conjunction: bool) -> float:
+    """
+    cost per deciding evaluation; lower runs first.
+    """
+    decides = 1 - estimate.selectivity if conjunction else estimate.selectivity
+    if decides <= 0:
+        return float("inf")
+    return estimate.cost / decides
+
+
+def order_indices(operators: list[Operator], keys: list[float]) -> list[int]:
+    """
+    the positions of `operators` sorted by `keys`, except that an unsafe
+    operator is never moved ahead of an operator it originally followed.
+    """
+    is_unsafe = [unsafe(x) for x in operators]
+
+    heap = [(keys[i], i) for i in range(len(operators)) if not is_unsafe[i]]
+    heapq.heapify(heap)
+
+    done = [False] * len(operators)
+    first = 0
+    result = []
+    while len(result) < len(operators):
+        while done[first]:
+            first += 1
+
+        # an unsafe operator is only available once everything before it is out.
+        if is_unsafe[first] and (len(heap) == 0 or (keys[first], first) < heap[0]):
+            best = first
+        else:
+            best = heapq.heappop(heap)[1]
+
+        done[best] = True
+        result.append(best)
+    return result
+
+
+def order(
+    operators: list[Operator], key: Callable[[Operator], float]
+) -> list[Operator]:
+    indices = order_indices(operators, [key(x) for x in operators])
+    return [operators[x] for x in indices]
+
+
+def _fold_bounds(operators: list[Operator]) -> list[Operator] | None:
+    """
+    merges bounds and equality checks on the same value, returns None if they
+    contradict each other.
+    """
+    original = operators
+    lower: list[int] = []
+    upper: list[int] = []
+    equal: list[int] = []
+    exists: set[bool] = set()
+    for idx, x in enumerate(operators):
+        if isinstance(x, _LOWER) and _is_plain(x.value):
+            lower.append(idx)
+        elif isinstance(x, _UPPER) and _is_plain(x.value):
+            upper.append(idx)
+        elif isinstance(x, CmpEqual) and _is_plain(x.value):
+            equal.append(idx)
+        elif isinstance(x, Exists):
+            exists.add(bool(x.value))
+
+    if len(exists) > 1:
+        return None
+    if False in exists and len(equal) > 0:
+        return None
+
+    try:
+        if any(operators[idx].value != operators[equal[0]].value for idx in equal):
+            return None
+
+        drop: set[int] = set()
+        tightest = {}
+        for name, bounds in [("lower", lower), ("upper", upper)]:
+            best = None
+            for idx in bounds:
+                if best is None or _tighter(operators[idx], operators[best]):
+                    best = idx
+            if best is not None:
+                tightest[name] = operators[best]
+                # the tightest bound takes the place of the first one.
+                operators = [*operators]
+                operators[bounds[0]] = operators[best]
+                drop.update(bounds[1:])
+
+        lo, hi = tightest.get("lower"), tightest.get("upper")
+        if lo is not None and hi is not None:
+            if lo.value > hi.value:
+                return None
+            strict = isinstance(lo, CmpGreaterThan) or isinstance(hi, CmpLessThan)
+            if lo.value == hi.value and strict:
+                return None
+
+        if len(equal) > 0:
+            value = operators[equal[0]].value
+            for bound in tightest.values():
+                if not bound.match(value):
+                    return None
+            # equality implies the bounds.
+            drop.update(lower)
+            drop.update(upper)
+    except TypeError:
+        # incomparable values, leave it to the record.
+        return original
+
+    return [x for idx, x in enumerate(operators) if idx not in drop]
+
+
+def _tighter(a: Operator, b: Operator) -> bool:
+    if a.value == b.value:
+        # strict beats inclusive at the same value.
+        return isinstance(a, (CmpGreaterThan, CmpLessThan)) and not isinstance(
+            b, (CmpGreaterThan, CmpLessThan)
+        )
+    if isinstance(a, _LOWER):
+        return a.value > b.value
+    return a.value < b.value
+
+
+def _merge_fields(
+    operators: list[Operator], cls: type[LogicalAnd] | type[LogicalOr]
+) -> list[Operator]:
+    """
+    merges operators on the same field under one `cls`, as long as doing so
+    does not move an unsafe operator ahead of anything.
+    """
+    result: list[Operator | None] = []
+    # the operands merged at a position so far, kept flat for wide chains.
+    merged: dict[int, list[Operator]] = {}
+    seen: dict[str, int] = {}
+    # the position of the last unsafe operator in `result`.
+    last_unsafe = -1
+    for x in operators:
+        x_unsafe = unsafe(x)
+        if isinstance(x, MatchKeyValue) and x.key in seen:
+            idx = seen[x.key]
+            if not x_unsafe:
+                merged.setdefault(idx, [result[idx].value]).append(x.value)
+                continue
+            if last_unsafe <= idx:
+                operands = merged.pop(idx, [result[idx].value])
+                operands.append(x.value)
+                result[idx] = None
+                seen[x.key] = last_unsafe = len(result)
+                merged[len(result)] = operands
+                result.append(x)
+                continue
+
+        if isinstance(x, MatchKeyValue):
+            seen[x.key] = len(result)
+        if x_unsafe:
+            last_unsafe = len(result)
+        result.append(x)
+
+    return [
+        _simplify(MatchKeyValue(x.key, cls(merged[idx]))) if idx in merged else x
+        for idx, x in enumerate(result)
+        if x is not None
+    ]
+
+
+def _intervals(operator: Operator) -> tuple[type, list[tuple]] | None:
+    """
+    the type of value and the intervals of a bound, an $and of bounds, or a
+    `Ranges` merged before.
+    """
+    if isinstance(operator, Ranges):
+        return family(operator.points[0]), list(operator.value)
+
+    bounds = operator.value if isinstance(operator, LogicalAnd) else [operator]
+    kinds = set()
+    for x in bounds:
+        if not isinstance(x, _ORDERING) or not _is_plain(x.value):
+            return None
+        # bool sorts with numbers, but is a different type to sql; nan with nothing.
+        if isinstance(x.value, bool) or x.value != x.value:
+            return None
+        kinds.add(family(x.value))
+    if len(kinds) != 1:
+        return None
+
+    (lo, lo_inclusive, hi, hi_inclusive) = (None, False, None, False)
+    for x in bounds:
+        inclusive = isinstance(x, (CmpGreaterThanOrEqual, CmpLessThanOrEqual))
+        if isinstance(x, _LOWER):
+            if lo is None or x.value > lo or (x.value == lo and not inclusive):
+                (lo, lo_inclusive) = (x.value, inclusive)
+        elif hi is None or x.value < hi or (x.value == hi and not inclusive):
+            (hi, hi_inclusive) = (x.value, inclusive)
+    return kinds.pop(), [(lo, lo_inclusive, hi, hi_inclusive)]
+
+
+def _union(intervals: list[tuple]) -> list[tuple] | None:
+    """
+    the union of `intervals` as sorted, disjoint intervals, None if it is
+    empty or unbounded on both sides.
+    """
+    (points, at, between) = _ranges_table(intervals)
+    # alternating gaps and points: gap 0, point 0, gap 1, ..., gap n.
+    inside = []
+    for idx, x in enumerate(at):
+        inside.extend([between[idx], x])
+    inside.append(between[-1])
+
+    result = []
+    start = None
+    for idx, x in enumerate([*inside, False]):
+        if x and start is None:
+            start = idx
+        elif not x and start is not None:
+            end = idx - 1
+            # a run starting in a gap excludes the point before it, one
+            # ending in a gap excludes the point after it.
+            if start % 2 == 0:
+                lo = (points[start // 2 - 1], False) if start > 0 else (None, False)
+            else:
+                lo = (points[start // 2], True)
+            if end % 2 == 0:
+                hi = (
+                    (points[end // 2], False)
+                    if end // 2 < len(points)
+                    else (None, False)
+                )
+            else:
+                hi = (points[end // 2], True)
+            result.append((*lo, *hi))
+            start = None
+
+    if len(result) == 0 or result == [(None, False, None, False)]:
+        return None
+    return result
+
+
+def _fold_disjunction(operators: list[Operator]) -> list[Operator]:
+    """
+    merges the equality checks of an $or on one value into one $in, and its
+    bounds (or $and of bounds) into one `Ranges` per type of value, each
+    taking the place of the first operator it replaces.
+    """
+    equal: list[int] = []
+    ranges: dict[type, list[int]] = {}
+    intervals: dict[int, list[tuple]] = {}
+    for idx, x in enumerate(operators):
+        if isinstance(x, (CmpEqual, CmpIn)):
+            values = x.value if isinstance(x, CmpIn) else [x.value]
+            if all(_is_plain(y) and y == y for y in values):
+                equal.append(idx)
+            continue
+        found = _intervals(x)
+        if found is not None:
+            ranges.setdefault(found[0], []).append(idx)
+            intervals[idx] = found[1]
+
+    result: list[Operator | None] = [*operators]
+    if len(equal) > 1:
+        values = []
+        seen = set()
+        for idx in equal:
+            x = operators[idx]
+            for value in x.value if isinstance(x, CmpIn) else [x.value]:
+                # 1 and True are equal, but keep both as written.
+                if (type(value), value) not in seen:
+                    seen.add((type(value), value))
+                    values.append(value)
+            result[idx] = None
+        result[equal[0]] = CmpIn(values)
+
+    for members in ranges.values():
+        if len(members) < 2:
+            continue
+        merged = _union([y for x in members for y in intervals[x]])
+        if merged is None:
+            continue
+        for idx in members:
+            result[idx] = None
+        result[members[0]] = Ranges(tuple(merged))
+
+    return [x for x in result if x is not None]
+
+
+def _simplify_chain(operator: LogicalAnd | LogicalOr) -> Operator:
+    conjunction = isinstance(operator, LogicalAnd)
+    cls = LogicalAnd if conjunction else LogicalOr
+
+    children: list[Operator] = []
+    seen = set()
+    for x in operator.value:
+        x = _simplify(x)
+        # flatten, the nested chain has already been simplified.
+        for y in x.value if isinstance(x, cls) else [x]:
+            if isinstance(y, Constant):
+                if y.value != conjunction:
+                    # decides the whole chain.
+                    return Constant(y.value)
+                continue
+
+            key = _key(y)
+            if key in seen:
+                continue
+            seen.add(key)
+            children.append(y)
+
+    children = _merge_fields(children, cls)
+    # merged fields may have been folded to constants.
+    if any(isinstance(x, Constant) and x.value != conjunction for x in children):
+        return Constant(not conjunction)
+    children = [x for x in children if not isinstance(x, Constant)]
+
+    if conjunction:
+        folded = _fold_bounds(children)
+        if folded is None:
+            return Constant(False)
+        children = folded
+    else:
+        children = _fold_disjunction(children)
+
+    children = order(children, lambda x: rank(estimate(x), conjunction))
+
+    if len(children) == 0:
+        return Constant(conjunction)
+    if len(children) == 1:
+        return children[0]
+    return cls(children)
+
+
+def _simplify(operator: Operator) -> Operator:
+    if isinstance(operator, MatchKeyValue):
+        inner = _simplify(operator.value)
+        if isinstance(inner, Constant):
+            return inner
+        return MatchKeyValue(operator.key, inner)
+
+    if isinstance(operator, LogicalNor):
+        return _simplify(operator.value)
+
+    if isinstance(operator, LogicalNot):
+        inner = _simplify(operator.value)
+        if isinstance(inner, Constant):
+            return Constant(not inner.value)
+        if isinstance(inner, LogicalNot):
+            return inner.value
+        return LogicalNot(inner)
+
+    if isinstance(operator, (LogicalAnd, LogicalOr)):
+        return _simplify_chain(operator)
+
+    return operator
+
+
+def optimize(matchers: Iterable[Operator]) -> list[Operator]:
+    """
+    returns a simplified equivalent of the output of `deserialize`, for use
+    with `match`, `compile` or `build`.
+    """
+    matchers = list(matchers)
+    if len(matchers) == 0:
+        return []
+
+    result = _simplify(LogicalAnd(matchers))
+    if isinstance(result, LogicalAnd):
+        return list(result.value)
+    return [result]
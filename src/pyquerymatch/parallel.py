@@ -0,0 +1,177 @@
+"""
+filtering large inputs across a pool of worker processes.
+
+the query is pickled once per worker (as operators, see `CompiledQuery`) and
+compiled there; tasks only carry records, or byte ranges of an NDJSON file
+which the workers read themselves.
+"""
+
+import json
+import os
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from itertools import islice
+from typing import Any, Callable, Iterable, Iterator
+
+from pyquerymatch.compiler import CompiledQuery
+from pyquerymatch.match import Operator, deserialize
+from pyquerymatch.stream import Query
+
+CHUNK_RECORDS = 4096
+CHUNK_BYTES = 8 << 20
+
+_worker_test: Callable[[dict], bool] | None = None
+
+
+def _picklable(query: Query) -> Callable[[dict], bool]:
+    if isinstance(query, dict):
+        return CompiledQuery(deserialize(query))
+    if callable(query):
+        # must be picklable itself.
+        return query
+    return CompiledQuery(query)
+
+
+def _init_worker(test: Callable[[dict], bool]):
+    global _worker_test
+    _worker_test = test
+
+
+def _scan_records(chunk: list) -> list[tuple[int, dict | None]]:
+    """
+    the positions of the matching records in `chunk`, each with the record
+    parsed from a line, or None for records that were dicts already.
+    """
+    test = _worker_test
+    result = []
+    for idx, item in enumerate(chunk):
+        if isinstance(item, (bytes, bytearray, str)):
+            if len(item.strip()) == 0:
+                continue
+            item = json.loads(item)
+            if test(item):
+                result.append((idx, item))
+        elif test(item):
+            result.append((idx, None))
+    return result
+
+
+def _scan_range(path: str, start: int, end: int, raw: bool) -> list:
+    """
+    matches the lines starting within [start, end) of the file at `path`.
+    """
+    test = _worker_test
+    loads = json.loads
+    result = []
+    with open(path, "rb") as fp:
+        if start > 0:
+            # the line straddling `start` belongs to the previous range.
+            fp.seek(start - 1)
+            fp.readline()
+        pos = fp.tell()
+        while pos < end:
+            line = fp.readline()
+            if len(line) == 0:
+                break
+            pos += len(line)
+            if len(line.strip()) == 0:
+                continue
+            item = loads(line)
+            if test(item):
+                result.append(line if raw else item)
+    return result
+
+
+def _ranges(path: str, chunk_bytes: int) -> Iterator[tuple[int, int]]:
+    size = os.path.getsize(path)
+    for start in range(0, size, chunk_bytes):
+        yield start, min(start + chunk_bytes, size)
+
+
+def _results(
+    futures: Iterator[tuple[Future, Any]], window: int, ordered: bool
+) -> Iterator[tuple[Any, Any]]:
+    """
+    runs at most `window` tasks at once, yields (result, context) pairs.
+    """
+    pending: deque[tuple[Future, Any]] = deque()
+    for task in futures:
+        pending.append(task)
+        if len(pending) < window:
+            continue
+
+        if ordered:
+            (future, context) = pending.popleft()
+            yield future.result(), context
+        else:
+            done, _ = wait([x for x, _ in pending], return_when=FIRST_COMPLETED)
+            for task in [x for x in pending if x[0] in done]:
+                pending.remove(task)
+                yield task[0].result(), task[1]
+
+    while pending:
+        (future, context) = pending.popleft()
+        yield future.result(), context
+
+
+def parallel_filter(
+    source: Iterable[dict] | Iterable[bytes] | str | os.PathLike,
+    query: Query | Iterable[Operator],
+    /,
+    workers: int | None = None,
+    ordered: bool = True,
+    raw: bool = False,
+    chunk_records: int = CHUNK_RECORDS,
+    chunk_bytes: int = CHUNK_BYTES,
+) -> Iterator:
+    """
+    yields the records from `source` matching `query`, evaluated by a pool of
+    `workers` processes (default: one per cpu).
+
+    a path is split into byte ranges of `chunk_bytes` which workers read and
+    parse themselves; with `raw` matching lines are returned as read. any
+    other iterable is sent to workers in chunks of `chunk_records`; records
+    are yielded as given, lines as parsed by the worker (and sent back). with
+    `ordered`, records come out in input order, otherwise in order of
+    completion.
+    """
+    path = os.fspath(source) if isinstance(source, (str, os.PathLike)) else None
+    if raw and path is None:
+        raise ValueError("raw output requires a path as input")
+
+    test = _picklable(query)
+    workers = workers or os.cpu_count() or 1
+    return _parallel_filter(
+        source, path, test, workers, ordered, raw, chunk_records, chunk_bytes
+    )
+
+
+def _parallel_filter(
+    source: Iterable[dict] | Iterable[bytes],
+    path: str | None,
+    test: Callable[[dict], bool],
+    workers: int,
+    ordered: bool,
+    raw: bool,
+    chunk_records: int,
+    chunk_bytes: int,
+) -> Iterator:
+    window = workers * 2
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(test,)
+    ) as executor:
+        if path is not None:
+            tasks = (
+                (executor.submit(_scan_range, path, start, end, raw), None)
+                for (start, end) in _ranges(path, chunk_bytes)
+            )
+            for result, _ in _results(tasks, window, ordered):
+                yield from result
+            return
+
+        iterator = iter(source)
+        chunks = iter(lambda: list(islice(iterator, chunk_records)), [])
+        tasks = ((executor.submit(_scan_records, x), x) for x in chunks)
+        for matches, chunk in _results(tasks, window, ordered):
+            for idx, parsed in matches:
+                yield chunk[idx] if parsed is None else parsed
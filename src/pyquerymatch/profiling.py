@@ -0,0 +1,270 @@
+"""
+finding out where a query spends its time, and why it matched.
+
+`Profiler` evaluates records through an instrumented copy of the operator
+tree, recording per node how often it was evaluated, true, false or raised,
+how often it was skipped by an $and/$or short-circuiting before it, and the
+time spent in it. the plain `match` / `compile` paths are not touched, so
+there is no cost unless a profiler is used.
+
+`explain` evaluates a single record the same way and reports which child of
+every $and/$or decided its result.
+"""
+
+import time
+from dataclasses import dataclass, field
+from typing import Any, Iterable
+
+from pyquerymatch.match import (
+    _MISSING,
+    LogicalAnd,
+    LogicalNor,
+    LogicalNot,
+    LogicalOr,
+    MatchKeyValue,
+    Operator,
+)
+
+# characters of a value shown in labels.
+MAX_LABEL = 40
+
+
+class _Probe(Operator):
+    """
+    evaluates `value`, recording what happened.
+    """
+
+    def __init__(self, value: Operator, label: str, children: list["_Probe"]):
+        self.operator = value.operator
+        self.value = value
+        self.label = label
+        self.children = children
+
+        self.evals = 0
+        self.trues = 0
+        self.errors = 0
+        self.ns = 0
+        self.last: bool | None = None
+        self.last_error: Exception | None = None
+        self.last_input: Any = None
+
+    def match(self, theirs: Any) -> bool:
+        self.evals += 1
+        self.last_input = theirs
+        start = time.perf_counter_ns()
+        try:
+            result = self.value.match(theirs)
+        except Exception as e:
+            self.errors += 1
+            self.last = None
+            self.last_error = e
+            raise
+        finally:
+            self.ns += time.perf_counter_ns() - start
+        self.last = result
+        self.last_error = None
+        if result:
+            self.trues += 1
+        return result
+
+
+def _label(operator: Operator) -> str:
+    if isinstance(operator, MatchKeyValue):
+        return operator.key
+    value = getattr(operator, "value", None)
+    if isinstance(operator, (LogicalAnd, LogicalOr, LogicalNot, LogicalNor)):
+        return operator.operator
+    text = repr(value)
+    if len(text) > MAX_LABEL:
+        text = text[: MAX_LABEL - 3] + "..."
+    return f"{operator.operator} {text}"
+
+
+def _instrument(operator: Operator) -> _Probe:
+    label = _label(operator)
+    if isinstance(operator, MatchKeyValue):
+        child = _instrument(operator.value)
+        return _Probe(MatchKeyValue(operator.key, child), label, [child])
+    if isinstance(operator, LogicalNor):
+        # the nested $not / $or are an implementation detail.
+        children = [_instrument(x) for x in operator.value.value.value]
+        return _Probe(LogicalNor(children), label, children)
+    if isinstance(operator, LogicalNot):
+        child = _instrument(operator.value)
+        return _Probe(LogicalNot(child), label, [child])
+    if isinstance(operator, (LogicalAnd, LogicalOr)):
+        children = [_instrument(x) for x in operator.value]
+        return _Probe(type(operator)(children), label, children)
+    return _Probe(operator, label, [])
+
+
+def _root(matchers: Iterable[Operator]) -> _Probe:
+    children = [_instrument(x) for x in matchers]
+    return _Probe(LogicalAnd(children), "$and (root)", children)
+
+
+@dataclass
+class NodeProfile:
+    label: str
+    evals: int
+    trues: int
+    falses: int
+    errors: int
+    # evaluations of the parent $and/$or that stopped before this node.
+    skips: int
+    # including children.
+    ns: int
+    children: list["NodeProfile"] = field(default_factory=list)
+
+    @property
+    def self_ns(self) -> int:
+        return self.ns - sum(x.ns for x in self.children)
+
+
+def _profile(probe: _Probe, parent_evals: int) -> NodeProfile:
+    return NodeProfile(
+        label=probe.label,
+        evals=probe.evals,
+        trues=probe.trues,
+        falses=probe.evals - probe.trues - probe.errors,
+        errors=probe.errors,
+        skips=parent_evals - probe.evals,
+        ns=probe.ns,
+        children=[_profile(x, probe.evals) for x in probe.children],
+    )
+
+
+class Profiler:
+    """
+    a predicate equivalent to `lambda item: match(item, matchers)`, which
+    records per operator statistics (see `profile`, `report`, `attributes`).
+
+    not thread safe.
+    """
+
+    def __init__(self, matchers: Iterable[Operator]):
+        self._root = _root(matchers)
+
+    def __call__(self, item: dict) -> bool:
+        return self._root.match(item)
+
+    def profile(self) -> NodeProfile:
+        return _profile(self._root, self._root.evals)
+
+    def reset(self):
+        stack = [self._root]
+        while stack:
+            probe = stack.pop()
+            probe.evals = probe.trues = probe.errors = probe.ns = 0
+            stack.extend(probe.children)
+
+    def report(self) -> str:
+        """
+        the profile as an indented tree, one node per line.
+        """
+        lines = []
+
+        def visit(node: NodeProfile, depth: int):
+            lines.append(
+                f"{'  ' * depth}{node.label}:"
+                f" evals={node.evals} true={node.trues} false={node.falses}"
+                f" errors={node.errors} skipped={node.skips}"
+                f" time={node.ns / 1e6:.3f}ms self={node.self_ns / 1e6:.3f}ms"
+            )
+            for child in node.children:
+                visit(child, depth + 1)
+
+        visit(self.profile(), 0)
+        return "\n".join(lines)
+
+    def attributes(self, prefix: str = "query") -> dict[str, str | int]:
+        """
+        the profile as flat span attributes (opentelemetry style), keyed by
+        `{prefix}.{node path}.{statistic}` with `0.2.1` style node paths.
+        """
+        result: dict[str, str | int] = {}
+
+        def visit(node: NodeProfile, path: str):
+            for name in ["label", "evals", "trues", "falses", "errors", "skips", "ns"]:
+                result[f"{prefix}.{path}.{name}"] = getattr(node, name)
+            for idx, child in enumerate(node.children):
+                visit(child, f"{path}.{idx}")
+
+        visit(self.profile(), "0")
+        return result
+
+
+@dataclass
+class Explanation:
+    label: str
+    # None when the node was not evaluated, or raised.
+    result: bool | None
+    children: list["Explanation"] = field(default_factory=list)
+    # for $and / $or, the index of the child that short-circuited it.
+    decided_by: int | None = None
+    # for fields, the value found in the record (None if missing).
+    value: Any = None
+    error: str | None = None
+
+    def __str__(self) -> str:
+        lines = []
+
+        def visit(node: Explanation, depth: int, decisive: bool):
+            if node.error is not None:
+                outcome = f"raised {node.error}"
+            elif node.result is None:
+                outcome = "skipped"
+            else:
+                outcome = str(node.result).lower()
+            detail = f" (value={node.value!r})" if node.value is not None else ""
+            marker = " <- decided" if decisive else ""
+            lines.append(f"{'  ' * depth}{node.label}: {outcome}{detail}{marker}")
+            for idx, child in enumerate(node.children):
+                visit(child, depth + 1, idx == node.decided_by)
+
+        visit(self, 0, False)
+        return "\n".join(lines)
+
+
+def _explain(probe: _Probe) -> Explanation:
+    evaluated = probe.evals > 0
+    explanation = Explanation(
+        label=probe.label,
+        result=probe.last if evaluated else None,
+        children=[_explain(x) for x in probe.children],
+        error=(
+            f"{type(probe.last_error).__name__}: {probe.last_error}"
+            if evaluated and probe.last_error is not None
+            else None
+        ),
+    )
+
+    if isinstance(probe.value, MatchKeyValue) and evaluated:
+        try:
+            value = probe.value.path.resolve(probe.last_input)
+        except (AttributeError, ValueError):
+            value = None
+        explanation.value = None if value is _MISSING else value
+
+    if isinstance(probe.value, (LogicalAnd, LogicalOr, LogicalNor)) and evaluated:
+        # the last child evaluated decides, if the others were skipped.
+        conjunction = isinstance(probe.value, LogicalAnd)
+        last = max(
+            (idx for idx, x in enumerate(probe.children) if x.evals > 0), default=None
+        )
+        if last is not None and probe.children[last].last is (not conjunction):
+            explanation.decided_by = last
+    return explanation
+
+
+def explain(item: dict, matchers: Iterable[Operator]) -> Explanation:
+    """
+    how `match(item, matchers)` came to its result, as a tree of nodes with
+    their results. errors are reported on the node that raised them.
+    """
+    root = _root(matchers)
+    try:
+        root.match(item)
+    except Exception:
+        pass
+    return _explain(root)
@@ -1,45 +1,98 @@
+import json
 import logging
 import re
 from dataclasses import dataclass, field
-from typing import Iterable
+from typing import Any, Iterable
 
 from pyquerymatch import Operator
+from pyquerymatch.dialect import SQLITE, Dialect, IndexHint, kind
 from pyquerymatch.match import (
     MatchKeyValue,
+    CmpEqual,
     CmpGreaterThan,
+    Constant,
     LogicalNot,
     LogicalNor,
     LogicalAnd,
     Exists,
+    Ranges,
 )
 
 logger = logging.getLogger(__name__)
 
+_UNCLEAN_PARAM_CHARS = re.compile("[^a-zA-Z0-9]")
+
 
 @dataclass
 class FieldContext:
     field_name: str
 
     @property
-    def field_ref(self) -> str:
+    def column(self) -> str:
+        return self.field_name.split(".", maxsplit=1)[0]
+
+    @property
+    def path(self) -> list[str]:
+        """
+        the path within the (json) column, empty for plain columns.
+        """
         if "." not in self.field_name:
-            return self.field_name
+            return []
 
-        (col, nested) = self.field_name.split(".", maxsplit=2)
+        nested = self.field_name.split(".", maxsplit=1)[1]
         if len(nested) == 0:
             raise ValueError(f"Dot Notation not proper '{self.field_name}'")
+        return nested.split(".")
 
-        return f"{col}->>'$.{nested}'"
+    def ref(self, dialect: Dialect, value_kind: str | None = None) -> str:
+        path = self.path
+        if len(path) == 0:
+            return self.field_name
+        return dialect.json_ref(self.column, path, value_kind)
+
+    @property
+    def field_ref(self) -> str:
+        return self.ref(SQLITE)
+
+
+# how lists (for $in / $nin) longer than `list_threshold` are bound:
+# one parameter per element, a single JSON array parameter read back through
+# json_each, one parameter per element in a VALUES subquery, or a temp table
+# (see `load_temp_tables`) holding the values. LIST_VALUES only changes the
+# shape of the plan (a sub-query rather than a list), it binds as many
+# parameters as LIST_EXPAND and runs into the same host parameter limits.
+LIST_EXPAND = "expand"
+LIST_JSON = "json"
+LIST_VALUES = "values"
+LIST_TEMP_TABLE = "temp_table"
+LIST_MODES = (LIST_EXPAND, LIST_JSON, LIST_VALUES, LIST_TEMP_TABLE)
+
+LIST_THRESHOLD = 256
 
 
 @dataclass
 class BuilderContext:
     clean_param_names: dict[str, str] = field(default_factory=dict)
     param_ctr: dict[str, int] = field(default_factory=dict)
+    list_mode: str = LIST_EXPAND
+    list_threshold: int = LIST_THRESHOLD
+    # temp tables the query reads from, by name, for LIST_TEMP_TABLE.
+    temp_tables: dict[str, list] = field(default_factory=dict)
+    # the start of their names, to keep those of concurrent queries apart.
+    temp_table_prefix: str = "_in_"
+    dialect: Dialect = SQLITE
+    # indexes that would serve the expressions used so far, by key.
+    index_hints: dict[str, IndexHint] = field(default_factory=dict)
+    # the values of `clean_param_names`, for clash checks.
+    used_param_names: set[str] = field(default_factory=set, repr=False)
+
+    def __post_init__(self):
+        if self.list_mode not in LIST_MODES:
+            raise ValueError(f"unknown list mode '{self.list_mode}'")
 
     def get_clean_param_name(self, field_name: str) -> str:
         if field_name not in self.clean_param_names:
-            clean_name = re.sub(re.compile("[^a-zA-Z0-9]"), "", field_name)
+            clean_name = _UNCLEAN_PARAM_CHARS.sub("", field_name)
 
             if len(clean_name) == 0:
                 clean_name = f"p{len(self.clean_param_names)}n"
@@ -49,10 +102,11 @@ class BuilderContext:
                 clean_name = "a" + clean_name
 
             # handle name clashes.
-            if clean_name in self.clean_param_names.values():
+            if clean_name in self.used_param_names:
                 clean_name = f"{clean_name}{len(self.clean_param_names)}"
 
             self.clean_param_names[field_name] = clean_name
+            self.used_param_names.add(clean_name)
 
         return self.clean_param_names[field_name]
 
@@ -75,29 +129,111 @@ def _fragment_basic(
     if field_context is None:
         raise ValueError("field_context must be set")
 
-    query_params = {}
+    if isinstance(operator, CmpEqual):
+        contains = _fragment_contains(ctx, value, field_context)
+        if contains is not None:
+            return contains
+
+    if isinstance(value, list):
+        mode = ctx.list_mode if len(value) > ctx.list_threshold else LIST_EXPAND
+        bind_params, query_params = _bind_list(ctx, mode, value, field_context)
+    else:
+        param_name = _next_param_name(ctx, field_context)
+        bind_params = ctx.dialect.param(param_name)
+        query_params = {param_name: value}
+
+    ref = _ref(ctx, field_context, ctx.dialect.kind(value))
+    return f"{ref} {sql_operator} {bind_params}", query_params
+
+
+def _ref(
+    ctx: BuilderContext, field_context: FieldContext, value_kind: str | None
+) -> str:
+    """
+    the reference to a field, noting the index that would serve it.
+    """
+    ref = field_context.ref(ctx.dialect, value_kind)
+    plain = len(field_context.path) == 0
+    key = field_context.field_name
+    if not plain and value_kind is not None and ref != field_context.ref(ctx.dialect):
+        # cast, a separate index.
+        key = f"{key}_{value_kind}"
+    if plain or ctx.dialect.indexable(value_kind):
+        ctx.index_hints.setdefault(key, IndexHint(key, ref, column=plain))
+    return ref
+
+
+def _fragment_contains(
+    ctx: BuilderContext, value: Any, field_context: FieldContext
+) -> tuple[str, dict] | None:
+    """
+    equality on a json path as containment of a document, where the dialect
+    supports it.
+    """
+    path = field_context.path
+    if not ctx.dialect.containment or len(path) == 0 or kind(value) is None:
+        return None
+    if isinstance(value, list):
+        return None
+
+    document = value
+    for segment in reversed(path):
+        document = {segment: document}
+
+    param_name = _next_param_name(ctx, field_context)
+    column = field_context.column
+    key = f"{column}_gin"
+    ctx.index_hints.setdefault(key, IndexHint(key, column, gin=True))
+    return (
+        ctx.dialect.contains(column, ctx.dialect.param(param_name)),
+        {param_name: json.dumps(document)},
+    )
+
 
+def _next_param_name(ctx: BuilderContext, field_context: FieldContext) -> str:
     param_name_prefix = ctx.get_clean_param_name(field_context.field_name)
     param_ctr = ctx.param_ctr.get(field_context.field_name, 0)
+    ctx.param_ctr[field_context.field_name] = param_ctr + 1
+    return f"{param_name_prefix}{param_ctr}"
 
-    bind_params_list = []
-    if isinstance(value, list):
-        for idx, loop_val in enumerate(value):
-            idx_param_name = f"{param_name_prefix}{param_ctr + idx}"
-            bind_params_list.append(f":{idx_param_name}")
-            query_params[idx_param_name] = loop_val
-        ctx.param_ctr[field_context.field_name] = param_ctr + len(value)
-    else:
-        param_name = f"{param_name_prefix}{param_ctr}"
-        bind_params_list.append(f":{param_name}")
-        query_params[param_name] = value
-        ctx.param_ctr[field_context.field_name] = param_ctr + 1
 
-    bind_params = ", ".join(bind_params_list)
-    if len(bind_params_list) > 1:
-        bind_params = "(" + bind_params + ")"
+def _bind_list(
+    ctx: BuilderContext, mode: str, value: list, field_context: FieldContext
+) -> tuple[str, dict]:
+    """
+    the parenthesized right hand side of an `in` over `value`, and its params.
+    """
+    query_params = {}
 
-    return f"{field_context.field_ref} {sql_operator} {bind_params}", query_params
+    if mode == LIST_JSON:
+        param_name = _next_param_name(ctx, field_context)
+        try:
+            query_params[param_name] = json.dumps(value)
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"list is not json serializable: {e}") from e
+        sub_query = ctx.dialect.json_list(ctx.dialect.param(param_name))
+        if sub_query is None:
+            raise ValueError(
+                f"list mode '{mode}' is not supported by '{ctx.dialect.name}'"
+            )
+        return f"({sub_query})", query_params
+
+    if mode == LIST_TEMP_TABLE:
+        table_name = ctx.temp_table_prefix + _next_param_name(ctx, field_context)
+        ctx.temp_tables[table_name] = value
+        return f"(select value from {table_name})", query_params
+
+    bind_params_list = []
+    for loop_val in value:
+        param_name = _next_param_name(ctx, field_context)
+        bind_params_list.append(ctx.dialect.param(param_name))
+        query_params[param_name] = loop_val
+
+    if mode == LIST_VALUES:
+        bind_params = ctx.dialect.values(bind_params_list)
+    else:
+        bind_params = ", ".join(bind_params_list)
+    return f"({bind_params})", query_params
 
 
 def _fragment_exists(
@@ -110,115 +246,172 @@ def _fragment_exists(
 
     cmp = "is not null" if operator.value else "is null"
 
-    return f"{field_context.field_ref} {cmp}", {}
-
-
-def _fragment_logical(
-    ctx: BuilderContext,
-    operator: str,
-    operand: Iterable[Operator],
-    field_context: FieldContext | None,
-    /,
-    max_depth: int,
-    depth: int,
-) -> tuple[str, dict]:
-    query_params = {}
-    sql_query = []
-    sub_query_count = 0
-
-    for op in operand:
-        sub_query_count += 1
+    return f"{_ref(ctx, field_context, None)} {cmp}", {}
 
-        sub_query, sub_params = _fragment(ctx, op, field_context, max_depth, depth + 1)
-        sql_query.append(sub_query)
-        query_params.update(sub_params)
 
-    sql_query_str = f" {operator} ".join([f"({x})" for x in sql_query])
-
-    if sub_query_count > 1:
-        sql_query_str = "(" + sql_query_str + ")"
-    return sql_query_str, query_params
+def _fragment_constant(operator: Constant) -> tuple[str, dict]:
+    return ("1 = 1" if operator.value else "1 = 0"), {}
 
 
-def _fragment_not(
+def _fragment_ranges(
     ctx: BuilderContext,
-    operator: LogicalNot,
+    operator: Ranges,
     field_context: FieldContext | None,
-    /,
-    max_depth: int,
-    depth: int,
 ) -> tuple[str, dict]:
-    query, params = _fragment(
-        ctx,
-        operator.value,
-        field_context,
-        max_depth,
-        depth + 1,
-    )
+    """
+    the intervals of `operator`, single points as one `in` and the others as
+    a `between` (or one or two bounds) each, so an index serves them with a
+    range scan per interval.
+    """
+    if field_context is None:
+        raise ValueError("field_context must be set")
 
-    if not (query.startswith("(") and query.endswith(")")):
-        query = "(" + query + ")"
+    ref = _ref(ctx, field_context, ctx.dialect.kind(operator.points))
+    query_params = {}
 
-    return f"not {query}", params
+    def param(value: Any) -> str:
+        name = _next_param_name(ctx, field_context)
+        query_params[name] = value
+        return ctx.dialect.param(name)
+
+    parts = []
+    points = [lo for lo, _, hi, _ in operator.value if lo is not None and lo == hi]
+    if len(points) == 1:
+        parts.append(f"{ref} = {param(points[0])}")
+    elif len(points) > 1:
+        mode = ctx.list_mode if len(points) > ctx.list_threshold else LIST_EXPAND
+        (bind_params, params) = _bind_list(ctx, mode, points, field_context)
+        query_params.update(params)
+        parts.append(f"{ref} in {bind_params}")
+
+    for lo, lo_inclusive, hi, hi_inclusive in operator.value:
+        if lo is not None and lo == hi:
+            continue
+        if lo is not None and hi is not None and lo_inclusive and hi_inclusive:
+            parts.append(f"{ref} between {param(lo)} and {param(hi)}")
+            continue
+        bounds = []
+        if lo is not None:
+            bounds.append(f"{ref} {'>=' if lo_inclusive else '>'} {param(lo)}")
+        if hi is not None:
+            bounds.append(f"{ref} {'<=' if hi_inclusive else '<'} {param(hi)}")
+        parts.append(bounds[0] if len(bounds) == 1 else f"({' and '.join(bounds)})")
+
+    if len(parts) == 1:
+        return parts[0], query_params
+    return "(" + " or ".join(parts) + ")", query_params
+
+
+# steps of the explicit stack in `_fragment`.
+_VISIT = 0
+_EMIT = 1
+# closes a $not, patching the text before its operand.
+_CLOSE_NOT = 2
+# closes an $and / $or, replacing the bounds of its operands by its own.
+_CLOSE_LOGICAL = 3
 
 
 def _fragment(
     ctx: BuilderContext,
-    operator: Operator | Iterable[Operator],
+    operator: Operator,
     field_context: FieldContext | None,
     /,
     max_depth: int,
     depth: int,
 ) -> tuple[str, dict]:
-    if depth > max_depth:
-        raise ValueError(f"max depth of {max_depth} exceeded")
-
-    if isinstance(operator, MatchKeyValue):
-        return _fragment(
-            ctx,
-            operator.value,
-            FieldContext(field_name=operator.key),
-            max_depth,
-            depth=depth + 1,
-        )
-
-    if operator.basic_sql_operator is not None:
-        return _fragment_basic(ctx, operator, field_context)
-
-    if operator.logical_sql_operator is not None:
-        return _fragment_logical(
-            ctx,
-            operator.logical_sql_operator,
-            operator.value,
-            field_context,
-            max_depth,
-            depth,
-        )
-
-    if isinstance(operator, LogicalNot):
-        return _fragment_not(
-            ctx,
-            operator,
-            field_context,
-            max_depth,
-            depth,
-        )
-
-    if isinstance(operator, LogicalNor):
-        return _fragment(
-            ctx,
-            operator.value,
-            field_context,
-            max_depth,
-            depth + 1,
-        )
-
-    if isinstance(operator, Exists):
-        return _fragment_exists(ctx, operator, field_context)
-
-    raise ValueError(
-        f"operator '{type(operator)}' has no known sql query building logic"
-    )
+    """
+    the sql for `operator`, and its params.
+
+    walks the tree with an explicit stack, appending to a single list of
+    parts, so neither the interpreter's stack nor string copying grows with
+    the depth of the tree.
+    """
+    parts: list[str] = []
+    query_params: dict = {}
+    # first and last character of each finished fragment, for $not.
+    bounds: list[tuple[str, str]] = []
+
+    stack: list[tuple] = [(_VISIT, operator, field_context, depth)]
+    while stack:
+        step = stack.pop()
+
+        if step[0] == _EMIT:
+            parts.append(step[1])
+            continue
+
+        if step[0] == _CLOSE_NOT:
+            (first, last) = bounds.pop()
+            if first == "(" and last == ")":
+                parts[step[1]] = "not "
+            else:
+                parts[step[1]] = "not ("
+                parts.append(")")
+            bounds.append(("n", ")"))
+            continue
+
+        if step[0] == _CLOSE_LOGICAL:
+            count = step[1]
+            del bounds[len(bounds) - count :]
+            bounds.append(("(", ")") if count > 0 else ("", ""))
+            continue
+
+        (_, operator, field_context, depth) = step
+        if depth > max_depth:
+            raise ValueError(f"max depth of {max_depth} exceeded")
+
+        if isinstance(operator, MatchKeyValue):
+            stack.append(
+                (_VISIT, operator.value, FieldContext(operator.key), depth + 1)
+            )
+            continue
+
+        if operator.logical_sql_operator is not None and (
+            operator.basic_sql_operator is None
+        ):
+            operands = list(operator.value)
+            steps: list[tuple] = []
+            if len(operands) > 1:
+                steps.append((_EMIT, "("))
+            for idx, op in enumerate(operands):
+                if idx > 0:
+                    steps.append((_EMIT, f" {operator.logical_sql_operator} "))
+                steps.append((_EMIT, "("))
+                steps.append((_VISIT, op, field_context, depth + 1))
+                steps.append((_EMIT, ")"))
+            if len(operands) > 1:
+                steps.append((_EMIT, ")"))
+            steps.append((_CLOSE_LOGICAL, len(operands)))
+            stack.extend(reversed(steps))
+            continue
+
+        if isinstance(operator, LogicalNot):
+            # filled in by _CLOSE_NOT, once the operand is known.
+            parts.append("")
+            stack.append((_CLOSE_NOT, len(parts) - 1))
+            stack.append((_VISIT, operator.value, field_context, depth + 1))
+            continue
+
+        if isinstance(operator, LogicalNor):
+            stack.append((_VISIT, operator.value, field_context, depth + 1))
+            continue
+
+        if operator.basic_sql_operator is not None:
+            (sql, params) = _fragment_basic(ctx, operator, field_context)
+        elif isinstance(operator, Exists):
+            (sql, params) = _fragment_exists(ctx, operator, field_context)
+        elif isinstance(operator, Constant):
+            (sql, params) = _fragment_constant(operator)
+        elif isinstance(operator, Ranges):
+            (sql, params) = _fragment_ranges(ctx, operator, field_context)
+        else:
+            raise ValueError(
+                f"operator '{type(operator)}' has no known sql query building logic"
+            )
+        parts.append(sql)
+        query_params.update(params)
+        bounds.append((sql[:1], sql[-1:]))
+
+    return "".join(parts), query_params
 
 
 def build(
@@ -227,14 +420,27 @@ def build(
     /,
     depth: int = 0,
     builder_ctx: BuilderContext | None = None,
+    list_mode: str = LIST_EXPAND,
+    list_threshold: int = LIST_THRESHOLD,
+    dialect: Dialect = SQLITE,
 ) -> tuple[str, dict]:
+    """
+    a sql where clause for `matchers`, and its named parameters, in `dialect`.
+
+    `$in` / `$nin` lists longer than `list_threshold` are bound as per
+    `list_mode` (see LIST_MODES); LIST_JSON and LIST_TEMP_TABLE avoid one
+    parameter per element. with LIST_TEMP_TABLE, the tables to create are left
+    in `builder_ctx.temp_tables`.
+    """
     if depth > max_depth:
         raise ValueError(f"max depth of {max_depth} exceeded")
 
     if builder_ctx is None:
-        builder_ctx = BuilderContext()
+        builder_ctx = BuilderContext(
+            list_mode=list_mode, list_threshold=list_threshold, dialect=dialect
+        )
 
-    # similar to _fragment_logical, but outside the boundaries of iteration.
+    # similar to an $and, but without the outer parentheses.
     sql_query = []
     query_params = {}
     for op in matchers:
@@ -251,6 +457,33 @@ def build(
     return sql_query_str, query_params
 
 
+def index_ddl(
+    table: str,
+    queries: Iterable[Iterable[Operator]],
+    dialect: Dialect = SQLITE,
+) -> list[str]:
+    """
+    `create index` statements for `table` serving the field references (and,
+    for containment, the columns) that `queries` build to in `dialect`.
+    """
+    builder_ctx = BuilderContext(dialect=dialect)
+    for matchers in queries:
+        build(matchers, builder_ctx=builder_ctx)
+    return [dialect.ddl(table, x) for x in builder_ctx.index_hints.values()]
+
+
+def load_temp_tables(connection, builder_ctx: BuilderContext):
+    """
+    (re)creates the temp tables of `builder_ctx` on a sqlite3 connection.
+    """
+    for name, values in builder_ctx.temp_tables.items():
+        connection.execute(f"drop table if exists temp.{name}")
+        connection.execute(f"create temp table {name} (value)")
+        connection.executemany(
+            f"insert into temp.{name} (value) values (?)", [(x,) for x in values]
+        )
+
+
 def main():
     # matchers = [MatchKeyValue(key='num', value=CmpIn(value=[42, 43]))]
     matchers = [
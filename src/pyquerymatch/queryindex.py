@@ -0,0 +1,350 @@
+"""
+matching one record against many registered queries.
+
+every query is indexed by one necessary condition on a field (its anchor):
+an equality, an `$in` list, or a range. a record only has to be checked
+against the queries whose anchor it satisfies, which are found through a hash
+index (equality, `$in`) or an interval tree (ranges) per field, with every
+field extracted from the record once. queries without a usable anchor are
+always checked.
+
+a query raising for a record (e.g. ordering a missing value) is reported as
+not matching it, rather than failing the whole lookup.
+"""
+
+from dataclasses import dataclass, field
+from typing import Any, Callable, Hashable, Iterable
+
+from pyquerymatch.compiler import compile
+from pyquerymatch.match import (
+    _MISSING,
+    CmpEqual,
+    CmpGreaterThan,
+    CmpGreaterThanOrEqual,
+    CmpIn,
+    CmpLessThan,
+    CmpLessThanOrEqual,
+    FieldPath,
+    LogicalAnd,
+    MatchKeyValue,
+    Operator,
+)
+
+# $in lists longer than this make a poor anchor, prefer a range if any.
+MAX_IN_ANCHOR = 64
+
+_NUMBER = (bool, int, float)
+
+
+def family(value: Any) -> type | None:
+    """
+    values of the same family can be ordered against each other.
+    """
+    if isinstance(value, _NUMBER):
+        return float
+    if isinstance(value, str):
+        return str
+    return None
+
+
+@dataclass
+class Interval:
+    lo: Any = None
+    lo_inclusive: bool = False
+    hi: Any = None
+    hi_inclusive: bool = False
+    key: Hashable = None
+
+    def above_lo(self, value: Any) -> bool:
+        if self.lo is None:
+            return True
+        return value >= self.lo if self.lo_inclusive else value > self.lo
+
+    def below_hi(self, value: Any) -> bool:
+        if self.hi is None:
+            return True
+        return value <= self.hi if self.hi_inclusive else value < self.hi
+
+    def contains(self, value: Any) -> bool:
+        return self.above_lo(value) and self.below_hi(value)
+
+    def empty(self) -> bool:
+        if self.lo is None or self.hi is None:
+            return False
+        if self.lo == self.hi:
+            return not (self.lo_inclusive and self.hi_inclusive)
+        return self.lo > self.hi
+
+
+class IntervalTree:
+    """
+    a centered interval tree over intervals of one value family, answering
+    which intervals contain a point in O(log n + k).
+    """
+
+    def __init__(self, intervals: list[Interval]):
+        # nothing is in an empty interval, and they would break the partitioning.
+        intervals = [x for x in intervals if not x.empty()]
+        endpoints = sorted(
+            {x for i in intervals for x in (i.lo, i.hi) if x is not None}
+        )
+        self.left: IntervalTree | None = None
+        self.right: IntervalTree | None = None
+        if len(endpoints) == 0:
+            self.center = None
+            self.by_lo = intervals
+            self.by_hi = intervals
+            return
+
+        # intervals strictly on either side of the center go to the subtrees,
+        # the rest have lo <= center <= hi.
+        center = self.center = endpoints[len(endpoints) // 2]
+        left = []
+        right = []
+        mid = []
+        for x in intervals:
+            if x.hi is not None and x.hi < center:
+                left.append(x)
+            elif x.lo is not None and x.lo > center:
+                right.append(x)
+            else:
+                mid.append(x)
+
+        # loosest bounds first: unbounded, then by value, inclusive before not.
+        self.by_lo = sorted(
+            mid, key=lambda x: (x.lo is not None, x.lo, not x.lo_inclusive)
+        )
+        self.by_hi = sorted(
+            mid, key=lambda x: (x.hi is None, x.hi, x.hi_inclusive), reverse=True
+        )
+        if left:
+            self.left = IntervalTree(left)
+        if right:
+            self.right = IntervalTree(right)
+
+    def stab(self, value: Any, out: list[Interval]):
+        node = self
+        while node is not None:
+            if node.center is None:
+                out.extend(node.by_lo)
+                return
+
+            if value < node.center:
+                # everything here has hi >= center, so only the low end matters.
+                for x in node.by_lo:
+                    if not x.above_lo(value):
+                        break
+                    out.append(x)
+                node = node.left
+            elif value > node.center:
+                for x in node.by_hi:
+                    if not x.below_hi(value):
+                        break
+                    out.append(x)
+                node = node.right
+            else:
+                # bounds may exclude the center itself.
+                out.extend(x for x in node.by_lo if x.contains(value))
+                return
+
+
+@dataclass
+class _FieldIndex:
+    path: FieldPath
+    equal: dict[Any, set[Hashable]] = field(default_factory=dict)
+    intervals: dict[type, list[Interval]] = field(default_factory=dict)
+    trees: dict[type, IntervalTree] | None = None
+    refs: int = 0
+
+
+@dataclass
+class _Query:
+    matchers: list[Operator]
+    test: Callable[[dict], bool]
+    # (path, values) or (path, interval), None for scanned queries.
+    anchor: tuple[str, Any] | None
+
+
+def _conjuncts(matchers: Iterable[Operator]) -> Iterable[Operator]:
+    for x in matchers:
+        if isinstance(x, LogicalAnd):
+            yield from _conjuncts(x.value)
+        else:
+            yield x
+
+
+def anchors(
+    matchers: Iterable[Operator],
+) -> Iterable[tuple[int, str, list | Interval]]:
+    """
+    necessary conditions of the query on single fields, as
+    (cost, path, values or interval); lower cost is more selective.
+    """
+    for kv in _conjuncts(matchers):
+        if not isinstance(kv, MatchKeyValue):
+            continue
+        inner = kv.value
+        operators = list(_conjuncts([inner]))
+
+        interval = Interval()
+        bounded: type | None = None
+        for x in operators:
+            if isinstance(x, CmpEqual):
+                try:
+                    hash(x.value)
+                except TypeError:
+                    continue
+                yield 0, kv.key, [x.value]
+            elif isinstance(x, CmpIn):
+                if len(x.values.unhashable) == 0 and len(x.value) <= MAX_IN_ANCHOR:
+                    yield 1, kv.key, list(x.value)
+            elif isinstance(
+                x,
+                (
+                    CmpGreaterThan,
+                    CmpGreaterThanOrEqual,
+                    CmpLessThan,
+                    CmpLessThanOrEqual,
+                ),
+            ):
+                kind = family(x.value)
+                if kind is None or (bounded is not None and bounded != kind):
+                    continue
+                if x.value != x.value:
+                    # NaN, unordered against everything: it would break the
+                    # sorting of the trees, leave the query to the scan.
+                    continue
+                bounded = kind
+                lower = isinstance(x, (CmpGreaterThan, CmpGreaterThanOrEqual))
+                inclusive = isinstance(x, (CmpGreaterThanOrEqual, CmpLessThanOrEqual))
+                # the first bound on each side is kept, it is still necessary.
+                if lower and interval.lo is None:
+                    interval.lo, interval.lo_inclusive = x.value, inclusive
+                elif not lower and interval.hi is None:
+                    interval.hi, interval.hi_inclusive = x.value, inclusive
+
+        if bounded is not None:
+            closed = interval.lo is not None and interval.hi is not None
+            yield (2 if closed else 3), kv.key, interval
+
+
+class QueryIndex:
+    """
+    an index of queries, answering which of them match a record.
+
+    queries are registered under a key of the caller's choosing.
+    """
+
+    def __init__(self):
+        self._queries: dict[Hashable, _Query] = {}
+        self._fields: dict[str, _FieldIndex] = {}
+        self._scan: dict[Hashable, _Query] = {}
+
+    def add(self, key: Hashable, matchers: Iterable[Operator]):
+        if key in self._queries:
+            self.remove(key)
+
+        matchers = list(matchers)
+        best = min(anchors(matchers), key=lambda x: x[0], default=None)
+        query = _Query(matchers, compile(matchers), None)
+        self._queries[key] = query
+        if best is None:
+            self._scan[key] = query
+            return
+
+        (_, path, anchor) = best
+        if isinstance(anchor, Interval):
+            anchor = Interval(
+                anchor.lo, anchor.lo_inclusive, anchor.hi, anchor.hi_inclusive, key
+            )
+        query.anchor = (path, anchor)
+
+        index = self._fields.get(path)
+        if index is None:
+            index = self._fields[path] = _FieldIndex(FieldPath(path))
+        index.refs += 1
+
+        if isinstance(anchor, Interval):
+            kind = family(anchor.lo if anchor.lo is not None else anchor.hi)
+            index.intervals.setdefault(kind, []).append(anchor)
+            index.trees = None
+        else:
+            for value in anchor:
+                index.equal.setdefault(value, set()).add(key)
+
+    def remove(self, key: Hashable):
+        query = self._queries.pop(key)
+        self._scan.pop(key, None)
+        if query.anchor is None:
+            return
+
+        (path, anchor) = query.anchor
+        index = self._fields[path]
+        if isinstance(anchor, Interval):
+            for intervals in index.intervals.values():
+                if anchor in intervals:
+                    intervals.remove(anchor)
+            index.trees = None
+        else:
+            for value in anchor:
+                keys = index.equal.get(value)
+                if keys is not None:
+                    keys.discard(key)
+                    if len(keys) == 0:
+                        del index.equal[value]
+
+        index.refs -= 1
+        if index.refs == 0:
+            del self._fields[path]
+
+    def candidates(self, item: dict) -> set[Hashable]:
+        """
+        keys of the queries whose anchor `item` satisfies, plus scanned ones.
+        """
+        result = set(self._scan)
+        for index in self._fields.values():
+            try:
+                value = index.path.resolve(item)
+            except ValueError:
+                continue
+            if value is _MISSING:
+                value = None
+
+            if index.equal:
+                try:
+                    keys = index.equal.get(value)
+                except TypeError:
+                    keys = None
+                if keys:
+                    result.update(keys)
+
+            if index.intervals:
+                kind = family(value)
+                if kind is None:
+                    continue
+                if index.trees is None:
+                    index.trees = {
+                        k: IntervalTree(v) for k, v in index.intervals.items() if v
+                    }
+                tree = index.trees.get(kind)
+                if tree is not None:
+                    hits: list[Interval] = []
+                    tree.stab(value, hits)
+                    result.update(x.key for x in hits)
+        return result
+
+    def match(self, item: dict) -> set[Hashable]:
+        """
+        keys of the queries matching `item`.
+        """
+        result = set()
+        for key in self.candidates(item):
+            try:
+                if self._queries[key].test(item):
+                    result.add(key)
+            except (TypeError, ValueError):
+                pass
+        return result
+
+    def __len__(self) -> int:
+        return len(self._queries)
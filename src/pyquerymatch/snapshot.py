@@ -0,0 +1,559 @@
+"""
+an on-disk columnar snapshot of records, for running many queries over the
+same data without parsing it again.
+
+`write_snapshot` stores the values of chosen (dot notation) paths as
+fixed-width typed arrays: per path a presence bitmap, a bitmap of explicit
+nulls, and for each type of value found an array with a presence bitmap of
+its own. booleans, 64-bit integers and floats are stored as such, strings as
+codes into a sorted dictionary (so ordering comparisons work on the codes),
+and anything else (lists, objects, larger integers) as json text.
+
+`Snapshot` opens the file through `mmap` and evaluates deserialized queries
+over the arrays in place, with numpy. like `match_batch`, ordering
+comparisons on missing or incomparable values are false instead of raising,
+and paths through non-dicts are missing values.
+
+requires numpy, `pip install pyquerymatch[numpy]`.
+"""
+
+import json
+import math
+import mmap
+import operator as op
+import os
+import struct
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Any, Callable, Iterable
+
+from pyquerymatch.match import (
+    _MISSING,
+    CmpEqual,
+    CmpGreaterThan,
+    CmpGreaterThanOrEqual,
+    CmpIn,
+    CmpLessThan,
+    CmpLessThanOrEqual,
+    CmpNotEqual,
+    CmpNotIn,
+    Constant,
+    Exists,
+    FieldPath,
+    LogicalAnd,
+    LogicalNor,
+    LogicalNot,
+    LogicalOr,
+    MatchKeyValue,
+    Operator,
+    Ranges,
+    ValueSet,
+    deserialize,
+)
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+MAGIC = b"PQMSNAP1"
+VERSION = 1
+# buffers start at multiples of this, so typed views are aligned.
+ALIGNMENT = 64
+
+_INT64_MIN = -(1 << 63)
+_INT64_MAX = (1 << 63) - 1
+
+# the types of values a path holds, in the order their buffers are written.
+_NULL = "null"
+_BOOL = "bool"
+_INT = "int"
+_FLOAT = "float"
+_STR = "str"
+_OTHER = "other"
+
+_ORDERING: dict[type, Callable[[Any, Any], Any]] = {
+    CmpGreaterThan: op.gt,
+    CmpGreaterThanOrEqual: op.ge,
+    CmpLessThan: op.lt,
+    CmpLessThanOrEqual: op.le,
+}
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError(
+            "numpy is required for snapshots, install pyquerymatch[numpy]"
+        )
+
+
+class _ColumnWriter:
+    """
+    the values of one path, appended per record.
+    """
+
+    def __init__(self, path: str):
+        self.path = FieldPath(path)
+        self.kinds = bytearray()
+        self.bools = bytearray()
+        self.ints = array("q")
+        self.floats = array("d")
+        self.strings: dict[str, int] = {}
+        self.codes = array("l")
+        self.other: list[bytes] = []
+
+    def append(self, item: dict):
+        try:
+            value = self.path.resolve(item)
+        except ValueError:
+            value = _MISSING
+
+        if value is _MISSING:
+            self.kinds.append(0)
+        elif value is None:
+            self.kinds.append(1)
+        elif isinstance(value, bool):
+            self.kinds.append(2)
+            self.bools.append(value)
+        elif isinstance(value, int) and _INT64_MIN <= value <= _INT64_MAX:
+            self.kinds.append(3)
+            self.ints.append(value)
+        elif isinstance(value, float):
+            self.kinds.append(4)
+            self.floats.append(value)
+        elif isinstance(value, str):
+            self.kinds.append(5)
+            self.codes.append(self.strings.setdefault(value, len(self.strings)))
+        else:
+            try:
+                text = json.dumps(value).encode()
+            except (TypeError, ValueError) as e:
+                raise ValueError(f"value at '{self.path.path}' is not json: {e}") from e
+            self.kinds.append(6)
+            self.other.append(text)
+
+    def buffers(self) -> dict[str, Any]:
+        """
+        the arrays to write, keyed by name.
+        """
+        kinds = np.frombuffer(self.kinds, dtype=np.uint8)
+        length = len(kinds)
+        result = {"exists": _pack(kinds != 0)}
+
+        def scatter(kind: int, values: Any, dtype: Any) -> Any:
+            full = np.zeros(length, dtype=dtype)
+            full[kinds == kind] = values
+            return full
+
+        if (kinds == 1).any():
+            result[_NULL] = _pack(kinds == 1)
+        if len(self.bools) > 0:
+            result[_BOOL] = _pack(kinds == 2)
+            result[f"{_BOOL}.values"] = scatter(
+                2, np.frombuffer(self.bools, np.uint8), np.uint8
+            )
+        if len(self.ints) > 0:
+            result[_INT] = _pack(kinds == 3)
+            result[f"{_INT}.values"] = scatter(
+                3, np.frombuffer(self.ints, np.int64), "<i8"
+            )
+        if len(self.floats) > 0:
+            result[_FLOAT] = _pack(kinds == 4)
+            result[f"{_FLOAT}.values"] = scatter(
+                4, np.frombuffer(self.floats, np.float64), "<f8"
+            )
+        if len(self.strings) > 0:
+            ordered = sorted(self.strings)
+            # codes in insertion order to codes in sorted order.
+            remap = np.empty(len(ordered), dtype=np.int32)
+            remap[[self.strings[x] for x in ordered]] = np.arange(len(ordered))
+            codes = remap[np.asarray(self.codes, dtype=np.int64)]
+            result[_STR] = _pack(kinds == 5)
+            result[f"{_STR}.values"] = scatter(5, codes, "<i4")
+            (result[f"{_STR}.offsets"], result[f"{_STR}.data"]) = _blob(
+                [x.encode() for x in ordered]
+            )
+        if len(self.other) > 0:
+            result[_OTHER] = _pack(kinds == 6)
+            (result[f"{_OTHER}.offsets"], result[f"{_OTHER}.data"]) = _blob(self.other)
+        return result
+
+
+def _pack(mask: Any) -> Any:
+    return np.packbits(mask, bitorder="little")
+
+
+def _blob(values: list[bytes]) -> tuple[Any, Any]:
+    offsets = np.zeros(len(values) + 1, dtype="<i8")
+    np.cumsum([len(x) for x in values], out=offsets[1:])
+    return offsets, np.frombuffer(b"".join(values), dtype=np.uint8)
+
+
+def write_snapshot(
+    path: str | os.PathLike, records: Iterable[dict], paths: Iterable[str]
+) -> int:
+    """
+    writes the values at `paths` of `records` as a snapshot file to `path`,
+    returning the number of records. see `match.fields` for the paths a set of
+    queries needs.
+    """
+    _require_numpy()
+    writers = [_ColumnWriter(x) for x in dict.fromkeys(paths)]
+    length = 0
+    for item in records:
+        if not isinstance(item, dict):
+            raise ValueError("records must be dicts")
+        for writer in writers:
+            writer.append(item)
+        length += 1
+
+    columns: dict[str, dict[str, list]] = {}
+    buffers = []
+    offset = 0
+    for writer in writers:
+        entry = columns[writer.path.path] = {}
+        for name, data in writer.buffers().items():
+            data = np.ascontiguousarray(data)
+            entry[name] = [offset, data.dtype.str, len(data)]
+            buffers.append((offset, data))
+            offset += -(-data.nbytes // ALIGNMENT) * ALIGNMENT
+
+    header = json.dumps(
+        {"version": VERSION, "rows": length, "columns": columns}
+    ).encode()
+    start = -(-(len(MAGIC) + 8 + len(header)) // ALIGNMENT) * ALIGNMENT
+    with open(path, "wb") as fp:
+        fp.write(MAGIC + struct.pack("<Q", len(header)) + header)
+        for buffer_offset, data in buffers:
+            fp.seek(start + buffer_offset)
+            fp.write(data.tobytes())
+        fp.truncate(start + offset)
+    return length
+
+
+class _Column:
+    """
+    the arrays of one path in an open snapshot, read on first use.
+    """
+
+    def __init__(self, snapshot: "Snapshot", entry: dict[str, list]):
+        self.snapshot = snapshot
+        self.entry = entry
+        self.length = snapshot.rows
+        self._masks: dict[str, Any] = {}
+        self._dictionary: list[str] | None = None
+
+    def array(self, name: str) -> Any:
+        (offset, dtype, count) = self.entry[name]
+        return self.snapshot._array(offset, dtype, count)
+
+    def mask(self, name: str) -> Any:
+        """
+        the bitmap `name` as booleans, all false if not stored.
+        """
+        result = self._masks.get(name)
+        if result is None:
+            if name in self.entry:
+                bits = np.unpackbits(
+                    self.array(name), count=self.length, bitorder="little"
+                )
+                result = bits.view(bool)
+            else:
+                result = np.zeros(self.length, dtype=bool)
+            self._masks[name] = result
+        return result
+
+    def dictionary(self) -> list[str]:
+        if self._dictionary is None:
+            offsets = self.array(f"{_STR}.offsets").tolist()
+            data = self.array(f"{_STR}.data").tobytes()
+            self._dictionary = [
+                data[offsets[x] : offsets[x + 1]].decode()
+                for x in range(len(offsets) - 1)
+            ]
+        return self._dictionary
+
+    def other(self) -> tuple[Any, list]:
+        """
+        the rows holding other values, and their values.
+        """
+        rows = np.flatnonzero(self.mask(_OTHER))
+        if len(rows) == 0:
+            return rows, []
+        offsets = self.array(f"{_OTHER}.offsets").tolist()
+        data = self.array(f"{_OTHER}.data").tobytes()
+        values = [
+            json.loads(data[offsets[x] : offsets[x + 1]]) for x in range(len(rows))
+        ]
+        return rows, values
+
+    def _python(self, fn: Callable[[Any], bool]) -> Any:
+        """
+        `fn` over the other values, false where it raises.
+        """
+        result = np.zeros(self.length, dtype=bool)
+        (rows, values) = self.other()
+        for row, value in zip(rows, values):
+            try:
+                result[row] = fn(value)
+            except TypeError:
+                pass
+        return result
+
+    def _numeric(self, name: str) -> tuple[Any, Any] | None:
+        if name not in self.entry:
+            return None
+        return self.array(f"{name}.values"), self.mask(name)
+
+    def eq(self, value: Any) -> Any:
+        if value is None:
+            return ~self.mask("exists") | self.mask(_NULL)
+
+        result = self._python(lambda x: x == value)
+        if isinstance(value, (bool, int, float)):
+            for name in [_BOOL, _INT]:
+                part = self._numeric(name)
+                if part is not None:
+                    result |= part[1] & _int_compare(op.eq, part[0], value, self.length)
+            part = self._numeric(_FLOAT)
+            if part is not None:
+                result |= part[1] & _float_compare(op.eq, part[0], part[1], value)
+        elif isinstance(value, str) and _STR in self.entry:
+            dictionary = self.dictionary()
+            idx = bisect_left(dictionary, value)
+            if idx < len(dictionary) and dictionary[idx] == value:
+                result |= self.mask(_STR) & (self.array(f"{_STR}.values") == idx)
+        return result
+
+    def isin(self, values: ValueSet) -> Any:
+        result = self._python(lambda x: x in values)
+        if None in values.hashed:
+            result |= ~self.mask("exists") | self.mask(_NULL)
+
+        numbers = [x for x in values.hashed if isinstance(x, (bool, int, float))]
+        if numbers:
+            ints = [
+                int(x) for x in numbers if not isinstance(x, float) or x.is_integer()
+            ]
+            ints = [x for x in ints if _INT64_MIN <= x <= _INT64_MAX]
+            for name in [_BOOL, _INT]:
+                part = self._numeric(name)
+                if part is not None and ints:
+                    result |= part[1] & np.isin(part[0], ints)
+            part = self._numeric(_FLOAT)
+            if part is not None:
+                exact = [float(x) for x in numbers if float(x) == x]
+                result |= part[1] & np.isin(part[0], exact)
+
+        strings = [x for x in values.hashed if isinstance(x, str)]
+        if strings and _STR in self.entry:
+            dictionary = self.dictionary()
+            codes = []
+            for value in strings:
+                idx = bisect_left(dictionary, value)
+                if idx < len(dictionary) and dictionary[idx] == value:
+                    codes.append(idx)
+            if codes:
+                result |= self.mask(_STR) & np.isin(self.array(f"{_STR}.values"), codes)
+        return result
+
+    def compare(self, cmp: Callable[[Any, Any], Any], value: Any) -> Any:
+        result = self._python(lambda x: cmp(x, value))
+        if isinstance(value, (bool, int, float)):
+            for name in [_BOOL, _INT]:
+                part = self._numeric(name)
+                if part is not None:
+                    result |= part[1] & _int_compare(cmp, part[0], value, self.length)
+            part = self._numeric(_FLOAT)
+            if part is not None:
+                result |= part[1] & _float_compare(cmp, part[0], part[1], value)
+        elif isinstance(value, str) and _STR in self.entry:
+            # codes are in string order, compare against where `value` sorts.
+            dictionary = self.dictionary()
+            codes = self.array(f"{_STR}.values")
+            if cmp is op.gt:
+                matched = codes >= bisect_right(dictionary, value)
+            elif cmp is op.ge:
+                matched = codes >= bisect_left(dictionary, value)
+            elif cmp is op.lt:
+                matched = codes < bisect_left(dictionary, value)
+            else:
+                matched = codes < bisect_right(dictionary, value)
+            result |= self.mask(_STR) & matched
+        return result
+
+
+def _int_compare(
+    cmp: Callable[[Any, Any], Any], data: Any, value: Any, length: int
+) -> Any:
+    """
+    `cmp(data, value)` for an integer array, exact for any python number.
+    """
+    if isinstance(value, float):
+        if math.isnan(value):
+            return np.zeros(length, dtype=bool)
+        if math.isinf(value):
+            above = (value > 0) == (cmp in (op.lt, op.le))
+            return np.full(length, cmp is not op.eq and above)
+        if cmp is op.eq:
+            if not value.is_integer():
+                return np.zeros(length, dtype=bool)
+            value = int(value)
+        elif cmp in (op.gt, op.le):
+            # x > 2.5 is x > 2, x <= 2.5 is x <= 2.
+            value = math.floor(value)
+        else:
+            value = math.ceil(value)
+
+    value = int(value)
+    if value > _INT64_MAX:
+        return np.full(length, cmp in (op.lt, op.le))
+    if value < _INT64_MIN:
+        return np.full(length, cmp in (op.gt, op.ge))
+    return cmp(data.astype(np.int64, copy=False), np.int64(value))
+
+
+def _float_compare(
+    cmp: Callable[[Any, Any], Any], data: Any, present: Any, value: Any
+) -> Any:
+    """
+    `cmp(data, value)` for a float array, exact for any python number.
+    """
+    if isinstance(value, float) or float(value) == value:
+        return cmp(data, float(value))
+    # an integer a double cannot hold, compare the way python does.
+    result = np.zeros(len(data), dtype=bool)
+    rows = np.flatnonzero(present)
+    result[rows] = [cmp(x, value) for x in data[rows].tolist()]
+    return result
+
+
+class Snapshot:
+    """
+    a snapshot file written by `write_snapshot`, opened through `mmap`.
+
+    arrays are read from the mapping in place; the bitmaps and string
+    dictionaries a query uses are unpacked on first use and kept.
+    """
+
+    def __init__(self, path: str | os.PathLike):
+        _require_numpy()
+        with open(path, "rb") as fp:
+            self._mmap = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self._mmap[: len(MAGIC)] != MAGIC:
+            self._mmap.close()
+            raise ValueError(f"not a snapshot file: {path}")
+        (size,) = struct.unpack_from("<Q", self._mmap, len(MAGIC))
+        header = json.loads(self._mmap[len(MAGIC) + 8 : len(MAGIC) + 8 + size])
+        if header["version"] != VERSION:
+            self._mmap.close()
+            raise ValueError(f"unsupported snapshot version {header['version']}")
+
+        self._start = -(-(len(MAGIC) + 8 + size) // ALIGNMENT) * ALIGNMENT
+        self.rows: int = header["rows"]
+        self._columns = {
+            key: _Column(self, entry) for key, entry in header["columns"].items()
+        }
+
+    @property
+    def paths(self) -> list[str]:
+        return list(self._columns)
+
+    def __len__(self) -> int:
+        return self.rows
+
+    def _array(self, offset: int, dtype: str, count: int) -> Any:
+        return np.frombuffer(
+            self._mmap, dtype=np.dtype(dtype), count=count, offset=self._start + offset
+        )
+
+    def _column(self, path: str) -> _Column:
+        column = self._columns.get(path)
+        if column is None:
+            raise ValueError(f"path '{path}' is not in the snapshot")
+        return column
+
+    def _eval(self, operator: Operator, column: _Column | None) -> Any:
+        if isinstance(operator, MatchKeyValue):
+            if column is not None:
+                raise ValueError("KeyValueOperator can only be used with a dict")
+            return self._eval(operator.value, self._column(operator.key))
+
+        if isinstance(operator, LogicalAnd):
+            result = np.ones(self.rows, dtype=bool)
+            for x in operator.value:
+                result &= self._eval(x, column)
+            return result
+
+        if isinstance(operator, LogicalOr):
+            result = np.zeros(self.rows, dtype=bool)
+            for x in operator.value:
+                result |= self._eval(x, column)
+            return result
+
+        if isinstance(operator, LogicalNot):
+            return ~self._eval(operator.value, column)
+
+        if isinstance(operator, LogicalNor):
+            return self._eval(operator.value, column)
+
+        if isinstance(operator, Constant):
+            return np.full(self.rows, operator.value)
+
+        if isinstance(operator, Ranges):
+            return self._eval(operator.expand(), column)
+
+        if column is None:
+            raise ValueError(
+                f"operator '{operator.operator}' must be applied to a field in snapshots"
+            )
+
+        if isinstance(operator, Exists):
+            exists = column.mask("exists")
+            return exists.copy() if operator.value else ~exists
+
+        if isinstance(operator, CmpEqual):
+            return column.eq(operator.value)
+
+        if isinstance(operator, CmpNotEqual):
+            return ~column.eq(operator.value)
+
+        if isinstance(operator, CmpIn):
+            return column.isin(operator.values)
+
+        if isinstance(operator, CmpNotIn):
+            return ~column.isin(operator.values)
+
+        cmp = _ORDERING.get(type(operator))
+        if cmp is not None:
+            return column.compare(cmp, operator.value)
+
+        raise ValueError(f"operator '{type(operator)}' has no known snapshot logic")
+
+    def match(self, query: dict[str, Any] | Iterable[Operator]) -> Any:
+        """
+        a boolean mask of the rows matching `query`.
+        """
+        if isinstance(query, dict):
+            query = deserialize(query)
+        result = np.ones(self.rows, dtype=bool)
+        for m in query:
+            result &= self._eval(m, None)
+        return result
+
+    def indices(self, query: dict[str, Any] | Iterable[Operator]) -> Any:
+        """
+        the indices of the rows matching `query`, in order.
+        """
+        return np.flatnonzero(self.match(query))
+
+    def close(self):
+        self._columns.clear()
+        self._mmap.close()
+
+    def __enter__(self) -> "Snapshot":
+        return self
+
+    def __exit__(self, *args):
+        self.close()
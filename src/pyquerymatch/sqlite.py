@@ -0,0 +1,213 @@
+"""
+running queries against a table of a `sqlite3` connection.
+
+sqlite3 compiles every distinct statement once per connection and keeps it
+in its statement cache (see the `cached_statements` argument of
+`sqlite3.connect`), so the statements here are built through a `SqlCache`:
+queries of the same shape produce byte-identical sql and only bind new
+parameters. results are streamed in `fetchmany` batches.
+"""
+
+import re
+import sqlite3
+from itertools import count, islice
+from typing import Any, Iterable, Iterator
+
+from pyquerymatch.cache import SqlCache, shape
+from pyquerymatch.match import Operator, deserialize
+from pyquerymatch.query import (
+    LIST_EXPAND,
+    LIST_TEMP_TABLE,
+    LIST_THRESHOLD,
+    BuilderContext,
+    build,
+    load_temp_tables,
+)
+
+FETCH_SIZE = 1024
+# queries per UNION ALL statement, well below sqlite's compound select limit.
+UNION_SIZE = 32
+
+_IDENTIFIER = re.compile("[A-Za-z_][A-Za-z0-9_]*")
+
+
+def _identifier(name: str) -> str:
+    if _IDENTIFIER.fullmatch(name) is None:
+        raise ValueError(f"not a plain identifier '{name}'")
+    return name
+
+
+class SqliteExecutor:
+    """
+    runs queries against `table` on `connection`, returning `columns`.
+    """
+
+    def __init__(
+        self,
+        connection: sqlite3.Connection,
+        table: str,
+        columns: Iterable[str] = ("*",),
+        fetch_size: int = FETCH_SIZE,
+        list_mode: str = LIST_EXPAND,
+        list_threshold: int = LIST_THRESHOLD,
+        cache_size: int = 1024,
+    ):
+        columns = list(columns)
+        if columns != ["*"]:
+            columns = [_identifier(x) for x in columns]
+
+        self.connection = connection
+        self.table = _identifier(table)
+        self.columns = ", ".join(columns)
+        self.fetch_size = fetch_size
+        self.list_mode = list_mode
+        self.list_threshold = list_threshold
+        self.cache = (
+            None
+            if list_mode == LIST_TEMP_TABLE
+            else SqlCache(
+                cache_size, list_mode=list_mode, list_threshold=list_threshold
+            )
+        )
+        # temp tables get names of their own per statement, so statements
+        # still being fetched keep theirs.
+        self._statements = count()
+        # temp tables of finished statements, not dropped yet.
+        self._finished: list[str] = []
+
+    def _context(self) -> BuilderContext:
+        return BuilderContext(
+            list_mode=self.list_mode,
+            list_threshold=self.list_threshold,
+            temp_table_prefix=f"_in{next(self._statements)}_",
+        )
+
+    def _load(self, builder_ctx: BuilderContext) -> list[str]:
+        """
+        creates the temp tables of `builder_ctx`, returning their names.
+        """
+        self._drop([])
+        load_temp_tables(self.connection, builder_ctx)
+        return list(builder_ctx.temp_tables)
+
+    def _drop(self, tables: list[str]):
+        """
+        drops `tables` and those of earlier statements. sqlite refuses to
+        drop tables while any statement is being fetched, those are dropped
+        by a later call.
+        """
+        pending = self._finished + tables
+        self._finished = []
+        for idx, name in enumerate(pending):
+            try:
+                self.connection.execute(f"drop table if exists temp.{name}")
+            except sqlite3.OperationalError:
+                self._finished = pending[idx:]
+                return
+
+    def _build(
+        self, query: dict[str, Any] | Iterable[Operator]
+    ) -> tuple[str, dict, list[str]]:
+        """
+        the where clause and parameters for `query`, and the temp tables it
+        reads from.
+        """
+        if self.cache is not None and isinstance(query, dict):
+            return (*self.cache.build(query), [])
+
+        builder_ctx = self._context()
+        if isinstance(query, dict):
+            query = deserialize(query)
+        (where, params) = build(list(query), builder_ctx=builder_ctx)
+        return where, params, self._load(builder_ctx)
+
+    def _fetch(self, cursor: sqlite3.Cursor, tables: list[str]) -> Iterator[tuple]:
+        try:
+            while True:
+                rows = cursor.fetchmany(self.fetch_size)
+                if len(rows) == 0:
+                    return
+                yield from rows
+        finally:
+            if tables:
+                # the cursor still holds them until closed.
+                cursor.close()
+                self._drop(tables)
+
+    def select(self, query: dict[str, Any] | Iterable[Operator]) -> Iterator[tuple]:
+        """
+        lazily yields the rows matching `query`.
+        """
+        (where, params, tables) = self._build(query)
+        cursor = self.connection.execute(
+            f"select {self.columns} from {self.table} where {where}", params
+        )
+        return self._fetch(cursor, tables)
+
+    def select_many(
+        self, queries: Iterable[dict[str, Any]], union_size: int = UNION_SIZE
+    ) -> Iterator[tuple[int, tuple]]:
+        """
+        lazily yields (index of the query, row) for the rows matching each of
+        `queries`, running up to `union_size` queries of the same shape as one
+        UNION ALL statement. rows are grouped by statement, in no particular
+        order within one.
+        """
+        groups: dict[Any, list[tuple[int, dict]]] = {}
+        for idx, query in enumerate(queries):
+            try:
+                (key, _) = shape(query, self.list_mode, self.list_threshold)
+            except TypeError:
+                key = ("unshaped", idx)
+            groups.setdefault(key, []).append((idx, query))
+
+        for group in groups.values():
+            iterator = iter(group)
+            for batch in iter(
+                lambda iterator=iterator: list(islice(iterator, union_size)), []
+            ):
+                yield from self._select_union(batch)
+
+    def _select_union(
+        self, batch: list[tuple[int, dict]]
+    ) -> Iterator[tuple[int, tuple]]:
+        # one context, so parameter names are unique across the statement.
+        builder_ctx = self._context()
+        selects = []
+        params = {}
+        for pos, (_, query) in enumerate(batch):
+            (where, query_params) = build(
+                list(deserialize(query)), builder_ctx=builder_ctx
+            )
+            # positions rather than indices, so equal batches share the sql.
+            selects.append(
+                f"select {pos}, {self.columns} from {self.table} where {where}"
+            )
+            params.update(query_params)
+        tables = self._load(builder_ctx)
+
+        cursor = self.connection.execute(" union all ".join(selects), params)
+        for row in self._fetch(cursor, tables):
+            yield batch[row[0]][0], row[1:]
+
+    def delete_many(self, queries: Iterable[dict[str, Any]]) -> int:
+        """
+        deletes the rows matching any of `queries`, running queries of the
+        same shape through one `executemany`. returns the number of rows
+        deleted.
+        """
+        if self.cache is None:
+            raise ValueError("temp table lists cannot be deleted by executemany")
+
+        groups: dict[str, list[dict]] = {}
+        for query in queries:
+            (where, params) = self.cache.build(query)
+            groups.setdefault(where, []).append(params)
+
+        count = 0
+        for where, params in groups.items():
+            cursor = self.connection.executemany(
+                f"delete from {self.table} where {where}", params
+            )
+            count += cursor.rowcount
+        return count
@@ -0,0 +1,102 @@
+"""
+filtering streams of records: iterables of dicts, or NDJSON from paths,
+file handles and iterables of lines.
+"""
+
+import json
+import os
+from typing import IO, Any, Callable, Iterable, Iterator
+
+from pyquerymatch.compiler import compile
+from pyquerymatch.match import Operator, deserialize
+
+# bytes read per chunk of lines, bounds memory use regardless of file size.
+CHUNK_SIZE = 1 << 20
+
+Query = dict[str, Any] | Iterable[Operator] | Callable[[dict], bool]
+Source = Iterable[dict] | Iterable[bytes] | Iterable[str] | IO | str | os.PathLike
+
+
+def predicate(query: Query) -> Callable[[dict], bool]:
+    """
+    a predicate for a query document, deserialized operators or a predicate.
+    """
+    if callable(query):
+        return query
+    if isinstance(query, dict):
+        return compile(deserialize(query))
+    return compile(query)
+
+
+def _chunks(fp: IO, chunk_size: int) -> Iterator[list]:
+    while True:
+        lines = fp.readlines(chunk_size)
+        if len(lines) == 0:
+            return
+        yield lines
+
+
+def _filter_lines(
+    lines: Iterable[list], test: Callable[[dict], bool], raw: bool
+) -> Iterator:
+    loads = json.loads
+    for chunk in lines:
+        for line in chunk:
+            if len(line.strip()) == 0:
+                continue
+            item = loads(line)
+            if test(item):
+                yield line if raw else item
+
+
+def filter_stream(
+    source: Source,
+    query: Query,
+    /,
+    raw: bool = False,
+    chunk_size: int = CHUNK_SIZE,
+) -> Iterator:
+    """
+    lazily yields the records from `source` matching `query`.
+
+    `source` may be a path to an NDJSON file, a file handle (binary or text),
+    or an iterable of dicts or of NDJSON lines. with `raw`, matching lines are
+    yielded as read (including the line terminator) instead of as parsed
+    dicts, so they can be written out untouched; this requires line input.
+    """
+    test = predicate(query)
+
+    if isinstance(source, (str, os.PathLike)):
+        return _filter_path(source, test, raw, chunk_size)
+
+    if hasattr(source, "readlines"):
+        return _filter_lines(_chunks(source, chunk_size), test, raw)
+
+    return _filter_iterable(source, test, raw)
+
+
+def _filter_path(
+    path: str | os.PathLike,
+    test: Callable[[dict], bool],
+    raw: bool,
+    chunk_size: int,
+) -> Iterator:
+    with open(path, "rb") as fp:
+        yield from _filter_lines(_chunks(fp, chunk_size), test, raw)
+
+
+def _filter_iterable(
+    source: Iterable, test: Callable[[dict], bool], raw: bool
+) -> Iterator:
+    loads = json.loads
+    for item in source:
+        if isinstance(item, (bytes, bytearray, str)):
+            if len(item.strip()) == 0:
+                continue
+            parsed = loads(item)
+            if test(parsed):
+                yield item if raw else parsed
+        elif raw:
+            raise ValueError("raw output requires lines as input")
+        elif test(item):
+            yield item
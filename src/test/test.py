@@ -1,11 +1,66 @@
+import asyncio
+import dataclasses
+import io
+import json
 import os
+import pickle
+import sqlite3
+import tempfile
 import unittest
+from concurrent.futures import ThreadPoolExecutor
 from typing import TypedDict
 
 import yaml
 
-from pyquerymatch import deserialize, match
-from pyquerymatch.query import build
+from pyquerymatch import (
+    QueryCache,
+    SqlCache,
+    compile,
+    deserialize,
+    filter_stream,
+    match,
+)
+from pyquerymatch.adaptive import AdaptiveMatcher
+from pyquerymatch.aio import AsyncExecutor, afilter
+from pyquerymatch.batch import match_batch
+from pyquerymatch.collection import IndexedCollection
+from pyquerymatch.compiler import CompiledQuery
+from pyquerymatch.dialect import MYSQL, POSTGRES, Dialect
+from pyquerymatch.lazy import RawMatcher, filter_raw
+from pyquerymatch.live import ENTERED, LEFT, Event, LiveQuery
+from pyquerymatch.match import (
+    CmpEqual,
+    CmpGreaterThan,
+    CmpGreaterThanOrEqual,
+    CmpIn,
+    CmpLessThan,
+    Constant,
+    LogicalAnd,
+    LogicalNot,
+    LogicalOr,
+    MatchKeyValue,
+    Operator,
+    Ranges,
+    fields,
+)
+from pyquerymatch.optimize import optimize, order_indices
+from pyquerymatch.parallel import parallel_filter
+from pyquerymatch.profiling import Profiler, explain
+from pyquerymatch.queryindex import QueryIndex
+from pyquerymatch.snapshot import Snapshot, write_snapshot
+from pyquerymatch.sqlite import SqliteExecutor
+from pyquerymatch.query import (
+    LIST_MODES,
+    BuilderContext,
+    build,
+    index_ddl,
+    load_temp_tables,
+)
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 
 class SqlTestCase(TypedDict):
@@ -19,6 +74,38 @@ class TestCase(TypedDict):
     sql: SqlTestCase | None
 
 
+def to_columns(data: list[dict]) -> dict:
+    """
+    flattens records into masked object columns, one per (dot notation) path.
+    """
+    paths = {}
+
+    def collect(prefix: str, item: dict):
+        for key, value in item.items():
+            path = f"{prefix}{key}"
+            paths[path] = None
+            if isinstance(value, dict):
+                collect(f"{path}.", value)
+
+    for x in data:
+        collect("", x)
+
+    columns = {}
+    for path in paths:
+        values = np.empty(len(data), dtype=object)
+        mask = np.zeros(len(data), dtype=bool)
+        for idx, x in enumerate(data):
+            for segment in path.split("."):
+                if not isinstance(x, dict) or segment not in x:
+                    mask[idx] = True
+                    break
+                x = x[segment]
+            else:
+                values[idx] = x
+        columns[path] = np.ma.masked_array(values, mask=mask)
+    return columns
+
+
 class TestMatchers(unittest.TestCase):
     def read_resource(self, name) -> bytes:
         file_path = os.path.join(
@@ -44,6 +131,16 @@ class TestMatchers(unittest.TestCase):
             print(f"{expected=} {actual=}")
             self.assertEqual(expected, actual)
 
+            compiled = compile(matchers)
+            self.assertEqual(expected, [x for x in base["data"] if compiled(x)])
+
+            optimized = optimize(matchers)
+            self.assertEqual(expected, [x for x in base["data"] if match(x, optimized)])
+
+            if np is not None:
+                mask = match_batch(to_columns(base["data"]), matchers)
+                self.assertEqual(expected, [x for x, m in zip(base["data"], mask) if m])
+
             sql = case.get("sql")
             if sql is not None:
                 sql = SqlTestCase(**sql)
@@ -71,3 +168,951 @@ class TestMatchers(unittest.TestCase):
 
     def test_dot_notation(self):
         self.impl_test_resource("05-dot-notation.yaml")
+        self.impl_test_resource("06-dot-notation-deep.yaml")
+
+    def test_compile(self):
+        matchers = list(deserialize({"num": {"$exists": True, "$gte": 2}}))
+        compiled = compile(matchers)
+        self.assertTrue(compiled({"num": 2}))
+        self.assertFalse(compiled({"num": 1}))
+
+        # values are never tested for truth (numpy arrays raise when they are).
+        class Ambiguous:
+            def __bool__(self):
+                raise ValueError("ambiguous")
+
+        matchers = list(deserialize({"a": {"$exists": True}, "b.c": {"$ne": 1}}))
+        item = {"a": Ambiguous(), "b": {"c": Ambiguous()}}
+        self.assertTrue(match(item, matchers))
+        self.assertTrue(compile(matchers)(item))
+
+        # errors are surfaced the same way match() does, at compile time.
+        with self.assertRaises(ValueError):
+            compile(deserialize({"$exists": True}))
+
+        # trees too deep for the python parser fall back to the interpreter.
+        query = {"$gt": 1}
+        for _ in range(250):
+            query = {"$not": query}
+        matchers = list(deserialize({"num": query}))
+        self.assertEqual(compile(matchers)({"num": 2}), match({"num": 2}, matchers))
+
+    def test_in_value_set(self):
+        matchers = list(deserialize({"v": {"$in": [1, "a", [1, 2], {"k": 1}]}}))
+        compiled = compile(matchers)
+        for value, expected in [
+            (1, True),
+            (True, True),
+            (1.0, True),
+            (False, False),
+            ("a", True),
+            ([1, 2], True),
+            ([2, 1], False),
+            ({"k": 1}, True),
+            ({"k": 2}, False),
+            (None, False),
+        ]:
+            self.assertEqual(expected, match({"v": value}, matchers), value)
+            self.assertEqual(expected, compiled({"v": value}), value)
+
+        matchers = list(deserialize({"v": {"$nin": list(range(100_000))}}))
+        self.assertTrue(match({"v": -1}, matchers))
+        self.assertFalse(match({"v": 99_999}, matchers))
+        self.assertTrue(match({"v": [99_999]}, matchers))
+
+    @unittest.skipIf(np is None, "numpy not installed")
+    def test_match_batch(self):
+        columns = {
+            "num": np.arange(10),
+            "tag": np.array(["a", "b"] * 5),
+            "opt": np.ma.masked_array(np.arange(10), mask=[True, False] * 5),
+        }
+        matchers = [
+            *deserialize(
+                {
+                    "num": {"$gte": 2, "$nin": [4, 5]},
+                    "tag": {"$in": ["a", 1]},
+                    "missing": {"$eq": None},
+                }
+            ),
+            *deserialize({"$or": [{"opt": {"$exists": False}}, {"opt": {"$gt": 100}}]}),
+        ]
+        self.assertEqual(
+            [2, 6, 8], list(np.flatnonzero(match_batch(columns, matchers)))
+        )
+
+        with self.assertRaises(ValueError):
+            match_batch(columns, deserialize({"$gt": 1}))
+
+    @unittest.skipIf(np is None, "numpy not installed")
+    def test_snapshot(self):
+        records = [
+            {"num": 1, "tag": "b", "size": {"h": 2.5}},
+            {"num": 2.0, "tag": "a", "size": None},
+            {"num": True, "tag": "c", "size": {"h": 14}},
+            {"num": 2**70, "size": 1},
+            {"num": None, "tag": ["a"], "extra": 1},
+            {"num": 1.5, "tag": "ab", "size": {"h": None}},
+        ]
+        queries = [
+            ({"num": {"$gte": 1, "$lt": 2}}, [0, 2, 5]),
+            ({"num": {"$gt": 2**64}}, [3]),
+            ({"num": None}, [4]),
+            ({"num": {"$in": [2, 3, None]}}, [1, 4]),
+            ({"tag": {"$gt": "a"}}, [0, 2, 5]),
+            ({"tag": {"$in": ["a", "zz", ["a"]]}}, [1, 4]),
+            ({"tag": {"$lte": "b"}}, [0, 1, 5]),
+            ({"size.h": {"$exists": True}}, [0, 2, 5]),
+            ({"size.h": {"$ne": None}}, [0, 2]),
+            ({"$or": [{"size.h": {"$gt": 10}}, {"tag": "a"}]}, [1, 2]),
+            ({"$nor": [{"num": {"$exists": False}}, {"num": 1}]}, [1, 3, 4, 5]),
+        ]
+        paths = fields(x for query, _ in queries for x in deserialize(query))
+        self.assertEqual(["num", "size.h", "tag"], paths)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "snapshot")
+            self.assertEqual(6, write_snapshot(path, records, paths))
+            with Snapshot(path) as snapshot:
+                self.assertEqual(6, len(snapshot))
+                for query, expected in queries:
+                    self.assertEqual(expected, list(snapshot.indices(query)), query)
+
+                # ordering on missing values is false instead of raising.
+                self.assertEqual([0, 2], list(snapshot.indices({"size.h": {"$gt": 1}})))
+                with self.assertRaises(ValueError):
+                    snapshot.match({"extra": 1})
+
+            with open(path, "wb") as fp:
+                fp.write(b"not a snapshot")
+            with self.assertRaises(ValueError):
+                Snapshot(path)
+
+    def test_live_query(self):
+        items = [
+            {"_id": 1, "status": "A", "size": {"h": 20}, "n": 0},
+            {"_id": 2, "status": "B", "size": {"h": 20}, "n": 0},
+            {"_id": 3, "status": "A", "size": "large", "n": 0},
+        ]
+        seen = []
+        live = LiveQuery(
+            deserialize({"status": "A", "size.h": {"$gt": 10}}),
+            items,
+            listener=seen.append,
+        )
+        self.assertEqual([1], [x["_id"] for x in live])
+
+        # only fields the query does not read changed, nothing to evaluate.
+        evaluated = live.evaluated
+        self.assertEqual([], live.update(items[0], {**items[0], "n": 1}))
+        self.assertEqual([], live.update(items[1], {**items[1], "n": 1}))
+        self.assertEqual((evaluated, 2), (live.evaluated, live.skipped))
+        self.assertEqual(1, live.matching[1]["n"])
+
+        entered = {"_id": 2, "status": "A", "size": {"h": 20}}
+        self.assertEqual([Event(ENTERED, 2, entered)], live.update(items[1], entered))
+        # dot notation through a non-dict does not match, instead of raising.
+        self.assertEqual([], live.update(items[2], {**items[2], "n": 1}))
+        self.assertEqual([], live.insert({"_id": 4, "status": "A"}))
+
+        left = {"_id": 1, "status": "A", "size": {"h": 5}}
+        self.assertEqual([Event(LEFT, 1, left)], live.update(live.matching[1], left))
+        self.assertEqual([Event(LEFT, 2, entered)], live.delete(entered))
+        self.assertEqual(0, len(live))
+
+        # a changed key leaves under the old one and enters under the new one.
+        live.insert(entered)
+        moved = {**entered, "_id": 5}
+        self.assertEqual(
+            [Event(LEFT, 2, entered), Event(ENTERED, 5, moved)],
+            live.update(entered, moved),
+        )
+        self.assertIn(5, live)
+        self.assertEqual(
+            [ENTERED, LEFT, LEFT, ENTERED, LEFT, ENTERED], [x.kind for x in seen]
+        )
+
+    def test_query_cache(self):
+        cache = QueryCache(max_size=2)
+        a = cache.deserialize({"num": {"$gt": 1, "$lt": 5}})
+        self.assertIs(a, cache.deserialize({"num": {"$gt": 1, "$lt": 5}}))
+        self.assertEqual((1, 1), (cache.hits, cache.misses))
+
+        # equal, but differently typed, values do not share an entry.
+        self.assertIsNot(cache.deserialize({"b": True}), cache.deserialize({"b": 1}))
+        self.assertEqual((1, 3, 1), (cache.hits, cache.misses, cache.evictions))
+        self.assertEqual(2, len(cache))
+
+        compiled = cache.compile({"b": 1})
+        self.assertIs(compiled, cache.compile({"b": 1}))
+        self.assertTrue(compiled({"b": 1}))
+
+        # key order only matters when asked to.
+        self.assertIsNot(
+            cache.deserialize({"x": 1, "y": 2}), cache.deserialize({"y": 2, "x": 1})
+        )
+        cache = QueryCache(sort_keys=True)
+        self.assertIs(
+            cache.deserialize({"x": 1, "y": 2}), cache.deserialize({"y": 2, "x": 1})
+        )
+
+        with self.assertRaises(ValueError):
+            cache.deserialize({"$unknown": 1})
+        self.assertEqual(1, len(cache))
+
+    def test_optimize(self):
+        def optimized(query):
+            return optimize(deserialize(query))
+
+        # flattening, double negation, $nor and single-element chains.
+        self.assertEqual(
+            [MatchKeyValue("a", CmpEqual(1)), MatchKeyValue("b", CmpEqual(2))],
+            optimized({"$and": [{"$and": [{"a": 1}, {"b": 2}]}, {"a": 1}]}),
+        )
+        self.assertEqual(
+            [MatchKeyValue("a", CmpGreaterThan(1))],
+            optimized({"a": {"$not": {"$not": {"$gt": 1}}}}),
+        )
+        self.assertEqual(
+            [MatchKeyValue("a", LogicalNot(CmpIn([1, 2])))],
+            optimized({"a": {"$nor": [{"$eq": 1}, {"$eq": 2}]}}),
+        )
+
+        # bounds on the same field merge, contradictions fold away.
+        self.assertEqual(
+            [MatchKeyValue("a", LogicalAnd([CmpGreaterThan(5), CmpLessThan(9)]))],
+            optimized({"$and": [{"a": {"$gt": 1, "$lt": 9}}, {"a": {"$gt": 5}}]}),
+        )
+        self.assertEqual([Constant(False)], optimized({"a": {"$gt": 5, "$lt": 3}}))
+        self.assertEqual(
+            [MatchKeyValue("b", CmpEqual(1))],
+            optimized({"$or": [{"a": {"$gt": 5, "$lt": 3}}, {"b": 1}]}),
+        )
+        (query, params) = build(optimized({"a": {"$eq": 4, "$gt": 3, "$lt": 9}}))
+        self.assertEqual(("a = :a0", {"a0": 4}), (query, params))
+
+        # cheap checks move first, but never ahead of a check guarding them.
+        self.assertEqual(
+            [MatchKeyValue("b", CmpEqual(1)), MatchKeyValue("a", CmpGreaterThan(1))],
+            optimized({"$and": [{"a": {"$gt": 1}}, {"b": 1}]}),
+        )
+        matchers = optimized({"$and": [{"b": 1}, {"a": {"$gt": 1}}, {"c": 1}]})
+        self.assertFalse(match({"b": 2}, matchers))
+        self.assertEqual(MatchKeyValue("b", CmpEqual(1)), matchers[0])
+
+        # nested fields and $exists outside a field raise, and stay behind.
+        for query in [
+            {"x": {"$ne": 1}, "a": {"b": 1}},
+            {"$and": [{"x": {"$ne": 1}}, {"$exists": True}]},
+        ]:
+            self.assertFalse(match({"x": 1}, optimized(query)), query)
+
+    def test_optimize_disjunction(self):
+        query = {
+            "$or": [
+                {"n": 1},
+                {"n": {"$in": [2, 3]}},
+                {"n": {"$gte": 10, "$lt": 20}},
+                {"n": {"$gt": 15}},
+                {"n": {"$lte": 0}},
+                {"n": {"$gte": "a", "$lt": "b"}},
+                {"t": "x"},
+            ]
+        }
+        matchers = list(deserialize(query))
+        optimized = optimize(matchers)
+        ranges = Ranges(((None, False, 0, True), (10, True, None, False)))
+        self.assertEqual(
+            [
+                LogicalOr(
+                    [
+                        MatchKeyValue(
+                            "n",
+                            LogicalOr(
+                                [
+                                    CmpIn([1, 2, 3]),
+                                    ranges,
+                                    LogicalAnd(
+                                        [
+                                            CmpGreaterThanOrEqual("a"),
+                                            CmpLessThan("b"),
+                                        ]
+                                    ),
+                                ]
+                            ),
+                        ),
+                        MatchKeyValue("t", CmpEqual("x")),
+                    ]
+                )
+            ],
+            optimized,
+        )
+        self.assertEqual(
+            (
+                "((((n in (:n0, :n1, :n2)) or ((n <= :n3 or n >= :n4))"
+                " or (((n >= :n5) and (n < :n6))))) or (t = :t0))",
+                {
+                    "n0": 1,
+                    "n1": 2,
+                    "n2": 3,
+                    "n3": 0,
+                    "n4": 10,
+                    "n5": "a",
+                    "n6": "b",
+                    "t0": "x",
+                },
+            ),
+            build(optimized),
+        )
+
+        # without the string bounds, which raise for numbers.
+        matchers = list(deserialize({"$or": query["$or"][:5]}))
+        optimized = optimize(matchers)
+        for value in [-1, 0, 0.5, 1, 3, 5, 9.9, 10, 25, float("nan")]:
+            item = {"n": value}
+            self.assertEqual(match(item, matchers), match(item, optimized), value)
+            self.assertEqual(match(item, matchers), compile(optimized)(item), value)
+
+        # bounds and points as one bisection.
+        ranges = Ranges(
+            ((1, True, 2, False), (5, True, 5, True), (7, False, None, False))
+        )
+        self.assertEqual(
+            [1, 1.5, 5, 8],
+            [x for x in [0, 1, 1.5, 2, 5, 6, 7, 8] if ranges.contains(x)],
+        )
+        with self.assertRaises(TypeError):
+            ranges.contains("a")
+        self.assertEqual(
+            ("n between :n0 and :n1", {"n0": 1, "n1": 2}),
+            build([MatchKeyValue("n", Ranges(((1, True, 2, True),)))]),
+        )
+
+    def test_adaptive(self):
+        matchers = list(
+            deserialize(
+                {
+                    "$and": [
+                        {"common": {"$ne": 0}},
+                        {"num": {"$in": [1, 2]}},
+                        {"rare": 1},
+                    ]
+                }
+            )
+        )
+        adaptive = AdaptiveMatcher(matchers, sample_every=2, reorder_every=100)
+        data = [
+            {"common": 1, "num": x % 3, "rare": int(x % 50 == 0)} for x in range(1000)
+        ]
+        self.assertEqual(
+            [x for x in data if match(x, matchers)], [x for x in data if adaptive(x)]
+        )
+        # the clause rejecting almost everything moved to the front.
+        self.assertEqual(
+            MatchKeyValue("rare", CmpEqual(1)), adaptive.matchers[0].value[0]
+        )
+
+        # clauses that raise stay behind the check that skips them when
+        # reordered; compiling rejects them, so the matcher does too.
+        for query in [
+            {"x": {"$ne": 1}, "a": {"b": 1}},
+            {"$and": [{"x": {"$ne": 1}}, {"$exists": True}]},
+        ]:
+            operators = list(deserialize(query))
+            if isinstance(operators[0], LogicalAnd):
+                operators = operators[0].value
+            self.assertEqual([0, 1], order_indices(operators, [1.0, 0.0]), query)
+            with self.assertRaises(ValueError):
+                AdaptiveMatcher(deserialize(query))
+
+    def test_filter_stream(self):
+        data = [{"num": x} for x in range(10)]
+        lines = b"".join(json.dumps(x).encode() + b"\n" for x in data) + b"\n"
+        query = {"num": {"$in": [3, 7]}}
+        expected = [{"num": 3}, {"num": 7}]
+
+        self.assertEqual(expected, list(filter_stream(data, query)))
+        self.assertEqual(
+            expected, list(filter_stream(io.BytesIO(lines), query, chunk_size=16))
+        )
+        self.assertEqual(
+            [b'{"num": 3}\n', b'{"num": 7}\n'],
+            list(filter_stream(io.BytesIO(lines), deserialize(query), raw=True)),
+        )
+        self.assertEqual(
+            expected, list(filter_stream(lines.decode().splitlines(), query))
+        )
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "data.jsonl")
+            with open(path, "wb") as fp:
+                fp.write(lines)
+            self.assertEqual(expected, list(filter_stream(path, query)))
+
+    def test_raw_matcher(self):
+        query = {"a": {"$gte": 2}, "c.d": {"$in": [1, "x"]}}
+        lines = [
+            b'{"a": 2, "c": {"d": 1}}',
+            b'{"c": {"d": "x"}, "a": 3}\n',
+            # the names also appear nested, as values and inside strings.
+            b'{"b": {"a": 9}, "a": 1, "x": "a", "c": {"d": 1}}',
+            b'{"s": "\\"a\\": 5", "a": 5, "c": {"d": 1}}',
+            b'{"s": "{[", "a": 2, "c": {"d": "x"}}',
+            b'{"a": 2, "a": 1, "c": {"d": 1}}',
+            b' { "a" : 4 , "c" : { "d" : "x" } }',
+            b'{"a": 3, "c": {"d": "\xc3\xa9"}, "e": "\xc3\xa9"}',
+            b'{"a": 7, "c": {"e": 1}}',
+            b'{"a": 2, "c": null}',
+            # values longer than the first window decoded, cut in a number.
+            b'{"a": 2, "c": {"s": "' + "\u00e9".encode() * 40 + b'", "d": 1}}',
+            b'{"a": ' + b"1" * 63 + b'e-70, "c": {"d": 1}}',
+        ]
+        matchers = list(deserialize(query))
+        test = RawMatcher(matchers)
+        self.assertEqual(["a", "c"], test.fields)
+        for line in lines:
+            expected = match(json.loads(line), matchers)
+            self.assertEqual(expected, test(line), line)
+            self.assertEqual(expected, test(memoryview(line)), line)
+
+        # later clauses are not read once one fails.
+        self.assertFalse(test(b'{"a": 1, "c": not json}'))
+        with self.assertRaises(TypeError):
+            test(b'{"a": "x"}')
+        with self.assertRaises(ValueError):
+            test(b"[1, 2]")
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "data.jsonl")
+            with open(path, "wb") as fp:
+                fp.write(b"\n".join(lines) + b"\n\n")
+            expected = [b'{"a": 2, "c": {"d": 1}}\n', b'{"c": {"d": "x"}, "a": 3}\n']
+            self.assertEqual(expected, list(filter_raw(path, query))[:2])
+            with open(path, "rb") as fp:
+                self.assertEqual(expected, list(filter_raw(fp, query))[:2])
+
+    def test_parallel_filter(self):
+        data = [{"num": x, "pad": "x" * (x % 7)} for x in range(1000)]
+        query = {"num": {"$gte": 10, "$lt": 990}, "pad": {"$ne": ""}}
+        expected = [x for x in data if match(x, deserialize(query))]
+
+        actual = list(parallel_filter(data, query, workers=2, chunk_records=64))
+        self.assertEqual(expected, actual)
+        lines = [json.dumps(x).encode() for x in data] + [b"  "]
+        actual = list(parallel_filter(lines, query, workers=2, chunk_records=64))
+        self.assertEqual(expected, actual)
+
+        # checked on the call, before a pool is started.
+        with self.assertRaises(ValueError):
+            parallel_filter(data, query, raw=True)
+        # value sets are rebuilt by the workers, not pickled with the list.
+        shipped = pickle.dumps(CompiledQuery(deserialize({"a": {"$in": [1, 2]}})))
+        self.assertNotIn(b"ValueSet", shipped)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "data.jsonl")
+            with open(path, "wb") as fp:
+                for x in data:
+                    fp.write(json.dumps(x).encode() + b"\n")
+
+            actual = parallel_filter(path, query, workers=2, chunk_bytes=1000)
+            self.assertEqual(expected, list(actual))
+
+            actual = parallel_filter(
+                path, deserialize(query), workers=2, chunk_bytes=777, ordered=False
+            )
+            self.assertEqual(
+                sorted(x["num"] for x in expected), sorted(x["num"] for x in actual)
+            )
+
+    def test_query_index(self):
+        queries = {
+            "eq": {"status": "A"},
+            "in": {"status": {"$in": ["B", "C"]}, "qty": {"$gt": 10}},
+            "range": {"qty": {"$gte": 20, "$lt": 50}},
+            "open": {"size.h": {"$gt": 10}},
+            "empty": {"qty": {"$gt": 50, "$lt": 10}},
+            "scan": {"$or": [{"status": "D"}, {"qty": 5}]},
+        }
+        index = QueryIndex()
+        for key, query in queries.items():
+            index.add(key, deserialize(query))
+        index.add("removed", deserialize({"status": "A"}))
+        index.remove("removed")
+
+        data = [
+            {"status": "A", "qty": 25, "size": {"h": 14}},
+            {"status": "B", "qty": 5},
+            {"status": "C", "qty": 50, "size": {"h": 8.5}},
+            {"status": "D", "qty": 20, "size": None},
+        ]
+        for item in data:
+            expected = set()
+            for key, query in queries.items():
+                try:
+                    if match(item, deserialize(query)):
+                        expected.add(key)
+                except TypeError:
+                    pass
+            self.assertEqual(expected, index.match(item), item)
+
+        # only the anchors a record satisfies are checked.
+        self.assertEqual({"eq", "range", "open", "scan"}, index.candidates(data[0]))
+
+        # a NaN bound must not break the trees for the other queries.
+        index = QueryIndex()
+        index.add("nan", deserialize({"a": {"$gt": float("nan")}}))
+        index.add("two", deserialize({"a": {"$gte": 2}}))
+        index.add("zero", deserialize({"a": {"$gte": 0}}))
+        self.assertEqual({"zero"}, index.match({"a": 0}))
+        self.assertEqual({"zero"}, index.match({"a": 1}))
+        self.assertEqual({"two", "zero"}, index.match({"a": 3}))
+
+    def test_indexed_collection(self):
+        data = [
+            {"status": "A", "qty": 25, "size": {"h": 14}},
+            {"status": "B", "qty": 5},
+            {"status": "C", "qty": 50, "size": {"h": 8.5}},
+            {"status": "D", "qty": 20, "size": None},
+            {"status": "A", "qty": 70, "size": "big"},
+        ]
+        collection = IndexedCollection(
+            data,
+            hash_paths=["status"],
+            sorted_paths=["qty", "size.h"],
+            exists_paths=["size"],
+        )
+        queries = [
+            {"status": "A"},
+            {"status": {"$in": ["B", "C"]}, "qty": {"$gt": 10}},
+            {"qty": {"$gte": 20, "$lt": 50}},
+            {"size.h": {"$gt": 10}},
+            {"size": {"$exists": False}},
+            {"$or": [{"status": "D"}, {"qty": 5}]},
+            {"status": {"$not": {"$eq": "A"}}},
+            {"status": {"$nin": ["A", "B"]}, "size": {"$exists": True}},
+            {"qty": {"$lt": 30}, "size": {"$eq": None}},
+        ]
+        for query in queries:
+            expected = []
+            for idx, item in enumerate(data):
+                try:
+                    if match(item, deserialize(query)):
+                        expected.append(idx)
+                except (TypeError, ValueError):
+                    pass
+            self.assertEqual(expected, collection.positions(deserialize(query)), query)
+            self.assertEqual(
+                [data[x] for x in expected], collection.find(deserialize(query))
+            )
+
+        # NaN is outside every range, and must not break the sort order.
+        nan = float("nan")
+        collection = IndexedCollection(
+            [{"a": x} for x in [1, nan, 0, 3, 2, nan, -1]], sorted_paths=["a"]
+        )
+        self.assertEqual(
+            [0, 2, 3, 4], collection.positions(deserialize({"a": {"$gte": 0}}))
+        )
+        self.assertEqual(
+            [0, 2, 6], collection.positions(deserialize({"a": {"$lt": 2}}))
+        )
+        self.assertEqual(
+            [1, 3, 4, 5], collection.positions(deserialize({"a": {"$not": {"$lt": 2}}}))
+        )
+        self.assertEqual([], collection.positions(deserialize({"a": {"$gte": nan}})))
+
+    def test_build_list_modes(self):
+        data = [{"num": x, "name": f"n{x}"} for x in range(20)]
+        connection = sqlite3.connect(":memory:")
+        connection.execute("create table t (num, name)")
+        connection.executemany("insert into t values (:num, :name)", data)
+
+        queries = [
+            {"num": {"$in": [1, 3, 5, 7, 11, 99]}},
+            {"num": {"$nin": [0, 2, 4, 6, 8]}, "name": {"$in": ["n1", "n2", "n3"]}},
+            {"num": {"$in": [4]}},
+        ]
+        for mode in LIST_MODES:
+            for query in queries:
+                matchers = list(deserialize(query))
+                ctx = BuilderContext(list_mode=mode, list_threshold=2)
+                (where, params) = build(matchers, builder_ctx=ctx)
+                load_temp_tables(connection, ctx)
+                rows = connection.execute(
+                    f"select num, name from t where {where} order by num", params
+                ).fetchall()
+                expected = [x for x in data if match(x, matchers)]
+                self.assertEqual(
+                    expected, [{"num": x, "name": y} for x, y in rows], (mode, where)
+                )
+
+        (where, params) = build(
+            deserialize({"num": {"$in": list(range(1000))}}), list_mode="json"
+        )
+        self.assertEqual("num in (select value from json_each(:num0))", where)
+        self.assertEqual({"num0": json.dumps(list(range(1000)))}, params)
+
+        with self.assertRaises(ValueError):
+            BuilderContext(list_mode="bogus")
+
+    def test_sql_cache(self):
+        cache = SqlCache(max_size=2)
+        queries = [
+            {"tenant": "a", "ts": {"$gt": 10}},
+            {"tenant": "b", "ts": {"$gt": 20}},
+            {"tenant": 1, "ts": {"$gt": 20}},
+            {"tenant": "c", "ts": {"$in": [1, 2]}, "x": {"$exists": True}},
+            {"tenant": "c", "ts": {"$in": [3, 4]}, "x": {"$exists": False}},
+            {"tenant": "c", "ts": {"$in": [5, 6, 7]}, "x": {"$exists": False}},
+        ]
+        for query in queries:
+            self.assertEqual(build(deserialize(query)), cache.build(query))
+        self.assertEqual((1, 5, 3), (cache.hits, cache.misses, cache.evictions))
+
+        # json bound lists of any length share a shape.
+        cache = SqlCache(list_mode="json", list_threshold=2)
+        for size in [3, 10, 100]:
+            query = {"num": {"$in": list(range(size))}}
+            expected = build(deserialize(query), list_mode="json", list_threshold=2)
+            self.assertEqual(expected, cache.build(query))
+        self.assertEqual((2, 1), (cache.hits, cache.misses))
+
+        # the sql on mysql depends on the length of strings, so does the shape.
+        cache = SqlCache(dialect=MYSQL)
+        for value in ["short", "x" * 300, "y"]:
+            query = {"doc.name": value}
+            self.assertEqual(
+                build(deserialize(query), dialect=MYSQL), cache.build(query)
+            )
+        self.assertEqual((1, 2), (cache.hits, cache.misses))
+
+        with self.assertRaises(ValueError):
+            cache.build({"num": {"$in": 3}})
+        with self.assertRaises(ValueError):
+            SqlCache(list_mode="temp_table")
+
+    def test_sqlite_executor(self):
+        data = [{"num": x, "name": f"n{x}"} for x in range(50)]
+        connection = sqlite3.connect(":memory:")
+        connection.execute("create table t (num, name)")
+        connection.executemany("insert into t values (:num, :name)", data)
+
+        queries = [
+            {"num": {"$lt": 3}},
+            {"name": "n5"},
+            {"num": {"$gt": 45}},
+            {"num": {"$in": [4, 5, 6, 70]}},
+            {"name": "n7"},
+        ]
+        for mode in LIST_MODES:
+            executor = SqliteExecutor(
+                connection, "t", ["num"], fetch_size=2, list_mode=mode, list_threshold=2
+            )
+            for query in queries:
+                expected = [(x["num"],) for x in data if match(x, deserialize(query))]
+                self.assertEqual(expected, list(executor.select(query)))
+
+            expected = [
+                (idx, (x["num"],))
+                for idx, query in enumerate(queries)
+                for x in data
+                if match(x, deserialize(query))
+            ]
+            actual = executor.select_many(queries, union_size=2)
+            self.assertEqual(sorted(expected), sorted(actual))
+
+        # selects still being fetched keep their temp tables.
+        executor = SqliteExecutor(
+            connection,
+            "t",
+            ["num"],
+            fetch_size=2,
+            list_mode="temp_table",
+            list_threshold=2,
+        )
+        first = executor.select({"num": {"$in": [1, 2, 3]}})
+        self.assertEqual((1,), next(first))
+        second = executor.select({"num": {"$in": [4, 5, 6]}})
+        self.assertEqual([(4,), (5,), (6,)], list(second))
+        self.assertEqual([(2,), (3,)], list(first))
+        list(executor.select({"num": {"$in": [7, 8, 9]}}))
+        temp = "select count(*) from temp.sqlite_master where type = 'table'"
+        self.assertEqual(0, connection.execute(temp).fetchone()[0])
+
+        executor = SqliteExecutor(connection, "t")
+        # n1 is already gone by the time its name is deleted.
+        self.assertEqual(
+            5, executor.delete_many(queries[:2] + queries[4:] + [{"name": "n1"}])
+        )
+        self.assertEqual(45, connection.execute("select count(*) from t").fetchone()[0])
+
+        with self.assertRaises(ValueError):
+            SqliteExecutor(connection, "t; drop table t")
+
+    def test_afilter(self):
+        records = [{"num": x % 10, "tag": f"t{x}"} for x in range(500)]
+        lines = [json.dumps(x).encode() + b"\n" for x in records[:100]]
+        query = {"num": {"$in": [2, 3]}}
+        expected = [x for x in records if match(x, deserialize(query))]
+
+        produced = 0
+
+        async def source(items, stall_at=None):
+            nonlocal produced
+            for idx, item in enumerate(items):
+                produced += 1
+                if idx == stall_at:
+                    await asyncio.sleep(0.2)
+                elif idx % 50 == 0:
+                    await asyncio.sleep(0)
+                yield item
+
+        async def collect(iterator):
+            return [x async for x in iterator]
+
+        async def run():
+            nonlocal produced
+            result = await collect(afilter(source(records), query, batch_size=7))
+            self.assertEqual(expected, result)
+            self.assertEqual(expected, await collect(afilter(records, query)))
+            result = await collect(afilter(source(lines), query, raw=True))
+            self.assertEqual(
+                [x for x in lines if b'"num": 2' in x or b'"num": 3' in x], result
+            )
+
+            with ThreadPoolExecutor(2) as executor:
+                result = afilter(
+                    source(records),
+                    query,
+                    batch_size=16,
+                    executor=executor,
+                    offload_size=10,
+                    concurrency=3,
+                )
+                self.assertEqual(expected, await collect(result))
+
+            # the partial batch is handed out while the source stalls.
+            produced = 0
+            result = afilter(source(records, stall_at=3), query, max_delay=0.01)
+            self.assertEqual(expected[0], await anext(result))
+            self.assertEqual(4, produced)
+            await result.aclose()
+
+            # the source is read no further than the queue allows.
+            produced = 0
+            result = afilter(source(records), {}, batch_size=10, queue_size=2)
+            await anext(result)
+            for _ in range(5):
+                await asyncio.sleep(0)
+            self.assertLessEqual(produced, 10 * 4)
+            await result.aclose()
+
+            async def failing():
+                yield {"num": 2}
+                raise OSError("connection reset")
+
+            with self.assertRaises(OSError):
+                await collect(afilter(failing(), query))
+
+        asyncio.run(run())
+
+    def test_async_executor(self):
+        class Cursor:
+            def __init__(self, cursor):
+                self.cursor = cursor
+
+            async def fetchmany(self, size):
+                return self.cursor.fetchmany(size)
+
+            async def close(self):
+                self.cursor.close()
+
+        class Connection:
+            def __init__(self, connection):
+                self.connection = connection
+
+            async def execute(self, sql, params):
+                return Cursor(self.connection.execute(sql, params))
+
+        data = [{"num": x, "name": f"n{x}"} for x in range(50)]
+        connection = sqlite3.connect(":memory:")
+        connection.execute("create table t (num, name)")
+        connection.executemany("insert into t values (:num, :name)", data)
+
+        async def run():
+            executor = AsyncExecutor(Connection(connection), "t", ["num"], fetch_size=3)
+            for query in [{"num": {"$lt": 7}}, {"name": {"$in": ["n5", "n9"]}}]:
+                expected = [(x["num"],) for x in data if match(x, deserialize(query))]
+                self.assertEqual(expected, [x async for x in executor.select(query)])
+                self.assertEqual(
+                    expected, [x async for x in executor.select(deserialize(query))]
+                )
+                self.assertEqual(len(expected), await executor.count(query))
+            self.assertEqual(2, executor.cache.hits)
+
+        asyncio.run(run())
+        with self.assertRaises(ValueError):
+            AsyncExecutor(connection, "t", list_mode="temp_table")
+
+    def test_dialects(self):
+        matchers = list(
+            deserialize({"doc.a": "x", "doc.b.c": {"$gte": 3}, "n": {"$in": [1, 2]}})
+        )
+
+        (query, params) = build(matchers, dialect=POSTGRES)
+        self.assertEqual(
+            "(doc @> %(doca0)s::jsonb)"
+            " and ((case jsonb_typeof(doc #> '{b,c}') when 'number'"
+            " then (doc #>> '{b,c}')::numeric end) >= %(docbc0)s)"
+            " and (n in (%(n0)s, %(n1)s))",
+            query,
+        )
+        self.assertEqual({"doca0": '{"a": "x"}', "docbc0": 3, "n0": 1, "n1": 2}, params)
+        self.assertEqual(
+            [
+                "create index if not exists ix_t_doc_gin on t"
+                " using gin (doc jsonb_path_ops)",
+                "create index if not exists ix_t_doc_b_c_number on t"
+                " (((case jsonb_typeof(doc #> '{b,c}') when 'number'"
+                " then (doc #>> '{b,c}')::numeric end)))",
+                "create index if not exists ix_t_n on t (n)",
+            ],
+            index_ddl("t", [matchers], POSTGRES),
+        )
+
+        (query, _) = build(matchers, dialect=MYSQL)
+        self.assertEqual(
+            "(cast(doc->>'$.a' as char(255)) collate utf8mb4_bin = %(doca0)s)"
+            " and (cast(doc->>'$.b.c' as double) >= %(docbc0)s)"
+            " and (n in (%(n0)s, %(n1)s))",
+            query,
+        )
+
+        # booleans compare as json, strings as long as the index only whole.
+        (query, _) = build(
+            deserialize({"doc.f": True, "doc.a": "x" * 255}), dialect=MYSQL
+        )
+        self.assertEqual(
+            "((case json_type(doc->'$.f') when 'BOOLEAN'"
+            " then doc->'$.f' = cast('true' as json) end) = %(docf0)s)"
+            " and (cast(doc->>'$.a' as char) collate utf8mb4_bin = %(doca0)s)",
+            query,
+        )
+
+        # sqlite picks up the expression index for a json path.
+        connection = sqlite3.connect(":memory:")
+        connection.execute("create table t (doc, n)")
+        for statement in index_ddl("t", [matchers]):
+            connection.execute(statement)
+        (query, params) = build(matchers[1:2])
+        plan = connection.execute(
+            f"explain query plan select * from t where {query}", params
+        ).fetchall()
+        self.assertIn("ix_t_doc_b_c", plan[0][-1])
+
+        with self.assertRaises(ValueError):
+            build(
+                deserialize({"n": {"$in": [1, 2, 3]}}),
+                list_mode="json",
+                list_threshold=1,
+                dialect=POSTGRES,
+            )
+
+        # a dialect missing an override fails when created, not while building.
+        class Partial(Dialect):
+            def json_ref(self, column, path, value_kind):
+                return column
+
+        with self.assertRaises(TypeError):
+            Partial()
+
+    def test_profiler(self):
+        matchers = [
+            *deserialize({"$or": [{"a": {"$gt": 5}}, {"b.c": "x"}]}),
+            *deserialize({"d": {"$ne": 1}}),
+        ]
+        data = [
+            {"a": x, "b": {"c": "x" if x % 3 == 0 else "y"}, "d": x % 4}
+            for x in range(10)
+        ]
+
+        profiler = Profiler(matchers)
+        self.assertEqual(
+            [match(x, matchers) for x in data], [profiler(x) for x in data]
+        )
+        root = profiler.profile()
+        (either, d) = root.children
+        (a, bc) = either.children
+        self.assertEqual((10, 4, 6, 0), (a.evals, a.trues, a.falses, a.skips))
+        # only evaluated when a is not > 5.
+        self.assertEqual((6, 2, 4), (bc.evals, bc.trues, bc.skips))
+        self.assertEqual((6, 4), (d.evals, d.skips))
+        self.assertEqual(10, profiler.attributes()["query.0.0.0.evals"])
+        self.assertIn("b.c: evals=6 true=2 false=4", profiler.report())
+
+        profiler.reset()
+        self.assertEqual(0, profiler.profile().evals)
+
+        explanation = explain({"a": 7, "d": 1}, matchers)
+        self.assertFalse(explanation.result)
+        self.assertEqual(1, explanation.decided_by)
+        self.assertEqual(0, explanation.children[0].decided_by)
+        self.assertIsNone(explanation.children[0].children[1].result)
+        self.assertEqual(7, explanation.children[0].children[0].value)
+
+        explanation = explain({"a": None, "d": 1}, matchers)
+        self.assertIsNone(explanation.result)
+        self.assertIn("TypeError", explanation.children[0].children[0].error)
+
+    def test_deep_and_wide(self):
+        # deeper than the interpreter's recursion limit.
+        query = {"$gt": 1}
+        for _ in range(3000):
+            query = {"$not": query}
+        matchers = list(deserialize({"num": query}, 5000))
+        (sql, params) = build(matchers, 5000)
+        self.assertEqual("not (" * 3000 + "num > :num0" + ")" * 3000, sql)
+        self.assertEqual({"num0": 1}, params)
+        with self.assertRaises(ValueError):
+            list(deserialize({"num": query}))
+        with self.assertRaises(ValueError):
+            build(matchers, 1024)
+
+        query = {"$or": [{f"f{x}": x} for x in range(10_000)]}
+        (sql, params) = build(deserialize(query))
+        self.assertEqual(10_000, len(params))
+        self.assertTrue(sql.startswith("((f0 = :f00) or (f1 = :f10) or"))
+
+        self.assertEqual(
+            [MatchKeyValue("a", CmpEqual(None))], list(deserialize({"a": None}))
+        )
+        for query in [{"$and": [5]}, {"$or": [{"a": 1, "b": 2}]}, {"a": {}}]:
+            with self.assertRaises(ValueError):
+                list(deserialize(query))
+
+    def test_frozen_operators(self):
+        query = {"a": {"$in": [1, [2]], "$exists": True}, "$nor": [{"b.c": 3}]}
+        matchers = list(deserialize({"a": query["a"]})) + list(
+            deserialize({"$nor": query["$nor"]})
+        )
+        stack = list(matchers)
+        while stack:
+            operator = stack.pop()
+            self.assertFalse(hasattr(operator, "__dict__"), operator)
+            if isinstance(operator.value, Operator):
+                stack.append(operator.value)
+            elif isinstance(operator, (LogicalAnd, LogicalOr)):
+                stack.extend(operator.value)
+        with self.assertRaises(dataclasses.FrozenInstanceError):
+            matchers[0].key = "b"
+        # unhashable whatever they hold, as before they were frozen.
+        for operator in [CmpEqual(1), CmpIn([1]), matchers[0]]:
+            with self.assertRaises(TypeError):
+                hash(operator)
+
+        copied = pickle.loads(pickle.dumps(matchers))
+        self.assertEqual(matchers, copied)
+        self.assertNotEqual(matchers[1], next(deserialize({"$nor": [{"b.c": 4}]})))
+        for item in [{"a": 1}, {"a": [2]}, {"a": 2}, {"a": 1, "b": {"c": 3}}]:
+            self.assertEqual(match(item, matchers), match(item, copied))